@@ -1,4 +1,5 @@
 import zlib
+from io import BytesIO
 
 from sentry.utils import metrics
 from sentry.utils.json import prune_empty_keys
@@ -10,6 +11,10 @@ ATTACHMENT_DATA_CHUNK_KEY = "{key}:a:{id}:{chunk_index}"
 
 UNINITIALIZED_DATA = object()
 
+#: Number of attachment chunks fetched from the cache in one round trip when
+#: streaming an attachment.
+CHUNK_FETCH_BATCH_SIZE = 8
+
 
 class MissingAttachmentChunks(Exception):
     pass
@@ -64,6 +69,19 @@ class CachedAttachment:
         assert self._data is not UNINITIALIZED_DATA
         return self._data
 
+    def open(self):
+        """
+        Returns a file-like object to read the attachment data from. Unless
+        the data has been loaded already, it is streamed from the cache chunk
+        by chunk rather than loaded into memory at once.
+
+        Raises ``MissingAttachmentChunks`` while reading if a chunk is missing.
+        """
+        if self._data is UNINITIALIZED_DATA and self._cache is not None:
+            return self._cache.open(self)
+
+        return BytesIO(self.data)
+
     def delete(self):
         for key in self.chunk_keys:
             self._cache.inner.delete(key)
@@ -96,6 +114,66 @@ class CachedAttachment:
         )
 
 
+class ChunkedAttachmentFile:
+    """
+    A read-only file-like object over an iterator of data chunks. Chunks are
+    only pulled from the iterator as they are read, and reads that line up
+    with chunk boundaries return the chunks without copying them.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = b""
+        self._offset = 0
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._chunk = chunk
+                self._offset = 0
+                return True
+        self._chunk = b""
+        self._offset = 0
+        return False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._chunk[self._offset :]]
+            parts.extend(self._chunks)
+            self._chunk = b""
+            self._offset = 0
+            return b"".join(parts)
+
+        parts = []
+        while size > 0:
+            if self._offset >= len(self._chunk) and not self._next_chunk():
+                break
+
+            if self._offset == 0 and len(self._chunk) <= size:
+                part = self._chunk
+            else:
+                part = memoryview(self._chunk)[self._offset : self._offset + size]
+
+            parts.append(part)
+            self._offset += len(part)
+            size -= len(part)
+
+        if len(parts) == 1 and isinstance(parts[0], bytes):
+            return parts[0]
+        return b"".join(parts)
+
+    def close(self):
+        self._chunks = iter(())
+        self._chunk = b""
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 class BaseAttachmentCache:
     def __init__(self, inner):
         self.inner = inner
@@ -152,16 +230,23 @@ class BaseAttachmentCache:
             attachment.setdefault("key", key)
             yield CachedAttachment(cache=self, **attachment)
 
-    def get_data(self, attachment):
-        data = []
+    def get_chunks(self, attachment):
+        """
+        Yields the decompressed chunks of an attachment. The chunks are
+        fetched from the cache a batch at a time.
+        """
+        keys = list(attachment.chunk_keys)
+        for i in range(0, len(keys), CHUNK_FETCH_BATCH_SIZE):
+            for raw_data in self.inner.get_many(keys[i : i + CHUNK_FETCH_BATCH_SIZE], raw=True):
+                if raw_data is None:
+                    raise MissingAttachmentChunks()
+                yield zlib.decompress(raw_data)
 
-        for key in attachment.chunk_keys:
-            raw_data = self.inner.get(key, raw=True)
-            if raw_data is None:
-                raise MissingAttachmentChunks()
-            data.append(zlib.decompress(raw_data))
+    def get_data(self, attachment):
+        return b"".join(self.get_chunks(attachment))
 
-        return b"".join(data)
+    def open(self, attachment):
+        return ChunkedAttachmentFile(self.get_chunks(attachment))
 
     def delete(self, key):
         for attachment in self.get(key):
@@ -1,6 +1,10 @@
 import logging
+from collections import defaultdict
 
-from django.db.models import F
+from django.db import router
+from django.db.models import Case, F, Value, When
+
+from sentry.utils import metrics
 
 from sentry.signals import buffer_incr_complete
 from sentry.tasks.process_buffer import process_incr
@@ -52,28 +56,116 @@ class Buffer(Service, metaclass=BufferMount):
         return []
 
     def process(self, model, columns, filters, extra=None, signal_only=None):
-        from sentry.models import Group
-        from sentry.event_manager import ScoreClause
-
         created = False
 
         if not signal_only:
-            update_kwargs = {c: F(c) + v for c, v in columns.items()}
+            update_kwargs = self._get_update_kwargs(model, columns, extra)
+            _, created = model.objects.create_or_update(values=update_kwargs, **filters)
 
-            if extra:
-                update_kwargs.update(extra)
+        self._send_incr_complete(model, columns, filters, extra, created)
 
-            # HACK(dcramer): this is gross, but we dont have a good hook to compute this property today
-            # XXX(dcramer): remove once we can replace 'priority' with something reasonable via Snuba
-            if model is Group and "last_seen" in update_kwargs and "times_seen" in update_kwargs:
-                update_kwargs["score"] = ScoreClause(
-                    group=None,
-                    times_seen=update_kwargs["times_seen"],
-                    last_seen=update_kwargs["last_seen"],
-                )
+    def process_batch(self, items):
+        """
+        Processes many buffered increments at once.
 
-            _, created = model.objects.create_or_update(values=update_kwargs, **filters)
+        ``items`` is an iterable of ``(model, columns, filters, extra,
+        signal_only)`` tuples, as they would be passed to ``process``.
+        Increments which target a single row by primary key and share the
+        same set of columns are coalesced per model and written with one
+        multi-row UPDATE. Everything else falls back to ``process``.
+        """
+        batches = defaultdict(dict)
+        for model, columns, filters, extra, signal_only in items:
+            pk = self._get_batch_pk(filters)
+            if signal_only or pk is None:
+                self.process(model, columns, filters, extra, signal_only)
+                continue
+
+            shape = (model, frozenset(columns), frozenset(extra or ()))
+            rows = batches[shape]
+            if pk in rows:
+                # the same row was buffered twice, sum up the counters and
+                # let the last write win for everything else
+                prev_columns = rows[pk][0]
+                columns = {c: prev_columns[c] + v for c, v in columns.items()}
+            rows[pk] = (columns, filters, extra)
+
+        for (model, _, _), rows in batches.items():
+            if len(rows) == 1:
+                ((columns, filters, extra),) = rows.values()
+                self.process(model, columns, filters, extra)
+            else:
+                self._process_bulk_update(model, rows)
+
+    def _get_batch_pk(self, filters):
+        if len(filters) != 1:
+            return None
+        ((key, value),) = filters.items()
+        if key not in ("id", "pk"):
+            return None
+        return value
+
+    def _get_update_kwargs(self, model, columns, extra):
+        from sentry.models import Group
+        from sentry.event_manager import ScoreClause
+
+        update_kwargs = {c: F(c) + v for c, v in columns.items()}
+
+        if extra:
+            update_kwargs.update(extra)
 
+        # HACK(dcramer): this is gross, but we dont have a good hook to compute this property today
+        # XXX(dcramer): remove once we can replace 'priority' with something reasonable via Snuba
+        if model is Group and "last_seen" in update_kwargs and "times_seen" in update_kwargs:
+            update_kwargs["score"] = ScoreClause(
+                group=None,
+                times_seen=update_kwargs["times_seen"],
+                last_seen=update_kwargs["last_seen"],
+            )
+
+        return update_kwargs
+
+    def _process_bulk_update(self, model, rows):
+        """
+        Applies the increments in ``rows`` (a mapping of primary key to
+        ``(columns, filters, extra)``) with a single UPDATE statement.
+        """
+        row_kwargs = {
+            pk: self._get_update_kwargs(model, columns, extra)
+            for pk, (columns, filters, extra) in rows.items()
+        }
+
+        update_kwargs = {}
+        for column in next(iter(row_kwargs.values())):
+            field = model._meta.get_field(column)
+            whens = []
+            for pk, kwargs in row_kwargs.items():
+                value = kwargs[column]
+                if not hasattr(value, "resolve_expression"):
+                    value = Value(value, output_field=field)
+                whens.append(When(pk=pk, then=value))
+            update_kwargs[column] = Case(*whens, default=F(column), output_field=field)
+
+        objects = model.objects.using(router.db_for_write(model))
+        affected = objects.filter(pk__in=list(rows)).update(**update_kwargs)
+
+        metrics.timing("buffer.bulk-update-size", len(rows), tags={"model": model.__name__})
+
+        missing = set()
+        if affected < len(rows):
+            missing = set(rows) - set(
+                objects.filter(pk__in=list(rows)).values_list("pk", flat=True)
+            )
+
+        for pk, (columns, filters, extra) in rows.items():
+            if pk in missing:
+                # the row does not exist (yet), go through the regular path
+                # so that we retain ``create_or_update`` semantics
+                self.process(model, columns, filters, extra)
+            else:
+                self._send_incr_complete(model, columns, filters, extra, False)
+
+    def _send_incr_complete(self, model, columns, filters, extra, created):
         buffer_incr_complete.send_robust(
             model=model,
             columns=columns,
@@ -1,23 +1,48 @@
+import atexit
+import logging
+import os
 import pickle
 import threading
+from collections import defaultdict
 from time import time
 
 from datetime import datetime
 from django.db import models
 from django.utils import timezone
 from django.utils.encoding import force_bytes, force_text
+from celery.signals import worker_process_shutdown
 
 from sentry.buffer import Buffer
 from sentry.exceptions import InvalidConfiguration
 from sentry.tasks.process_buffer import process_incr, process_pending
 from sentry.utils import json, metrics
 from sentry.utils.compat import crc32
+from sentry.utils.dates import to_timestamp
 from sentry.utils.hashlib import md5_text
 from sentry.utils.imports import import_string
 from sentry.utils.redis import get_cluster_from_options
 
-_local_buffers = None
-_local_buffers_lock = threading.Lock()
+# Formats used to serialize filters and extra values into the buffer hashes.
+# Readers always understand both formats, so switching the writer over only
+# requires that all buffer workers have been deployed with this version first.
+WIRE_FORMAT_PICKLE = "pickle"
+WIRE_FORMAT_JSON = "json"
+WIRE_FORMATS = (WIRE_FORMAT_PICKLE, WIRE_FORMAT_JSON)
+
+# Values in the JSON format are prefixed with ``v<version>:``, which no pickle
+# starts with. Readers reject versions they do not know, so the format can be
+# changed by bumping the version once all readers understand the new one.
+JSON_WIRE_FORMAT_VERSION = 1
+
+
+def _is_json_safe(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return True
+    if isinstance(value, list):
+        return all(_is_json_safe(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_safe(v) for k, v in value.items())
+    return False
 
 
 class PendingBuffer:
@@ -47,16 +72,193 @@ class PendingBuffer:
         return rv
 
 
+class LocalFlushError(Exception):
+    """
+    Raised by the flush function of a ``LocalIncrBuffer`` when only some of
+    the increments could be written. ``items`` are the ones that were not.
+    """
+
+    def __init__(self, items):
+        super().__init__(f"{len(items)} increments were not written")
+        self.items = items
+
+
+class LocalIncrBuffer:
+    """
+    Coalesces buffer increments in-process before they are written to Redis.
+
+    Counters for the same key are summed up, extra values follow last write
+    wins semantics and ``signal_only`` sticks once set, which mirrors what
+    the Redis hash would contain after applying every increment on its own.
+    Pending increments are handed to ``flush`` from a background thread every
+    ``interval`` seconds, as soon as ``max_keys`` distinct keys are pending,
+    and on ``close``, which runs at interpreter and worker process shutdown.
+    Increments of a failed flush are kept and written with the next one. If
+    the flush function raises ``LocalFlushError``, only its increments are
+    kept, as the others have been written already.
+    """
+
+    def __init__(self, flush, interval, max_keys):
+        assert interval > 0
+        assert max_keys > 0
+        self.flush_func = flush
+        self.interval = interval
+        self.max_keys = max_keys
+        self.logger = logging.getLogger("sentry.buffer.local")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        atexit.register(self.close)
+        # Forked worker processes exit with ``os._exit``, which skips atexit.
+        worker_process_shutdown.connect(self._on_worker_shutdown, weak=False)
+
+    def incr(self, key, model, columns, filters, extra=None, signal_only=None):
+        self._ensure_thread()
+
+        with self._lock:
+            self._merge(key, model, columns, filters, extra or {}, signal_only)
+            full = len(self._pending) >= self.max_keys
+
+        if full:
+            self._wakeup.set()
+
+    def _merge(self, key, model, columns, filters, extra, signal_only, older=False):
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = [model, dict(columns), filters, dict(extra), signal_only]
+            return
+
+        pending_columns = entry[1]
+        for column, amount in columns.items():
+            pending_columns[column] = pending_columns.get(column, 0) + amount
+        if older:
+            entry[3] = {**extra, **entry[3]}
+        elif extra:
+            entry[3].update(extra)
+        if signal_only is True:
+            entry[4] = True
+
+    def flush(self):
+        with self._lock:
+            # Increments inherited from the parent of a forked process are
+            # flushed by the parent.
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return
+
+        items = [
+            (key, model, columns, filters, extra or None, signal_only)
+            for key, (model, columns, filters, extra, signal_only) in pending.items()
+        ]
+        try:
+            self.flush_func(items)
+        except Exception as e:
+            if isinstance(e, LocalFlushError):
+                items = e.items
+            # Put the increments back in front of the ones recorded since.
+            with self._lock:
+                for key, model, columns, filters, extra, signal_only in items:
+                    self._merge(key, model, columns, filters, extra or {}, signal_only, older=True)
+            raise
+
+    def close(self):
+        """
+        Stops the background thread and flushes the pending increments.
+        """
+        atexit.unregister(self.close)
+        worker_process_shutdown.disconnect(self._on_worker_shutdown)
+
+        self._closed.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join()
+        self.flush()
+
+    def _on_worker_shutdown(self, **kwargs):
+        try:
+            self.close()
+        except Exception:
+            metrics.incr("buffer.local-flush-failed", skip_internal=False)
+            self.logger.exception("buffer.local-flush-failed")
+
+    def _ensure_thread(self):
+        # Worker processes are usually forked after the buffer has been
+        # configured, in which case the flusher needs to be restarted.
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pending = {}
+            self._pid = pid
+            if self._closed.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name="sentry.buffer.local")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._closed.is_set():
+                # ``close`` flushes once the thread has stopped
+                return
+            try:
+                self.flush()
+            except Exception:
+                metrics.incr("buffer.local-flush-failed", skip_internal=False)
+                self.logger.exception("buffer.local-flush-failed")
+                # Back off instead of retrying as soon as the buffer is full.
+                self._closed.wait(self.interval)
+
+
 class RedisBuffer(Buffer):
     key_expire = 60 * 60  # 1 hour
     pending_key = "b:p"
 
-    def __init__(self, pending_partitions=1, incr_batch_size=2, **options):
+    def __init__(
+        self,
+        pending_partitions=1,
+        incr_batch_size=2,
+        incr_batch_flush=False,
+        wire_format=WIRE_FORMAT_PICKLE,
+        local_flush_interval=None,
+        local_max_keys=1000,
+        pending_chunk_size=None,
+        **options,
+    ):
         self.cluster, options = get_cluster_from_options("SENTRY_BUFFER_OPTIONS", options)
         self.pending_partitions = pending_partitions
         self.incr_batch_size = incr_batch_size
+        # When enabled, ``process`` drains a whole batch of keys with one
+        # pipeline per Redis host and applies the increments in bulk.
+        self.incr_batch_flush = incr_batch_flush
+        self.wire_format = wire_format
         assert self.pending_partitions > 0
         assert self.incr_batch_size > 0
+        assert self.wire_format in WIRE_FORMATS
+        # When set, ``process_pending`` drains the pending sets in chunks of
+        # this many keys instead of reading them whole.
+        self.pending_chunk_size = pending_chunk_size
+        assert self.pending_chunk_size is None or self.pending_chunk_size > 0
+
+        # Optionally coalesce increments in-process before they hit Redis.
+        if local_flush_interval:
+            self.local_buffer = LocalIncrBuffer(
+                self._flush_local_incrs, interval=local_flush_interval, max_keys=local_max_keys
+            )
+        else:
+            self.local_buffer = None
 
     def validate(self):
         try:
@@ -110,15 +312,31 @@ class RedisBuffer(Buffer):
         return result
 
     def _dump_value(self, value):
-        if isinstance(value, str):
+        from sentry.event_manager import ScoreClause
+
+        if value is None:
+            type_ = "n"
+            value = ""
+        elif isinstance(value, str):
             type_ = "s"
         elif isinstance(value, datetime):
             type_ = "d"
-            value = value.strftime("%s.%f")
+            value = "%.6f" % to_timestamp(value)
+        elif isinstance(value, bool):
+            type_ = "b"
+            value = int(value)
         elif isinstance(value, int):
             type_ = "i"
         elif isinstance(value, float):
             type_ = "f"
+        elif isinstance(value, (dict, list)) and _is_json_safe(value):
+            # containers are embedded as-is rather than stringified
+            return ("j", value)
+        elif isinstance(value, ScoreClause):
+            # the score is always recomputed from ``last_seen`` and
+            # ``times_seen`` when the buffer is processed
+            type_ = "sc"
+            value = ""
         else:
             raise TypeError(type(value))
         return (type_, str(value))
@@ -130,18 +348,64 @@ class RedisBuffer(Buffer):
         return result
 
     def _load_value(self, payload):
+        from sentry.event_manager import ScoreClause
+
         (type_, value) = payload
         if type_ == "s":
             return force_text(value)
         elif type_ == "d":
-            return datetime.fromtimestamp(float(value)).replace(tzinfo=timezone.utc)
+            return datetime.utcfromtimestamp(float(value)).replace(tzinfo=timezone.utc)
         elif type_ == "i":
             return int(value)
         elif type_ == "f":
             return float(value)
+        elif type_ == "b":
+            return bool(int(value))
+        elif type_ == "n":
+            return None
+        elif type_ == "j":
+            return value
+        elif type_ == "sc":
+            return ScoreClause()
         else:
             raise TypeError(f"invalid type: {type_}")
 
+    def _dump_json(self, payload):
+        return b"v%d:%s" % (JSON_WIRE_FORMAT_VERSION, json.dumps(payload).encode("utf-8"))
+
+    def _load_json(self, value, legacy_prefix):
+        """
+        Returns the payload of a value in the JSON format, or ``None`` if the
+        value is pickled.
+        """
+        if value.startswith(b"v"):
+            version, _, value = value[1:].partition(b":")
+            if version != b"%d" % JSON_WIRE_FORMAT_VERSION:
+                raise ValueError(f"unsupported buffer wire format version: {version!r}")
+            return json.loads(value.decode("utf-8"))
+        if value.startswith(legacy_prefix):
+            # JSON written before the format was versioned
+            return json.loads(value.decode("utf-8"))
+        return None
+
+    def _dump_filters(self, filters):
+        if self.wire_format == WIRE_FORMAT_JSON:
+            try:
+                return self._dump_json(self._dump_values(filters))
+            except TypeError:
+                metrics.incr(
+                    "buffer.pickle-fallback", tags={"field": "filters"}, skip_internal=True
+                )
+        return pickle.dumps(filters)
+
+    def _dump_extra_value(self, value):
+        if self.wire_format == WIRE_FORMAT_JSON:
+            try:
+                return self._dump_json(self._dump_value(value))
+            except TypeError:
+                metrics.incr("buffer.pickle-fallback", tags={"field": "extra"}, skip_internal=True)
+        return pickle.dumps(value)
+
     def incr(self, model, columns, filters, extra=None, signal_only=None):
         """
         Increment the key by doing the following:
@@ -151,22 +415,35 @@ class RedisBuffer(Buffer):
             - Perform a set (last write wins) on extra
             - Perform a set on signal_only (only if True)
         - Add hashmap key to pending flushes
+
+        If local coalescing is enabled the increment is only recorded
+        in-process and written to Redis by the next flush of the
+        ``LocalIncrBuffer``.
         """
 
-        # TODO(dcramer): longer term we'd rather not have to serialize values
-        # here (unless it's to JSON)
         key = self._make_key(model, filters)
+
+        if self.local_buffer is not None:
+            self.local_buffer.incr(key, model, columns, filters, extra, signal_only)
+        else:
+            # We can't use conn.map() due to wanting to support multiple pending
+            # keys (one per Redis partition)
+            conn = self.cluster.get_local_client_for_key(key)
+            pipe = conn.pipeline()
+            self._incr_pipeline(pipe, key, model, columns, filters, extra, signal_only)
+            pipe.execute()
+
+        metrics.incr(
+            "buffer.incr",
+            skip_internal=True,
+            tags={"module": model.__module__, "model": model.__name__},
+        )
+
+    def _incr_pipeline(self, pipe, key, model, columns, filters, extra, signal_only):
         pending_key = self._make_pending_key_from_key(key)
-        # We can't use conn.map() due to wanting to support multiple pending
-        # keys (one per Redis partition)
-        conn = self.cluster.get_local_client_for_key(key)
 
-        pipe = conn.pipeline()
         pipe.hsetnx(key, "m", f"{model.__module__}.{model.__name__}")
-        # TODO(dcramer): once this goes live in production, we can kill the pickle path
-        # (this is to ensure a zero downtime deploy where we can transition event processing)
-        pipe.hsetnx(key, "f", pickle.dumps(filters))
-        # pipe.hsetnx(key, 'f', json.dumps(self._dump_values(filters)))
+        pipe.hsetnx(key, "f", self._dump_filters(filters))
         for column, amount in columns.items():
             pipe.hincrby(key, "i+" + column, amount)
 
@@ -175,23 +452,42 @@ class RedisBuffer(Buffer):
             # hook here
             # e.g. "update score if last_seen or times_seen is changed"
             for column, value in extra.items():
-                # TODO(dcramer): once this goes live in production, we can kill the pickle path
-                # (this is to ensure a zero downtime deploy where we can transition event processing)
-                pipe.hset(key, "e+" + column, pickle.dumps(value))
-                # pipe.hset(key, 'e+' + column, json.dumps(self._dump_value(value)))
+                pipe.hset(key, "e+" + column, self._dump_extra_value(value))
 
         if signal_only is True:
             pipe.hset(key, "s", "1")
 
         pipe.expire(key, self.key_expire)
         pipe.zadd(pending_key, {key: time()})
-        pipe.execute()
 
-        metrics.incr(
-            "buffer.incr",
-            skip_internal=True,
-            tags={"module": model.__module__, "model": model.__name__},
-        )
+    def _flush_local_incrs(self, items):
+        """
+        Writes increments coalesced by the ``LocalIncrBuffer`` to Redis,
+        using a single pipeline per host. If the pipelines of some hosts fail,
+        the others are still written and ``LocalFlushError`` is raised with
+        the increments of the failed hosts.
+        """
+        router = self.cluster.get_router()
+        items_by_host = defaultdict(list)
+        for item in items:
+            items_by_host[router.get_host_for_key(item[0])].append(item)
+
+        failed = []
+        error = None
+        for host_id, host_items in items_by_host.items():
+            try:
+                pipe = self.cluster.get_local_client(host_id).pipeline()
+                for key, model, columns, filters, extra, signal_only in host_items:
+                    self._incr_pipeline(pipe, key, model, columns, filters, extra, signal_only)
+                pipe.execute()
+            except Exception as e:
+                failed.extend(host_items)
+                error = e
+
+        metrics.timing("buffer.local-flush-size", len(items) - len(failed))
+
+        if failed:
+            raise LocalFlushError(failed) from error
 
     def process_pending(self, partition=None):
         if partition is None and self.pending_partitions > 1:
@@ -204,12 +500,20 @@ class RedisBuffer(Buffer):
             # super fast and is fine to do redundantly.
 
         pending_key = self._make_pending_key(partition)
+
         client = self.cluster.get_routing_client()
         lock_key = self._make_lock_key(pending_key)
         # prevent a stampede due to celerybeat + periodic task
         if not client.set(lock_key, "1", nx=True, ex=60):
             return
 
+        if self.pending_chunk_size is not None:
+            try:
+                self._process_pending_chunked(pending_key)
+            finally:
+                client.delete(lock_key)
+            return
+
         pending_buffer = PendingBuffer(self.incr_batch_size)
 
         try:
@@ -236,6 +540,56 @@ class RedisBuffer(Buffer):
         finally:
             client.delete(lock_key)
 
+    def _process_pending_chunked(self, pending_key):
+        """
+        Drains the pending set ``pending_chunk_size`` keys at a time, so that
+        memory usage is bounded by the chunk size rather than by the size of
+        the backlog.
+
+        Only keys that were pending when the run started are drained. Keys
+        added while it runs have a later score and are left to the next run,
+        so a run ends even while new keys keep coming in.
+        """
+        pending_buffer = PendingBuffer(self.incr_batch_size)
+        keycount = 0
+        max_age = 0.0
+        start = time()
+
+        for host_id in self.cluster.hosts:
+            conn = self.cluster.get_local_client(host_id)
+            while True:
+                chunk = conn.zrangebyscore(
+                    pending_key,
+                    "-inf",
+                    start,
+                    start=0,
+                    num=self.pending_chunk_size,
+                    withscores=True,
+                )
+                if not chunk:
+                    break
+
+                conn.zrem(pending_key, *(key for key, _ in chunk))
+                keycount += len(chunk)
+                # members are returned in score order, so the first member of
+                # each chunk is the oldest one
+                max_age = max(max_age, start - chunk[0][1])
+
+                for key, _ in chunk:
+                    pending_buffer.append(key.decode("utf-8"))
+                    if pending_buffer.full():
+                        process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
+
+                if len(chunk) < self.pending_chunk_size:
+                    break
+
+        # queue up remainder of pending keys
+        if not pending_buffer.empty():
+            process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
+
+        metrics.timing("buffer.pending-size", keycount)
+        metrics.timing("buffer.pending-age", max_age)
+
     def process(self, key=None, batch_keys=None):
         assert not (key is None and batch_keys is None)
         assert not (key is not None and batch_keys is not None)
@@ -243,6 +597,10 @@ class RedisBuffer(Buffer):
         if key is not None:
             batch_keys = [key]
 
+        if self.incr_batch_flush and len(batch_keys) > 1:
+            self._process_batch_incr(batch_keys)
+            return
+
         for key in batch_keys:
             self._process_single_incr(key)
 
@@ -266,42 +624,97 @@ class RedisBuffer(Buffer):
             pipe.delete(key)
             values = pipe.execute()[0]
 
-            # XXX(python3): In python2 this isn't as important since redis will
-            # return string tyes (be it, byte strings), but in py3 we get bytes
-            # back, and really we just want to deal with keys as strings.
-            values = {force_text(k): v for k, v in values.items()}
-
-            if not values:
-                metrics.incr("buffer.revoked", tags={"reason": "empty"}, skip_internal=False)
-                self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
-                return
-
-            # XXX(py3): Note that ``import_string`` explicitly wants a str in
-            # python2, so we'll decode (for python3) and then translate back to
-            # a byte string (in python2) for import_string.
-            model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
+            payload = self._load_payload(key, values)
+            if payload is not None:
+                super().process(*payload)
+        finally:
+            client.delete(lock_key)
 
-            if values["f"].startswith(b"{"):
-                filters = self._load_values(json.loads(values.pop("f").decode("utf-8")))
+    def _process_batch_incr(self, keys):
+        # prevent a stampede due to the way we use celery etas + duplicate
+        # tasks, all locks are acquired in a single round trip per host
+        with self.cluster.map() as client:
+            locks = {key: client.set(self._make_lock_key(key), "1", nx=True, ex=10) for key in keys}
+
+        locked_keys = []
+        for key in keys:
+            if locks[key].value:
+                locked_keys.append(key)
             else:
-                # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                filters = pickle.loads(values.pop("f"))
-
-            incr_values = {}
-            extra_values = {}
-            signal_only = None
-            for k, v in values.items():
-                if k.startswith("i+"):
-                    incr_values[k[2:]] = int(v)
-                elif k.startswith("e+"):
-                    if v.startswith(b"["):
-                        extra_values[k[2:]] = self._load_value(json.loads(v.decode("utf-8")))
-                    else:
-                        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                        extra_values[k[2:]] = pickle.loads(v)
-                elif k == "s":
-                    signal_only = bool(int(v))  # Should be 1 if set
-
-            super().process(model, incr_values, filters, extra_values, signal_only)
+                metrics.incr("buffer.revoked", tags={"reason": "locked"}, skip_internal=False)
+                self.logger.debug("buffer.revoked.locked", extra={"redis_key": key})
+
+        try:
+            # The pending sets live next to the keys they reference, so each
+            # host can be drained with a single pipeline.
+            router = self.cluster.get_router()
+            keys_by_host = defaultdict(list)
+            for key in locked_keys:
+                keys_by_host[router.get_host_for_key(key)].append(key)
+
+            items = []
+            for host_id, host_keys in keys_by_host.items():
+                pipe = self.cluster.get_local_client(host_id).pipeline()
+                for key in host_keys:
+                    pipe.hgetall(key)
+                    pipe.zrem(self._make_pending_key_from_key(key), key)
+                    pipe.delete(key)
+                results = pipe.execute()
+
+                for key, values in zip(host_keys, results[::3]):
+                    payload = self._load_payload(key, values)
+                    if payload is not None:
+                        items.append(payload)
+
+            metrics.timing("buffer.batch-size", len(items))
+            super().process_batch(items)
         finally:
-            client.delete(lock_key)
+            with self.cluster.map() as client:
+                for key in locked_keys:
+                    client.delete(self._make_lock_key(key))
+
+    def _load_payload(self, key, values):
+        """
+        Decodes the hash stored at ``key`` into the arguments for
+        ``Buffer.process``. Returns ``None`` if the hash was empty.
+        """
+        # XXX(python3): In python2 this isn't as important since redis will
+        # return string tyes (be it, byte strings), but in py3 we get bytes
+        # back, and really we just want to deal with keys as strings.
+        values = {force_text(k): v for k, v in values.items()}
+
+        if not values:
+            metrics.incr("buffer.revoked", tags={"reason": "empty"}, skip_internal=False)
+            self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
+            return None
+
+        # XXX(py3): Note that ``import_string`` explicitly wants a str in
+        # python2, so we'll decode (for python3) and then translate back to
+        # a byte string (in python2) for import_string.
+        model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
+
+        filters = values.pop("f")
+        payload = self._load_json(filters, b"{")
+        if payload is not None:
+            filters = self._load_values(payload)
+        else:
+            # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+            filters = pickle.loads(filters)
+
+        incr_values = {}
+        extra_values = {}
+        signal_only = None
+        for k, v in values.items():
+            if k.startswith("i+"):
+                incr_values[k[2:]] = int(v)
+            elif k.startswith("e+"):
+                payload = self._load_json(v, b"[")
+                if payload is not None:
+                    extra_values[k[2:]] = self._load_value(payload)
+                else:
+                    # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+                    extra_values[k[2:]] = pickle.loads(v)
+            elif k == "s":
+                signal_only = bool(int(v))  # Should be 1 if set
+
+        return model, incr_values, filters, extra_values, signal_only
@@ -22,3 +22,18 @@ class BaseCache(local):
 
     def get(self, key, version=None, raw=False):
         raise NotImplementedError
+
+    def set_many(self, items, timeout, version=None, raw=False):
+        """
+        Sets the values of several keys. ``items`` is a sequence of
+        ``(key, value)`` pairs.
+        """
+        for key, value in items:
+            self.set(key, value, timeout, version=version, raw=raw)
+
+    def get_many(self, keys, version=None, raw=False):
+        """
+        Returns the values of several keys, in the order of ``keys``. Missing
+        values are returned as ``None``.
+        """
+        return [self.get(key, version=version, raw=raw) for key in keys]
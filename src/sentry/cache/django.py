@@ -12,3 +12,10 @@ class DjangoCache(BaseCache):
 
     def get(self, key, version=None, raw=False):
         return cache.get(key, version=version or self.version)
+
+    def set_many(self, items, timeout, version=None, raw=False):
+        cache.set_many(dict(items), timeout, version=version or self.version)
+
+    def get_many(self, keys, version=None, raw=False):
+        results = cache.get_many(keys, version=version or self.version)
+        return [results.get(key) for key in keys]
@@ -16,15 +16,38 @@ class CommonRedisCache(BaseCache):
         self.client = client
         BaseCache.__init__(self, **options)
 
-    def set(self, key, value, timeout, version=None, raw=False):
-        key = self.make_key(key, version=version)
+    def _encode(self, key, value, raw):
         v = json.dumps(value) if not raw else value
         if len(v) > self.max_size:
             raise ValueTooLarge(f"Cache key too large: {key!r} {len(v)!r}")
+        return v
+
+    def _set(self, client, key, v, timeout):
         if timeout:
-            self.client.setex(key, int(timeout), v)
+            client.setex(key, int(timeout), v)
         else:
-            self.client.set(key, v)
+            client.set(key, v)
+
+    def _decode(self, result, raw):
+        if result is not None and not raw:
+            result = json.loads(result)
+        return result
+
+    def set(self, key, value, timeout, version=None, raw=False):
+        key = self.make_key(key, version=version)
+        self._set(self.client, key, self._encode(key, value, raw), timeout)
+
+    def set_many(self, items, timeout, version=None, raw=False):
+        items = [(self.make_key(key, version=version), value) for key, value in items]
+        values = [(key, self._encode(key, value, raw)) for key, value in items]
+        if not values:
+            return
+
+        # The pipeline sends one batch of commands per node.
+        pipeline = self.client.pipeline(transaction=False)
+        for key, v in values:
+            self._set(pipeline, key, v, timeout)
+        pipeline.execute()
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -32,10 +55,16 @@ class CommonRedisCache(BaseCache):
 
     def get(self, key, version=None, raw=False):
         key = self.make_key(key, version=version)
-        result = self.client.get(key)
-        if result is not None and not raw:
-            result = json.loads(result)
-        return result
+        return self._decode(self.client.get(key), raw)
+
+    def get_many(self, keys, version=None, raw=False):
+        if not keys:
+            return []
+
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.get(self.make_key(key, version=version))
+        return [self._decode(result, raw) for result in pipeline.execute()]
 
 
 class RbCache(CommonRedisCache):
@@ -44,6 +73,27 @@ class RbCache(CommonRedisCache):
         client = cluster.get_routing_client()
         CommonRedisCache.__init__(self, client, **options)
 
+    # The routing client does not support pipelines, its map operation
+    # batches the commands per host instead.
+
+    def set_many(self, items, timeout, version=None, raw=False):
+        items = [(self.make_key(key, version=version), value) for key, value in items]
+        values = [(key, self._encode(key, value, raw)) for key, value in items]
+        if not values:
+            return
+
+        with self.client.map() as client:
+            for key, v in values:
+                self._set(client, key, v, timeout)
+
+    def get_many(self, keys, version=None, raw=False):
+        if not keys:
+            return []
+
+        with self.client.map() as client:
+            promises = [client.get(self.make_key(key, version=version)) for key in keys]
+        return [self._decode(promise.value, raw) for promise in promises]
+
 
 # Confusing legacy name for RbCache.  We don't actually have a pure redis cache
 RedisCache = RbCache
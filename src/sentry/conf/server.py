@@ -1240,6 +1240,11 @@ SENTRY_SEARCH_OPTIONS = {}
 SENTRY_TSDB = "sentry.tsdb.dummy.DummyTSDB"
 SENTRY_TSDB_OPTIONS = {}
 
+# Apply TSDB writes from the event save path asynchronously from a background
+# thread (see ``sentry.tsdb.writebehind``).
+SENTRY_TSDB_WRITE_BEHIND = False
+SENTRY_TSDB_WRITE_BEHIND_OPTIONS = {}
+
 SENTRY_NEWSLETTER = "sentry.newsletter.base.Newsletter"
 SENTRY_NEWSLETTER_OPTIONS = {}
 
@@ -2117,6 +2122,10 @@ SENTRY_MAIL_ADAPTER_BACKEND = "sentry.mail.adapter.MailAdapter"
 # observed mainly for producing stable metrics.
 SENTRY_SYNTHETIC_MONITORING_PROJECT_ID = None
 
+# The number of grouping component trees each process keeps around, keyed by
+# grouping config and the grouping-relevant event data. 0 disables the cache.
+SENTRY_GROUPING_COMPONENT_CACHE_SIZE = 0
+
 # Similarity cluster to use
 # Similarity-v1: uses hardcoded set of event properties for diffing
 SENTRY_SIMILARITY_INDEX_REDIS_CLUSTER = "default"
@@ -2140,6 +2149,10 @@ SENTRY_REPROCESSING_ATTACHMENT_CHUNK_SIZE = 2 ** 20
 
 SENTRY_REPROCESSING_SYNC_REDIS_CLUSTER = "default"
 
+# The Redis cluster that events are buffered in while their post-processing is
+# coalesced, see the ``post-process.coalesce-window`` option.
+SENTRY_POST_PROCESS_COALESCE_REDIS_CLUSTER = "default"
+
 # Implemented in getsentry to run additional devserver workers.
 SENTRY_EXTRA_WORKERS = None
 
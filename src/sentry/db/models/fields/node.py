@@ -137,11 +137,31 @@ class NodeData(collections.MutableMapping):
             currently only {"unprocessed": {...}} is added for reprocessing.
             See documentation of nodestore.
         """
+        to_write = self._get_subkeys_to_write(subkeys)
+        if to_write is not None:
+            nodestore.set_subkeys(self.id, to_write)
 
+    @staticmethod
+    def save_many(nodes):
+        """
+        Write the data of multiple nodes back to nodestore at once.
+
+        :param nodes: A list of ``(node_data, subkeys)`` tuples, see ``save``.
+        """
+        items = {}
+        for node_data, subkeys in nodes:
+            to_write = node_data._get_subkeys_to_write(subkeys)
+            if to_write is not None:
+                items[node_data.id] = to_write
+
+        if items:
+            nodestore.set_subkeys_multi(items)
+
+    def _get_subkeys_to_write(self, subkeys):
         # We never loaded any data for reading or writing, so there
         # is nothing to save.
         if self._node_data is None:
-            return
+            return None
 
         # We can't put our wrappers into the nodestore, so we need to
         # ensure that the data is converted into a plain old dict
@@ -151,8 +171,7 @@ class NodeData(collections.MutableMapping):
 
         subkeys = subkeys or {}
         subkeys[None] = to_write
-
-        nodestore.set_subkeys(self.id, subkeys)
+        return subkeys
 
 
 class NodeField(GzippedDictField):
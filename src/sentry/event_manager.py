@@ -1,5 +1,4 @@
 import logging
-from io import BytesIO
 import ipaddress
 
 from datetime import datetime, timedelta
@@ -19,6 +18,7 @@ from sentry.constants import (
     LOG_LEVELS_MAP,
     MAX_TAG_VALUE_LENGTH,
 )
+from sentry.db.models import NodeData
 from sentry.eventstore.processing import event_processing_store
 from sentry.grouping.api import (
     get_grouping_config_dict_for_project,
@@ -67,6 +67,7 @@ from sentry.utils.dates import to_timestamp, to_datetime
 from sentry.utils.outcomes import Outcome, track_outcome
 from sentry.utils.safe import safe_execute, trim, get_path, setdefault_path
 from sentry.stacktraces.processing import normalize_stacktraces_for_grouping
+from sentry.tsdb.writebehind import get_tsdb_writer
 from sentry.culprit import generate_culprit
 from sentry.reprocessing2 import (
     save_unprocessed_event,
@@ -163,6 +164,18 @@ class HashDiscarded(Exception):
     pass
 
 
+class SaveManyError(Exception):
+    """
+    Raised by ``EventManager.save_many`` when saving a batch fails.
+    ``unsaved`` are the indexes of the events that failed before they were
+    grouped, counted or written anywhere, so they can be saved again.
+    """
+
+    def __init__(self, unsaved):
+        super().__init__(unsaved)
+        self.unsaved = unsaved
+
+
 class ScoreClause(Func):
     def __init__(self, group=None, last_seen=None, times_seen=None, *args, **kwargs):
         self.group = group
@@ -290,181 +303,231 @@ class EventManager:
         (that do not hit cache first).
         """
 
-        # Normalize if needed
-        if not self._normalized:
-            if not assume_normalized:
-                self.normalize(project_id=project_id)
-            self._normalized = True
-
-        with metrics.timer("event_manager.save.project.get_from_cache"):
-            project = Project.objects.get_from_cache(id=project_id)
-
-        projects = {project.id: project}
-
-        if self._data.get("type") == "transaction":
-            self._data["project"] = int(project_id)
-            job = {"data": self._data, "start_time": start_time}
-            jobs = save_transaction_events([job], projects)
-            return jobs[0]["event"]
+        job = self._save_many(
+            [self],
+            project_id,
+            raw=raw,
+            assume_normalized=assume_normalized,
+            start_times=[start_time],
+            cache_keys=[cache_key],
+        )[0]
 
-        with metrics.timer("event_manager.save.organization.get_from_cache"):
-            project._organization_cache = Organization.objects.get_from_cache(
-                id=project.organization_id
-            )
+        if job.get("discarded") is not None:
+            raise job["discarded"]
 
-        job = {"data": self._data, "project_id": project_id, "raw": raw, "start_time": start_time}
-        jobs = [job]
+        return job["event"]
 
-        is_reprocessed = is_reprocessed_event(job["data"])
+    @classmethod
+    @metrics.wraps("event_manager.save_many")
+    def save_many(
+        cls,
+        managers,
+        project_id,
+        raw=False,
+        assume_normalized=False,
+        start_times=None,
+        cache_keys=None,
+    ):
+        """
+        Saves a batch of events that belong to the same project, see ``save``.
 
-        _pull_out_data(jobs, projects)
-        _get_or_create_release_many(jobs, projects)
-        _get_event_user_many(jobs, projects)
+        Work that is shared between the events (loading the project and its
+        organization, fingerprinting rules, releases, environments and their
+        associations) is only done once per batch.
 
-        job["project_key"] = None
-        if job["key_id"] is not None:
-            with metrics.timer("event_manager.load_project_key"):
-                try:
-                    job["project_key"] = ProjectKey.objects.get_from_cache(id=job["key_id"])
-                except ProjectKey.DoesNotExist:
-                    pass
+        Returns a list with the saved event for every manager, in order. If
+        an event has been discarded because it matches a tombstone, its entry
+        is the ``HashDiscarded`` exception instead.
 
-        with metrics.timer("event_manager.load_grouping_config"):
-            # At this point we want to normalize the in_app values in case the
-            # clients did not set this appropriately so far.
-            grouping_config = load_grouping_config(
-                get_grouping_config_dict_for_event_data(job["data"], project)
+        If saving the batch fails, ``SaveManyError`` is raised. Events that got
+        far enough to have side effects are not saved again by a caller, as
+        their counters would be incremented twice.
+        """
+        try:
+            jobs = cls._get_jobs(
+                managers,
+                project_id,
+                raw=raw,
+                assume_normalized=assume_normalized,
+                start_times=start_times,
+                cache_keys=cache_keys,
             )
+        except Exception as e:
+            raise SaveManyError(list(range(len(managers)))) from e
 
-        with metrics.timer("event_manager.normalize_stacktraces_for_grouping"):
-            normalize_stacktraces_for_grouping(job["data"], grouping_config)
-
-        _derive_plugin_tags_many(jobs, projects)
-        _derive_interface_tags_many(jobs)
-
-        with metrics.timer("event_manager.apply_server_fingerprinting"):
-            # The active grouping config was put into the event in the
-            # normalize step before.  We now also make sure that the
-            # fingerprint was set to `'{{ default }}' just in case someone
-            # removed it from the payload.  The call to get_hashes will then
-            # look at `grouping_config` to pick the right parameters.
-            job["data"]["fingerprint"] = job["data"].get("fingerprint") or ["{{ default }}"]
-            apply_server_fingerprinting(
-                job["data"],
-                get_fingerprinting_config_for_project(project),
-                allow_custom_title=features.has(
-                    "organizations:custom-event-title", project.organization, actor=None
-                ),
-            )
+        try:
+            cls._save_jobs(managers, jobs, project_id)
+        except Exception as e:
+            raise SaveManyError(
+                [i for i, job in enumerate(jobs) if not job.get("has_side_effects")]
+            ) from e
+
+        return [
+            job["discarded"] if job.get("discarded") is not None else job["event"] for job in jobs
+        ]
+
+    @classmethod
+    def _save_many(
+        cls,
+        managers,
+        project_id,
+        raw=False,
+        assume_normalized=False,
+        start_times=None,
+        cache_keys=None,
+    ):
+        jobs = cls._get_jobs(
+            managers,
+            project_id,
+            raw=raw,
+            assume_normalized=assume_normalized,
+            start_times=start_times,
+            cache_keys=cache_keys,
+        )
+        cls._save_jobs(managers, jobs, project_id)
+        return jobs
+
+    @classmethod
+    def _get_jobs(
+        cls,
+        managers,
+        project_id,
+        raw=False,
+        assume_normalized=False,
+        start_times=None,
+        cache_keys=None,
+    ):
+        if start_times is None:
+            start_times = [None] * len(managers)
+        if cache_keys is None:
+            cache_keys = [None] * len(managers)
 
-        with metrics.timer("event_manager.event.get_hashes"):
-            # Here we try to use the grouping config that was requested in the
-            # event.  If that config has since been deleted (because it was an
-            # experimental grouping config) we fall back to the default.
-            try:
-                flat_hashes, hierarchical_hashes = job["event"].get_hashes()
-            except GroupingConfigNotFound:
-                job["data"]["grouping_config"] = get_grouping_config_dict_for_project(project)
-                flat_hashes, hierarchical_hashes = job["event"].get_hashes()
+        # Normalize if needed
+        for manager in managers:
+            if not manager._normalized:
+                if not assume_normalized:
+                    manager.normalize(project_id=project_id)
+                manager._normalized = True
+
+        jobs = []
+        for manager, start_time, cache_key in zip(managers, start_times, cache_keys):
+            if manager._data.get("type") == "transaction":
+                manager._data["project"] = int(project_id)
+                job = {"data": manager._data, "start_time": start_time}
+            else:
+                job = {
+                    "data": manager._data,
+                    "project_id": project_id,
+                    "raw": raw,
+                    "start_time": start_time,
+                    "cache_key": cache_key,
+                }
+            jobs.append(job)
+
+        return jobs
+
+    @classmethod
+    def _save_jobs(cls, managers, jobs, project_id):
+        with metrics.timer("event_manager.save.project.get_from_cache"):
+            project = Project.objects.get_from_cache(id=project_id)
 
-        job["data"]["hashes"] = flat_hashes
-        if hierarchical_hashes:
-            job["data"]["hierarchical_hashes"] = hierarchical_hashes
+        projects = {project.id: project}
 
-        _materialize_metadata_many(jobs)
+        transaction_jobs = []
+        error_jobs = []
+        error_managers = []
+        for manager, job in zip(managers, jobs):
+            if manager._data.get("type") == "transaction":
+                transaction_jobs.append(job)
+            else:
+                error_jobs.append(job)
+                error_managers.append(manager)
 
-        # The group gets the same metadata as the event when it's flushed but
-        # additionally the `last_received` key is set.  This key is used by
-        # _save_aggregate.
-        group_metadata = dict(job["materialized_metadata"])
-        group_metadata["last_received"] = job["received_timestamp"]
-        kwargs = {
-            "platform": job["platform"],
-            "message": job["event"].search_message,
-            "culprit": job["culprit"],
-            "logger": job["logger_name"],
-            "level": LOG_LEVELS_MAP.get(job["level"]),
-            "last_seen": job["event"].datetime,
-            "first_seen": job["event"].datetime,
-            "active_at": job["event"].datetime,
-            "data": group_metadata,
-        }
+        if transaction_jobs:
+            save_transaction_events(transaction_jobs, projects)
 
-        if job["release"]:
-            kwargs["first_release"] = job["release"]
+        if error_jobs:
+            with metrics.timer("event_manager.save.organization.get_from_cache"):
+                project._organization_cache = Organization.objects.get_from_cache(
+                    id=project.organization_id
+                )
 
-        # Load attachments first, but persist them at the very last after
-        # posting to eventstream to make sure all counters and eventstream are
-        # incremented for sure. Also wait for grouping to remove attachments
-        # based on the group counter.
-        with metrics.timer("event_manager.get_attachments"):
-            attachments = get_attachments(cache_key, job)
+            save_error_events(error_jobs, projects)
 
-        save_aggregate_fn = (
-            _save_aggregate2
-            if not options.get("store.race-free-group-creation-force-disable")
-            and features.has("projects:race-free-group-creation", project)
-            else _save_aggregate
-        )
+            for manager, job in zip(error_managers, error_jobs):
+                if job.get("discarded") is None:
+                    manager._data = job["event"].data.data
 
-        try:
-            job["group"], job["is_new"], job["is_regression"] = save_aggregate_fn(
-                event=job["event"],
-                flat_hashes=flat_hashes,
-                hierarchical_hashes=hierarchical_hashes,
-                release=job["release"],
-                **kwargs,
-            )
-        except HashDiscarded:
-            discard_event(job, attachments)
-            raise
 
-        job["event"].group = job["group"]
+@metrics.wraps("event_manager.save_error_events")
+def save_error_events(jobs, projects):
+    """
+    After normalizing and processing events, save adjacent models such as
+    releases and environments to postgres and write the events into
+    eventstream. (See ``EventManager.save``.)
 
-        # store a reference to the group id to guarantee validation of isolation
-        # XXX(markus): No clue what this does
-        job["event"].data.bind_ref(job["event"])
+    Jobs of events that have been discarded are marked with the
+    ``HashDiscarded`` exception under the ``discarded`` key.
+    """
+    for job in jobs:
+        job["is_reprocessed"] = is_reprocessed_event(job["data"])
 
-        _get_or_create_environment_many(jobs, projects)
+    _pull_out_data(jobs, projects)
+    _get_or_create_release_many(jobs, projects)
+    _get_event_user_many(jobs, projects)
+    _get_project_key_many(jobs)
 
-        if job["group"]:
-            group_environment, job["is_new_group_environment"] = GroupEnvironment.get_or_create(
-                group_id=job["group"].id,
-                environment_id=job["environment"].id,
-                defaults={"first_release": job["release"] or None},
+    with metrics.timer("event_manager.load_grouping_config"):
+        for job in jobs:
+            # At this point we want to normalize the in_app values in case the
+            # clients did not set this appropriately so far.
+            job["grouping_config"] = load_grouping_config(
+                get_grouping_config_dict_for_event_data(job["data"], projects[job["project_id"]])
             )
-        else:
-            job["is_new_group_environment"] = False
 
-        _get_or_create_release_associated_models(jobs, projects)
+    with metrics.timer("event_manager.normalize_stacktraces_for_grouping"):
+        for job in jobs:
+            normalize_stacktraces_for_grouping(job["data"], job["grouping_config"])
 
-        if job["release"] and job["group"]:
-            job["grouprelease"] = GroupRelease.get_or_create(
-                group=job["group"],
-                release=job["release"],
-                environment=job["environment"],
-                datetime=job["event"].datetime,
-            )
+    _derive_plugin_tags_many(jobs, projects)
+    _derive_interface_tags_many(jobs)
+    _apply_server_fingerprinting_many(jobs, projects)
+    _get_hashes_many(jobs, projects)
+    _materialize_metadata_many(jobs)
+    _save_aggregate_many(jobs, projects)
 
-        _tsdb_record_all_metrics(jobs)
+    # Discarded events do not make it any further.
+    jobs = [job for job in jobs if job.get("discarded") is None]
+
+    _get_or_create_environment_many(jobs, projects)
+    _get_or_create_group_environment_many(jobs)
+    _get_or_create_release_associated_models(jobs, projects)
+    _get_or_create_group_release_many(jobs)
+    _tsdb_record_all_metrics(jobs)
 
+    for job in jobs:
         if job["group"]:
-            UserReport.objects.filter(project_id=project.id, event_id=job["event"].event_id).update(
-                group_id=job["group"].id, environment_id=job["environment"].id
-            )
+            UserReport.objects.filter(
+                project_id=job["project_id"], event_id=job["event"].event_id
+            ).update(group_id=job["group"].id, environment_id=job["environment"].id)
 
-        with metrics.timer("event_manager.filter_attachments_for_group"):
-            attachments = filter_attachments_for_group(attachments, job)
+    with metrics.timer("event_manager.filter_attachments_for_group"):
+        for job in jobs:
+            job["attachments"] = filter_attachments_for_group(job["attachments"], job)
 
-        # XXX: DO NOT MUTATE THE EVENT PAYLOAD AFTER THIS POINT
-        _materialize_event_metrics(jobs)
+    # XXX: DO NOT MUTATE THE EVENT PAYLOAD AFTER THIS POINT
+    _materialize_event_metrics(jobs)
 
-        for attachment in attachments:
+    for job in jobs:
+        for attachment in job["attachments"]:
             key = f"bytes.stored.{attachment.type}"
             old_bytes = job["event_metrics"].get(key) or 0
             job["event_metrics"][key] = old_bytes + attachment.size
 
-        _nodestore_save_many(jobs)
+    _nodestore_save_many(jobs)
+
+    for job in jobs:
+        project = projects[job["project_id"]]
         save_unprocessed_event(project, job["event"].event_id)
 
         if job["release"]:
@@ -485,28 +548,30 @@ class EventManager:
                     },
                 )
 
-        if not raw:
+        if not job["raw"]:
             if not project.first_event:
                 project.update(first_event=job["event"].datetime)
                 first_event_received.send_robust(
                     project=project, event=job["event"], sender=Project
                 )
 
-        if is_reprocessed:
+        if job["is_reprocessed"]:
             safe_execute(delete_old_primary_hash, job["event"])
 
-        _eventstream_insert_many(jobs)
+    _eventstream_insert_many(jobs)
 
-        # Do this last to ensure signals get emitted even if connection to the
-        # file store breaks temporarily.
-        #
-        # We do not need this for reprocessed events as for those we update the
-        # group_id on existing models in post_process_group, which already does
-        # this because of indiv. attachments.
-        if not is_reprocessed:
-            with metrics.timer("event_manager.save_attachments"):
-                save_attachments(cache_key, attachments, job)
+    # Do this last to ensure signals get emitted even if connection to the
+    # file store breaks temporarily.
+    #
+    # We do not need this for reprocessed events as for those we update the
+    # group_id on existing models in post_process_group, which already does
+    # this because of indiv. attachments.
+    with metrics.timer("event_manager.save_attachments"):
+        for job in jobs:
+            if not job["is_reprocessed"]:
+                save_attachments(job["cache_key"], job["attachments"], job)
 
+    for job in jobs:
         metric_tags = {"from_relay": "_relay_processed" in job["data"]}
 
         metrics.timing(
@@ -521,10 +586,7 @@ class EventManager:
             tags=metric_tags,
         )
 
-        _track_outcome_accepted_many(jobs)
-
-        self._data = job["event"].data.data
-        return job["event"]
+    _track_outcome_accepted_many(jobs)
 
 
 @metrics.wraps("save_event.pull_out_data")
@@ -682,12 +744,180 @@ def _materialize_metadata_many(jobs):
         data["culprit"] = job["culprit"]
 
 
+@metrics.wraps("save_event.get_project_key_many")
+def _get_project_key_many(jobs):
+    project_keys = {}
+
+    for job in jobs:
+        key_id = job["key_id"]
+        if key_id is not None and key_id not in project_keys:
+            with metrics.timer("event_manager.load_project_key"):
+                try:
+                    project_keys[key_id] = ProjectKey.objects.get_from_cache(id=key_id)
+                except ProjectKey.DoesNotExist:
+                    project_keys[key_id] = None
+
+        job["project_key"] = project_keys.get(key_id)
+
+
+@metrics.wraps("save_event.apply_server_fingerprinting_many")
+def _apply_server_fingerprinting_many(jobs, projects):
+    fingerprinting_configs = {}
+    allow_custom_titles = {}
+
+    for job in jobs:
+        project_id = job["project_id"]
+        if project_id not in fingerprinting_configs:
+            project = projects[project_id]
+            fingerprinting_configs[project_id] = get_fingerprinting_config_for_project(project)
+            allow_custom_titles[project_id] = features.has(
+                "organizations:custom-event-title", project.organization, actor=None
+            )
+
+        # The active grouping config was put into the event in the
+        # normalize step before.  We now also make sure that the
+        # fingerprint was set to `'{{ default }}' just in case someone
+        # removed it from the payload.  The call to get_hashes will then
+        # look at `grouping_config` to pick the right parameters.
+        job["data"]["fingerprint"] = job["data"].get("fingerprint") or ["{{ default }}"]
+        apply_server_fingerprinting(
+            job["data"],
+            fingerprinting_configs[project_id],
+            allow_custom_title=allow_custom_titles[project_id],
+        )
+
+
+@metrics.wraps("save_event.get_hashes_many")
+def _get_hashes_many(jobs, projects):
+    for job in jobs:
+        with metrics.timer("event_manager.event.get_hashes"):
+            # Here we try to use the grouping config that was requested in the
+            # event.  If that config has since been deleted (because it was an
+            # experimental grouping config) we fall back to the default.
+            try:
+                flat_hashes, hierarchical_hashes = job["event"].get_hashes()
+            except GroupingConfigNotFound:
+                job["data"]["grouping_config"] = get_grouping_config_dict_for_project(
+                    projects[job["project_id"]]
+                )
+                flat_hashes, hierarchical_hashes = job["event"].get_hashes()
+
+        job["flat_hashes"] = flat_hashes
+        job["hierarchical_hashes"] = hierarchical_hashes
+        job["data"]["hashes"] = flat_hashes
+        if hierarchical_hashes:
+            job["data"]["hierarchical_hashes"] = hierarchical_hashes
+
+
+@metrics.wraps("save_event.save_aggregate_many")
+def _save_aggregate_many(jobs, projects):
+    save_aggregate_fns = {}
+
+    for job in jobs:
+        project_id = job["project_id"]
+        if project_id not in save_aggregate_fns:
+            save_aggregate_fns[project_id] = (
+                _save_aggregate2
+                if not options.get("store.race-free-group-creation-force-disable")
+                and features.has("projects:race-free-group-creation", projects[project_id])
+                else _save_aggregate
+            )
+
+        # The group gets the same metadata as the event when it's flushed but
+        # additionally the `last_received` key is set.  This key is used by
+        # _save_aggregate.
+        group_metadata = dict(job["materialized_metadata"])
+        group_metadata["last_received"] = job["received_timestamp"]
+        kwargs = {
+            "platform": job["platform"],
+            "message": job["event"].search_message,
+            "culprit": job["culprit"],
+            "logger": job["logger_name"],
+            "level": LOG_LEVELS_MAP.get(job["level"]),
+            "last_seen": job["event"].datetime,
+            "first_seen": job["event"].datetime,
+            "active_at": job["event"].datetime,
+            "data": group_metadata,
+        }
+
+        if job["release"]:
+            kwargs["first_release"] = job["release"]
+
+        # Load attachments first, but persist them at the very last after
+        # posting to eventstream to make sure all counters and eventstream are
+        # incremented for sure. Also wait for grouping to remove attachments
+        # based on the group counter.
+        with metrics.timer("event_manager.get_attachments"):
+            job["attachments"] = get_attachments(job["cache_key"], job)
+
+        # From here on the event is counted, see ``EventManager.save_many``.
+        job["has_side_effects"] = True
+        try:
+            job["group"], job["is_new"], job["is_regression"] = save_aggregate_fns[project_id](
+                event=job["event"],
+                flat_hashes=job["flat_hashes"],
+                hierarchical_hashes=job["hierarchical_hashes"],
+                release=job["release"],
+                **kwargs,
+            )
+        except HashDiscarded as e:
+            discard_event(job, job["attachments"])
+            job["discarded"] = e
+            continue
+
+        job["event"].group = job["group"]
+
+        # store a reference to the group id to guarantee validation of isolation
+        # XXX(markus): No clue what this does
+        job["event"].data.bind_ref(job["event"])
+
+
 @metrics.wraps("save_event.get_or_create_environment_many")
 def _get_or_create_environment_many(jobs, projects):
+    environments = {}
+
+    for job in jobs:
+        environment_key = (job["project_id"], job["environment"])
+        if environment_key not in environments:
+            environments[environment_key] = Environment.get_or_create(
+                project=projects[job["project_id"]], name=job["environment"]
+            )
+        job["environment"] = environments[environment_key]
+
+
+@metrics.wraps("save_event.get_or_create_group_environment_many")
+def _get_or_create_group_environment_many(jobs):
+    group_environments = {}
+
     for job in jobs:
-        job["environment"] = Environment.get_or_create(
-            project=projects[job["project_id"]], name=job["environment"]
+        if not job["group"]:
+            job["is_new_group_environment"] = False
+            continue
+
+        group_environment_key = (job["group"].id, job["environment"].id)
+        if group_environment_key in group_environments:
+            # Only the first event in the batch can have created it.
+            job["is_new_group_environment"] = False
+            continue
+
+        _, job["is_new_group_environment"] = GroupEnvironment.get_or_create(
+            group_id=job["group"].id,
+            environment_id=job["environment"].id,
+            defaults={"first_release": job["release"] or None},
         )
+        group_environments[group_environment_key] = True
+
+
+@metrics.wraps("save_event.get_or_create_group_release_many")
+def _get_or_create_group_release_many(jobs):
+    for job in jobs:
+        if job["release"] and job["group"]:
+            job["grouprelease"] = GroupRelease.get_or_create(
+                group=job["group"],
+                release=job["release"],
+                environment=job["environment"],
+                datetime=job["event"].datetime,
+            )
 
 
 @metrics.wraps("save_event.get_or_create_release_associated_models")
@@ -722,6 +952,8 @@ def _tsdb_record_all_metrics(jobs):
 
     # XXX: validate whether anybody actually uses those metrics
 
+    writer = get_tsdb_writer()
+
     for job in jobs:
         incrs = []
         frequencies = []
@@ -760,31 +992,44 @@ def _tsdb_record_all_metrics(jobs):
                 records.append((tsdb.models.users_affected_by_group, group.id, (user.tag_value,)))
 
         if incrs:
-            tsdb.incr_multi(incrs, timestamp=event.datetime, environment_id=environment.id)
+            writer.incr_multi(incrs, timestamp=event.datetime, environment_id=environment.id)
 
         if records:
-            tsdb.record_multi(records, timestamp=event.datetime, environment_id=environment.id)
+            writer.record_multi(records, timestamp=event.datetime, environment_id=environment.id)
 
         if frequencies:
-            tsdb.record_frequency_multi(frequencies, timestamp=event.datetime)
+            writer.record_frequency_multi(frequencies, timestamp=event.datetime)
 
 
 @metrics.wraps("save_event.nodestore_save_many")
 def _nodestore_save_many(jobs):
+    # The unprocessed payloads of all events with a group are fetched at once.
+    unprocessed = iter(
+        event_processing_store.get_many(
+            [
+                cache_key_for_event(
+                    {"project": job["event"].project_id, "event_id": job["event"].event_id}
+                )
+                for job in jobs
+                if job["group"]
+            ],
+            unprocessed=True,
+        )
+    )
+
+    nodes = []
     for job in jobs:
         # Write the event to Nodestore
         subkeys = {}
 
         if job["group"]:
-            event = job["event"]
-            data = event_processing_store.get(
-                cache_key_for_event({"project": event.project_id, "event_id": event.event_id}),
-                unprocessed=True,
-            )
+            data = next(unprocessed)
             if data is not None:
                 subkeys["unprocessed"] = data
 
-        job["event"].data.save(subkeys=subkeys)
+        nodes.append((job["event"].data, subkeys))
+
+    NodeData.save_many(nodes)
 
 
 @metrics.wraps("save_event.eventstream_insert_many")
@@ -1494,9 +1739,20 @@ def save_attachment(
     else:
         timestamp = datetime.utcnow().replace(tzinfo=UTC)
 
+    file = File.objects.create(
+        name=attachment.name,
+        type=attachment.type,
+        headers={"Content-Type": attachment.content_type},
+    )
+
+    # The attachment is streamed from the cache into the file store, so that
+    # it is never held in memory as a whole.
     try:
-        data = attachment.data
+        with attachment.open() as fileobj:
+            file.putfile(fileobj, blob_size=settings.SENTRY_ATTACHMENT_BLOB_SIZE)
     except MissingAttachmentChunks:
+        file.delete()
+
         track_outcome(
             org_id=project.organization_id,
             project_id=project.id,
@@ -1511,13 +1767,6 @@ def save_attachment(
         logger.exception("Missing chunks for cache_key=%s", cache_key)
         return
 
-    file = File.objects.create(
-        name=attachment.name,
-        type=attachment.type,
-        headers={"Content-Type": attachment.content_type},
-    )
-    file.putfile(BytesIO(data), blob_size=settings.SENTRY_ATTACHMENT_BLOB_SIZE)
-
     EventAttachment.objects.create(
         event_id=event_id,
         project_id=project.id,
@@ -1617,6 +1866,11 @@ def save_transaction_events(jobs, projects):
     _materialize_metadata_many(jobs)
     _get_or_create_environment_many(jobs, projects)
     _get_or_create_release_associated_models(jobs, projects)
+
+    # From here on the events are counted, see ``EventManager.save_many``.
+    for job in jobs:
+        job["has_side_effects"] = True
+
     _tsdb_record_all_metrics(jobs)
     _materialize_event_metrics(jobs)
     _nodestore_save_many(jobs)
@@ -31,11 +31,31 @@ class BaseEventProcessingStore:
         self.inner.set(key, event, self.timeout)
         return key
 
+    def store_many(self, events, unprocessed=False):
+        """
+        Stores several events at once and returns their keys, in the order of
+        ``events``.
+        """
+        keys = [cache_key_for_event(event) for event in events]
+        if unprocessed:
+            keys = [_get_unprocessed_key(key) for key in keys]
+        self.inner.set_many(list(zip(keys, events)), self.timeout)
+        return keys
+
     def get(self, key, unprocessed=False):
         if unprocessed:
             key = _get_unprocessed_key(key)
         return self.inner.get(key)
 
+    def get_many(self, keys, unprocessed=False):
+        """
+        Returns the events stored under several keys, in the order of
+        ``keys``. Events that are not stored are returned as ``None``.
+        """
+        if unprocessed:
+            keys = [_get_unprocessed_key(key) for key in keys]
+        return self.inner.get_many(keys)
+
     def delete_by_key(self, key):
         self.inner.delete(key)
         self.inner.delete(_get_unprocessed_key(key))
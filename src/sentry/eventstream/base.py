@@ -1,6 +1,7 @@
 import logging
 
-from sentry.tasks.post_process import post_process_group
+from sentry import options
+from sentry.tasks.post_process import coalesce_post_process_group, post_process_group
 from sentry.utils.services import Service
 from sentry.utils.cache import cache_key_for_event
 
@@ -48,14 +49,22 @@ class EventStream(Service):
             cache_key = cache_key_for_event(
                 {"project": event.project_id, "event_id": event.event_id}
             )
-            post_process_group.delay(
-                is_new=is_new,
-                is_regression=is_regression,
-                is_new_group_environment=is_new_group_environment,
-                primary_hash=primary_hash,
-                cache_key=cache_key,
-                group_id=event.group_id,
-            )
+            task_kwargs = {
+                "is_new": is_new,
+                "is_regression": is_regression,
+                "is_new_group_environment": is_new_group_environment,
+                "primary_hash": primary_hash,
+                "cache_key": cache_key,
+                "group_id": event.group_id,
+            }
+
+            # Events of new or regressed groups are never delayed, so that
+            # the alerts for them are not either.
+            coalesce_window = options.get("post-process.coalesce-window")
+            if coalesce_window > 0 and event.group_id and not is_new and not is_regression:
+                coalesce_post_process_group(window=coalesce_window, **task_kwargs)
+            else:
+                post_process_group.delay(**task_kwargs)
 
     def insert(
         self,
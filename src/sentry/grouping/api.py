@@ -1,4 +1,10 @@
+import copy
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
 
 from sentry.grouping.strategies.base import GroupingContext
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
@@ -18,10 +24,27 @@ from sentry.grouping.utils import (
     resolve_fingerprint_values,
     expand_title_template,
 )
+from sentry.utils import json, metrics
+from sentry.utils.hashlib import md5_text
 
 
 HASH_RE = re.compile(r"^[0-9a-f]{32}$")
 
+# The keys of the event data that grouping components are calculated from.
+# Fingerprints and checksums are applied on top of the components.
+GROUPING_COMPONENT_DATA_KEYS = (
+    "platform",
+    "exception",
+    "stacktrace",
+    "threads",
+    "logentry",
+    "template",
+    "csp",
+    "hpkp",
+    "expectct",
+    "expectstaple",
+)
+
 
 class GroupingConfigNotFound(LookupError):
     pass
@@ -52,11 +75,20 @@ def _get_project_enhancements_config(project):
     enhancements_base = project.get_option(
         "sentry:grouping_enhancements_base", validate=lambda x: x in ENHANCEMENT_BASES
     )
+    return _get_enhancements_config(enhancements_base, enhancements)
+
 
+# Number of rule configs each process keeps around in materialized form.
+# The caches are keyed by the project option values, so that changes to the
+# options are picked up by every process on the next event.
+RULES_CACHE_SIZE = 1000
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def _get_enhancements_config(enhancements_base, enhancements):
     # Instead of parsing and dumping out config here, we can make a
     # shortcut
     from sentry.utils.cache import cache
-    from sentry.utils.hashlib import md5_text
 
     cache_key = (
         "grouping-enhancements:" + md5_text(f"{enhancements_base}|{enhancements}").hexdigest()
@@ -106,14 +138,19 @@ def load_default_grouping_config():
 
 
 def get_fingerprinting_config_for_project(project):
-    from sentry.grouping.fingerprinting import FingerprintingRules, InvalidFingerprintingConfig
+    from sentry.grouping.fingerprinting import FingerprintingRules
 
     rules = project.get_option("sentry:fingerprinting_rules")
     if not rules:
         return FingerprintingRules([])
 
+    return _get_fingerprinting_config(rules)
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def _get_fingerprinting_config(rules):
+    from sentry.grouping.fingerprinting import FingerprintingRules, InvalidFingerprintingConfig
     from sentry.utils.cache import cache
-    from sentry.utils.hashlib import md5_text
 
     cache_key = "fingerprinting-rules:" + md5_text(rules).hexdigest()
     rv = cache.get(cache_key)
@@ -183,6 +220,64 @@ def _get_calculated_grouping_variants_for_event(event, context):
     return rv
 
 
+class GroupingComponentCache:
+    """
+    A bounded, process-local LRU cache of calculated grouping components.
+
+    Events of the same issue mostly carry identical stack traces, so the
+    components of a hot issue do not need to be recalculated for every event.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            rv = self._items.get(key)
+            if rv is not None:
+                self._items.move_to_end(key)
+        return rv
+
+    def set(self, key, value, max_size):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_component_cache = GroupingComponentCache()
+
+
+def _get_grouping_component_cache_key(event, config):
+    values = [event.data.get(key) for key in GROUPING_COMPONENT_DATA_KEYS]
+    return (config.id, config.enhancements_config, md5_text(json.dumps(values)).hexdigest())
+
+
+def _get_cached_grouping_variants_for_event(event, context):
+    max_size = settings.SENTRY_GROUPING_COMPONENT_CACHE_SIZE
+    if not max_size:
+        return _get_calculated_grouping_variants_for_event(event, context)
+
+    cache_key = _get_grouping_component_cache_key(event, context.config)
+    rv = _component_cache.get(cache_key)
+    if rv is not None:
+        metrics.incr("grouping.component_cache", tags={"result": "hit"}, skip_internal=False)
+        # Components are updated in place by the caller, so the cached ones
+        # must never be handed out.
+        return copy.deepcopy(rv)
+
+    metrics.incr("grouping.component_cache", tags={"result": "miss"}, skip_internal=False)
+    rv = _get_calculated_grouping_variants_for_event(event, context)
+    _component_cache.set(cache_key, copy.deepcopy(rv), max_size)
+    return rv
+
+
 def get_grouping_variants_for_event(event, config=None):
     """Returns a dict of all grouping variants for this event."""
     # If a checksum is set the only variant that comes back from this
@@ -217,7 +312,7 @@ def get_grouping_variants_for_event(event, config=None):
 
     # At this point we need to calculate the default event values.  If the
     # fingerprint is salted we will wrap it.
-    components = _get_calculated_grouping_variants_for_event(event, context)
+    components = _get_cached_grouping_variants_for_event(event, context)
 
     # If no defaults are referenced we produce a single completely custom
     # fingerprint and mark all other variants as non-contributing
@@ -1,8 +1,10 @@
 import os
+import re
 import zlib
 import base64
 import msgpack
 import inspect
+from functools import lru_cache
 
 from parsimonious.grammar import Grammar, NodeVisitor
 from parsimonious.exceptions import ParseError
@@ -12,6 +14,7 @@ from sentry.stacktraces.functions import set_in_app
 from sentry.stacktraces.platform import get_behavior_family_for_platform
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.utils import get_rule_bool
+from sentry.utils.cache import memoize
 from sentry.utils.glob import glob_match
 from sentry.utils.safe import get_path
 from sentry.utils.compat import zip
@@ -110,6 +113,38 @@ class InvalidEnhancerConfig(Exception):
     pass
 
 
+# Characters with a special meaning in glob patterns. Everything before the
+# first and after the last of them is matched literally.
+GLOB_SPECIAL_CHARS = re.compile(r"[*?\[\]{}\\]")
+
+
+@lru_cache(maxsize=4096)
+def _get_literal_affixes(key, pattern):
+    """Returns the literal prefix and suffix every value matched by the given
+    pattern has to start and end with, or `None` if they are not known.
+    """
+    if key in ("path", "package"):
+        # Path matches are case insensitive, see ``Match._positive_frame_match``.
+        if "\\" in pattern or not _is_ascii(pattern):
+            return None
+        pattern = pattern.lower()
+    elif key not in ("function", "module"):
+        return None
+
+    matches = [m.start() for m in GLOB_SPECIAL_CHARS.finditer(pattern)]
+    if not matches:
+        return pattern, pattern
+    return pattern[: matches[0]], pattern[matches[-1] + 1 :]
+
+
+def _is_ascii(value):
+    try:
+        value.encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
 class Match:
     def __init__(self, key, pattern, negated=False):
         try:
@@ -126,19 +161,56 @@ class Match:
             self.pattern.split() != [self.pattern] and '"%s"' % self.pattern or self.pattern,
         )
 
-    def matches_frame(self, frame_data, platform):
-        rv = self._positive_frame_match(frame_data, platform)
+    @property
+    def families(self):
+        """The families frames need to belong to for this matcher to match,
+        or `None` if it does not restrict them.
+        """
+        if self.key != "family" or self.negated:
+            return None
+        flags = self.pattern.split(",")
+        if "all" in flags:
+            return None
+        return frozenset(flags)
+
+    def matches_frame(self, frame_data, platform, cache=None):
+        """Checks whether the frame matches.  If a `cache` dictionary is
+        passed, values derived from the frame and match results that do not
+        depend on the in-app flag are memoized in it.  The same dictionary may
+        only be passed for the same frame.
+        """
+        if self.key == "app" or cache is None:
+            rv = self._positive_frame_match(frame_data, platform, {})
+        else:
+            cache_key = (self.key, self.pattern)
+            rv = cache.get(cache_key)
+            if rv is None:
+                rv = cache[cache_key] = self._positive_frame_match(frame_data, platform, cache)
+
         if self.negated:
             rv = not rv
         return rv
 
-    def _positive_frame_match(self, frame_data, platform):
+    def _could_match(self, value):
+        # Cheap check that rejects values before they are passed to
+        # `glob_match`.  It must never reject a value the pattern matches.
+        affixes = _get_literal_affixes(self.key, self.pattern)
+        if affixes is None:
+            return True
+        prefix, suffix = affixes
+        return value.startswith(prefix) and value.endswith(suffix)
+
+    def _positive_frame_match(self, frame_data, platform, cache):
         # Path matches are always case insensitive
         if self.key in ("path", "package"):
-            if self.key == "package":
-                value = frame_data.get("package") or ""
-            else:
-                value = frame_data.get("abs_path") or frame_data.get("filename") or ""
+            value = _get_frame_value(self.key, frame_data, platform, cache)
+
+            normalized = _get_frame_value("normalized_" + self.key, frame_data, platform, cache)
+            if normalized is not None and not (
+                self._could_match(normalized) or self._could_match("/" + normalized)
+            ):
+                return False
+
             if glob_match(
                 value, self.pattern, ignorecase=True, doublestar=True, path_normalize=True
             ):
@@ -154,8 +226,7 @@ class Match:
             flags = self.pattern.split(",")
             if "all" in flags:
                 return True
-            family = get_behavior_family_for_platform(frame_data.get("platform") or platform)
-            return family in flags
+            return _get_frame_value("family", frame_data, platform, cache) in flags
 
         # in-app matching is just a bool
         if self.key == "app":
@@ -163,16 +234,12 @@ class Match:
             return ref_val is not None and ref_val == frame_data.get("in_app")
 
         # all other matches are case sensitive
-        if self.key == "function":
-            from sentry.stacktraces.functions import get_function_name_for_frame
-
-            value = get_function_name_for_frame(frame_data, platform) or "<unknown>"
-        elif self.key == "module":
-            value = frame_data.get("module") or "<unknown>"
+        if self.key in ("function", "module"):
+            value = _get_frame_value(self.key, frame_data, platform, cache)
         else:
             # should not happen :)
             value = "<unknown>"
-        return glob_match(value, self.pattern)
+        return self._could_match(value) and glob_match(value, self.pattern)
 
     def _to_config_structure(self):
         if self.key == "family":
@@ -199,6 +266,40 @@ class Match:
         return cls(key, arg, negated)
 
 
+def _get_frame_value(key, frame_data, platform, cache):
+    """Returns the value of the frame that matchers of the given key are
+    evaluated against, memoized in `cache`.
+    """
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    if key == "package":
+        rv = frame_data.get("package") or ""
+    elif key == "path":
+        rv = frame_data.get("abs_path") or frame_data.get("filename") or ""
+    elif key in ("normalized_package", "normalized_path"):
+        # Lowercased and with backslashes replaced like `glob_match` does it
+        # for path matches.  Non-ASCII values are left to `glob_match`, as
+        # Unicode case folding does not agree with `str.lower` everywhere.
+        value = _get_frame_value(key[len("normalized_") :], frame_data, platform, cache)
+        rv = value.replace("\\", "/").lower() if _is_ascii(value) else None
+    elif key == "family":
+        rv = get_behavior_family_for_platform(frame_data.get("platform") or platform)
+    elif key == "function":
+        from sentry.stacktraces.functions import get_function_name_for_frame
+
+        rv = get_function_name_for_frame(frame_data, platform) or "<unknown>"
+    elif key == "module":
+        rv = frame_data.get("module") or "<unknown>"
+    else:
+        raise KeyError(key)
+
+    cache[key] = rv
+    return rv
+
+
 class Action:
     def apply_modifications_to_frame(self, frames, idx):
         pass
@@ -339,9 +440,10 @@ class Enhancements:
         """This applies the frame modifications to the frames itself.  This
         does not affect grouping.
         """
-        for rule in self.iter_rules():
+        caches = [{} for _ in frames]
+        for rule in self._iter_rules_for_frames(frames, platform, caches):
             for idx, frame in enumerate(frames):
-                actions = rule.get_matching_frame_actions(frame, platform)
+                actions = rule.get_matching_frame_actions(frame, platform, caches[idx])
                 for action in actions or ():
                     action.apply_modifications_to_frame(frames, idx)
 
@@ -349,9 +451,10 @@ class Enhancements:
         stacktrace_state = StacktraceState()
 
         # Apply direct frame actions and update the stack state alongside
-        for rule in self.iter_rules():
+        caches = [{} for _ in frames]
+        for rule in self._iter_rules_for_frames(frames, platform, caches):
             for idx, (component, frame) in enumerate(zip(components, frames)):
-                actions = rule.get_matching_frame_actions(frame, platform)
+                actions = rule.get_matching_frame_actions(frame, platform, caches[idx])
                 for action in actions or ():
                     action.update_frame_components_contributions(components, frames, idx, rule=rule)
                     action.modify_stacktrace_state(stacktrace_state, rule)
@@ -439,6 +542,36 @@ class Enhancements:
                 yield from base.iter_rules()
         yield from self.rules
 
+    @memoize
+    def _rules_by_families(self):
+        # frozenset of families -> own rules that can match frames of them
+        return {}
+
+    def _iter_rules_for_families(self, families):
+        """Like `iter_rules` but skips rules that are restricted to families
+        other than the given ones.
+        """
+        for base in self.bases:
+            base = ENHANCEMENT_BASES.get(base)
+            if base:
+                yield from base._iter_rules_for_families(families)
+
+        rules = self._rules_by_families.get(families)
+        if rules is None:
+            rules = self._rules_by_families[families] = [
+                rule
+                for rule in self.rules
+                if rule.families is None or not rule.families.isdisjoint(families)
+            ]
+        yield from rules
+
+    def _iter_rules_for_frames(self, frames, platform, caches):
+        families = frozenset(
+            _get_frame_value("family", frame, platform, cache)
+            for frame, cache in zip(frames, caches)
+        )
+        return self._iter_rules_for_families(families)
+
     @classmethod
     def _from_config_structure(cls, data):
         version, bases, rules = data
@@ -460,6 +593,15 @@ class Enhancements:
         except (LookupError, AttributeError, TypeError, ValueError) as e:
             raise ValueError("invalid stack trace rule config: %s" % e)
 
+    @classmethod
+    def loads_cached(cls, data):
+        """Like `loads` but returns a shared instance for the same `data` from
+        a process-local cache.  The returned object must not be modified.
+        """
+        if isinstance(data, bytes):
+            data = data.decode("ascii", "ignore")
+        return _loads_cached(data)
+
     @classmethod
     def from_config_string(self, s, bases=None, id=None):
         try:
@@ -479,6 +621,15 @@ class Rule:
         self.matchers = matchers
         self.actions = actions
 
+    @property
+    def families(self):
+        """The families frames need to belong to for this rule to match, or
+        `None` if it does not restrict them.
+        """
+        families = [x.families for x in self.matchers if x.families is not None]
+        if families:
+            return frozenset.intersection(*families)
+
     @property
     def matcher_description(self):
         rv = " ".join(x.description for x in self.matchers)
@@ -492,11 +643,13 @@ class Rule:
             matchers[matcher.key] = matcher.pattern
         return {"match": matchers, "actions": [str(x) for x in self.actions]}
 
-    def get_matching_frame_actions(self, frame_data, platform):
+    def get_matching_frame_actions(self, frame_data, platform, cache=None):
         """Given a frame returns all the matching actions based on this rule.
         If the rule does not match `None` is returned.
         """
-        if self.matchers and all(m.matches_frame(frame_data, platform) for m in self.matchers):
+        if self.matchers and all(
+            m.matches_frame(frame_data, platform, cache) for m in self.matchers
+        ):
             return self.actions
 
     def _to_config_structure(self):
@@ -616,6 +769,16 @@ class EnhancmentsVisitor(NodeVisitor):
         return node.match.groups()[0].lstrip("!")
 
 
+# Number of deserialized enhancements each process keeps around.  The cache
+# is keyed by the serialized form, so changed configs are never served stale.
+ENHANCEMENTS_CACHE_SIZE = 1000
+
+
+@lru_cache(maxsize=ENHANCEMENTS_CACHE_SIZE)
+def _loads_cached(data):
+    return Enhancements.loads(data)
+
+
 def _load_configs():
     rv = {}
     base = os.path.join(os.path.abspath(os.path.dirname(__file__)), "enhancement-configs")
@@ -1,10 +1,12 @@
 import inspect
+import re
 
 from parsimonious.grammar import Grammar, NodeVisitor
 from parsimonious.exceptions import ParseError
 
 from sentry.stacktraces.platform import get_behavior_family_for_platform
 from sentry.grouping.utils import get_rule_bool
+from sentry.utils.cache import memoize
 from sentry.utils.safe import get_path
 from sentry.utils.glob import glob_match
 from sentry.utils.strings import unescape_string
@@ -12,6 +14,13 @@ from sentry.utils.strings import unescape_string
 
 VERSION = 1
 
+# Characters with a special meaning in glob patterns.  Patterns without any of
+# them only match values equal to the pattern.
+GLOB_SPECIAL_CHARS = re.compile(r"[*?\[\]{}\\]")
+
+# Keys that are glob matched case sensitively and without path normalization.
+LITERAL_MATCH_KEYS = ("type", "module", "function", "logger")
+
 
 # Grammar is defined in EBNF syntax.
 fingerprinting_grammar = Grammar(
@@ -67,6 +76,7 @@ class EventAccess:
         self._log_info = None
         self._toplevel = None
         self._tags = None
+        self._match_results = {}
 
     def get_messages(self):
         if self._messages is None:
@@ -162,6 +172,18 @@ class EventAccess:
     def get_values(self, match_group):
         return getattr(self, "get_" + match_group)()
 
+    def get_match_results(self, matcher):
+        """Returns whether the matcher matches, for every value of its match
+        group.  Results are shared between all rules using the same matcher.
+        """
+        cache_key = (matcher.key, matcher.pattern, matcher.negated)
+        rv = self._match_results.get(cache_key)
+        if rv is None:
+            rv = self._match_results[cache_key] = [
+                matcher.matches(values) for values in self.get_values(matcher.match_group)
+            ]
+        return rv
+
 
 class FingerprintingRules:
     def __init__(self, rules, changelog=None, version=None):
@@ -178,11 +200,47 @@ class FingerprintingRules:
         if not self.rules:
             return
         access = EventAccess(event)
-        for rule in self.iter_rules():
+        for rule in self._iter_candidate_rules(access):
             new_values = rule.get_fingerprint_values_for_event_access(access)
             if new_values is not None:
                 return (rule,) + new_values
 
+    @memoize
+    def _rule_index(self):
+        """Indexes the rules by a value the event needs to have for them to
+        match, see `Match.index_key`.  Returns the positions of rules that
+        cannot be indexed and a mapping of `(key, value)` to positions.
+        """
+        unindexed = []
+        indexed = {}
+        for idx, rule in enumerate(self.rules):
+            index_key = rule.index_key
+            if index_key is None:
+                unindexed.append(idx)
+            else:
+                indexed.setdefault(index_key, []).append(idx)
+        return unindexed, indexed
+
+    def _iter_candidate_rules(self, access):
+        """Yields the rules in order, skipping those that require a value
+        which the event does not have.
+        """
+        unindexed, indexed = self._rule_index
+        if not indexed:
+            return self.iter_rules()
+
+        present = set()
+        for key in {key for key, _ in indexed}:
+            for values in access.get_values(get_match_group(key)):
+                value = values.get(key)
+                if value is not None:
+                    present.add((key, value))
+
+        positions = list(unindexed)
+        for index_key in present:
+            positions.extend(indexed.get(index_key, ()))
+        return (self.rules[idx] for idx in sorted(positions))
+
     @classmethod
     def _from_config_structure(cls, data):
         version = data["version"]
@@ -241,6 +299,21 @@ MATCHERS = {
 }
 
 
+def get_match_group(key):
+    """Returns the group of values of `EventAccess` that matchers of the given
+    key are evaluated against.
+    """
+    if key == "message":
+        return "toplevel"
+    if key in ("logger", "level"):
+        return "log_info"
+    if key in ("type", "value"):
+        return "exceptions"
+    if key.startswith("tags."):
+        return "tags"
+    return "frames"
+
+
 class Match:
     def __init__(self, key, pattern, negated=False):
         if key.startswith("tags."):
@@ -253,17 +326,22 @@ class Match:
         self.pattern = pattern
         self.negated = negated
 
+    @property
+    def index_key(self):
+        """`(key, value)` if this matcher only matches values of its key that
+        are equal to its pattern, otherwise `None`.
+        """
+        if self.negated:
+            return None
+        if self.key not in LITERAL_MATCH_KEYS and not self.key.startswith("tags."):
+            return None
+        if GLOB_SPECIAL_CHARS.search(self.pattern):
+            return None
+        return self.key, self.pattern
+
     @property
     def match_group(self):
-        if self.key == "message":
-            return "toplevel"
-        if self.key in ("logger", "level"):
-            return "log_info"
-        if self.key in ("type", "value"):
-            return "exceptions"
-        if self.key.startswith("tags."):
-            return "tags"
-        return "frames"
+        return get_match_group(self.key)
 
     def matches(self, values):
         rv = self._positive_match(values)
@@ -351,16 +429,24 @@ class Rule:
         self.fingerprint = fingerprint
         self.attributes = attributes
 
-    def get_fingerprint_values_for_event_access(self, access):
-        by_match_group = {}
+        self._matchers_by_match_group = {}
+        for matcher in matchers:
+            self._matchers_by_match_group.setdefault(matcher.match_group, []).append(matcher)
+
+    @property
+    def index_key(self):
+        """The index key of the first matcher that has one, see
+        `Match.index_key`.
+        """
         for matcher in self.matchers:
-            by_match_group.setdefault(matcher.match_group, []).append(matcher)
+            index_key = matcher.index_key
+            if index_key is not None:
+                return index_key
 
-        for match_group, matchers in by_match_group.items():
-            for values in access.get_values(match_group):
-                if all(x.matches(values) for x in matchers):
-                    break
-            else:
+    def get_fingerprint_values_for_event_access(self, access):
+        for matchers in self._matchers_by_match_group.values():
+            results = [access.get_match_results(x) for x in matchers]
+            if not any(all(x) for x in zip(*results)):
                 return
 
         return self.fingerprint, self.attributes
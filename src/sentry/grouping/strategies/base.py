@@ -227,10 +227,12 @@ class StrategyConfiguration:
     risk = RISK_LEVEL_LOW
 
     def __init__(self, enhancements=None, **extra):
+        # The serialized enhancements, identifying them in cache keys.
+        self.enhancements_config = enhancements
         if enhancements is None:
             enhancements = Enhancements([])
         else:
-            enhancements = Enhancements.loads(enhancements)
+            enhancements = Enhancements.loads_cached(enhancements)
         self.enhancements = enhancements
 
     def __repr__(self):
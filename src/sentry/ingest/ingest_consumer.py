@@ -1,18 +1,20 @@
 import random
 import functools
+import itertools
 import logging
 import msgpack
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.cache import cache
 
 import sentry_sdk
 
-from sentry import eventstore, features
+from sentry import eventstore, features, options
 
 from sentry.models import Project
 from sentry.signals import event_accepted
-from sentry.tasks.store import preprocess_event
+from sentry.tasks.store import batch_save_events, preprocess_event
 from sentry.utils import json, metrics
 from sentry.utils.sdk import mark_scope_as_unsafe
 from sentry.utils.dates import to_datetime
@@ -32,6 +34,26 @@ CACHE_TIMEOUT = 3600
 
 
 class IngestConsumerWorker(AbstractBatchWorker):
+    """
+    Processes the messages of the ingest topics in batches.
+
+    If ``concurrency`` is greater than one, the messages of a batch are
+    partitioned by project and the partitions are processed in a thread pool
+    of that size. The messages of a project are still processed in order, and
+    all attachment chunks of the batch are stored before any other message is
+    processed. A batch is only committed once all of its messages have been
+    processed.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency
+        if concurrency is not None and concurrency > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix="ingest_consumer"
+            )
+        else:
+            self._executor = None
+
     def process_message(self, message):
         message = msgpack.unpackb(message.value(), use_list=False)
         return message
@@ -72,16 +94,65 @@ class IngestConsumerWorker(AbstractBatchWorker):
         if attachment_chunks:
             # attachment_chunk messages need to be processed before attachment/event messages.
             with metrics.timer("ingest_consumer.process_attachment_chunk_batch"):
-                for attachment_chunk in attachment_chunks:
-                    process_attachment_chunk(attachment_chunk, projects=projects)
+                self._process_messages(
+                    [(process_attachment_chunk, message) for message in attachment_chunks],
+                    projects,
+                )
 
         if other_messages:
             with metrics.timer("ingest_consumer.process_other_messages_batch"):
-                for processing_func, message in other_messages:
+                self._process_messages(
+                    other_messages, projects, batch_saves=options.get("store.save-event-batching")
+                )
+
+    def _process_messages(self, messages, projects, batch_saves=False):
+        if self._executor is None:
+            self._process_partition(messages, projects, batch_saves)
+            return
+
+        partitions = {}
+        for processing_func, message in messages:
+            partitions.setdefault(message["project_id"], []).append((processing_func, message))
+
+        metrics.timing("ingest_consumer.flush.partitions", len(partitions))
+
+        # Wait for all partitions before raising, so that no work of this
+        # batch is still running when the batch is retried.
+        futures = [
+            self._executor.submit(self._process_partition, partition, projects, batch_saves)
+            for partition in partitions.values()
+        ]
+        for future in futures:
+            future.exception()
+        for future in futures:
+            future.result()
+
+    def _process_partition(self, messages, projects, batch_saves):
+        if self._executor is not None:
+            mark_scope_as_unsafe()
+
+        if batch_saves:
+            # Events that are ready to be saved are collected and saved
+            # together per project.
+            with batch_save_events():
+                self._process_other_messages(messages, projects)
+        else:
+            self._process_other_messages(messages, projects)
+
+    def _process_other_messages(self, other_messages, projects):
+        # Consecutive events are processed together, so that their payloads
+        # are written to the processing store at once.
+        for processing_func, group in itertools.groupby(other_messages, key=lambda item: item[0]):
+            messages = [message for _, message in group]
+            if processing_func is process_event:
+                process_events(messages, projects=projects)
+            else:
+                for message in messages:
                     processing_func(message, projects=projects)
 
     def shutdown(self):
-        pass
+        if self._executor is not None:
+            self._executor.shutdown()
 
 
 def trace_func(**span_kwargs):
@@ -99,16 +170,8 @@ def trace_func(**span_kwargs):
     return wrapper
 
 
-@metrics.wraps("ingest_consumer.process_event")
-def _do_process_event(message, projects):
-    payload = message["payload"]
-    start_time = float(message["start_time"])
-    event_id = message["event_id"]
-    project_id = int(message["project_id"])
-    remote_addr = message.get("remote_addr")
-    attachments = message.get("attachments") or ()
-
-    # check that we haven't already processed this event (a previous instance of the forwarder
+def _do_process_events(messages, projects):
+    # check that we haven't already processed these events (a previous instance of the forwarder
     # died before it could commit the event queue offset)
     #
     # XXX(markus): I believe this code is extremely broken:
@@ -122,55 +185,82 @@ def _do_process_event(message, projects):
     # This code has been ripped from the old python store endpoint. We're
     # keeping it around because it does provide some protection against
     # reprocessing good events if a single consumer is in a restart loop.
-    deduplication_key = f"ev:{project_id}:{event_id}"
-    if cache.get(deduplication_key) is not None:
-        logger.warning(
-            "pre-process-forwarder detected a duplicated event" " with id:%s for project:%s.",
-            event_id,
-            project_id,
-        )
-        return  # message already processed do not reprocess
-
-    try:
-        project = projects[project_id]
-    except KeyError:
-        logger.error("Project for ingested event does not exist: %s", project_id)
+    deduplication_keys = [
+        f"ev:{message['project_id']}:{message['event_id']}" for message in messages
+    ]
+    processed_keys = set(cache.get_many(deduplication_keys))
+
+    pending = []
+    for message, deduplication_key in zip(messages, deduplication_keys):
+        event_id = message["event_id"]
+        project_id = int(message["project_id"])
+
+        if deduplication_key in processed_keys:
+            logger.warning(
+                "pre-process-forwarder detected a duplicated event" " with id:%s for project:%s.",
+                event_id,
+                project_id,
+            )
+            continue  # message already processed do not reprocess
+
+        try:
+            project = projects[project_id]
+        except KeyError:
+            logger.error("Project for ingested event does not exist: %s", project_id)
+            continue
+
+        # Parse the JSON payload. This is required to compute the cache key and
+        # call process_event. The payload will be put into Kafka raw, to avoid
+        # serializing it again.
+        # XXX: Do not use CanonicalKeyDict here. This may break preprocess_event
+        # which assumes that data passed in is a raw dictionary.
+        data = json.loads(message["payload"])
+
+        # Duplicates within the same batch are only processed once.
+        processed_keys.add(deduplication_key)
+        pending.append((message, project, data, deduplication_key))
+
+    if not pending:
         return
 
-    # Parse the JSON payload. This is required to compute the cache key and
-    # call process_event. The payload will be put into Kafka raw, to avoid
-    # serializing it again.
-    # XXX: Do not use CanonicalKeyDict here. This may break preprocess_event
-    # which assumes that data passed in is a raw dictionary.
-    data = json.loads(payload)
-
-    cache_key = event_processing_store.store(data)
-
-    if attachments:
-        attachment_objects = [
-            CachedAttachment(type=attachment.pop("attachment_type"), **attachment)
-            for attachment in attachments
-        ]
+    cache_keys = event_processing_store.store_many([data for _, _, data, _ in pending])
+
+    for (message, project, data, deduplication_key), cache_key in zip(pending, cache_keys):
+        start_time = float(message["start_time"])
+        event_id = message["event_id"]
+        remote_addr = message.get("remote_addr")
+        attachments = message.get("attachments") or ()
+
+        if attachments:
+            attachment_objects = [
+                CachedAttachment(type=attachment.pop("attachment_type"), **attachment)
+                for attachment in attachments
+            ]
+
+            attachment_cache.set(cache_key, attachments=attachment_objects, timeout=CACHE_TIMEOUT)
+
+        # Preprocess this event, which spawns either process_event or
+        # save_event. Pass data explicitly to avoid fetching it again from the
+        # cache.
+        with sentry_sdk.start_span(op="ingest_consumer.process_event.preprocess_event"):
+            preprocess_event(
+                cache_key=cache_key,
+                data=data,
+                start_time=start_time,
+                event_id=event_id,
+                project=project,
+            )
 
-        attachment_cache.set(cache_key, attachments=attachment_objects, timeout=CACHE_TIMEOUT)
+        # remember for an 1 hour that we saved this event (deduplication protection)
+        cache.set(deduplication_key, "", CACHE_TIMEOUT)
 
-    # Preprocess this event, which spawns either process_event or
-    # save_event. Pass data explicitly to avoid fetching it again from the
-    # cache.
-    with sentry_sdk.start_span(op="ingest_consumer.process_event.preprocess_event"):
-        preprocess_event(
-            cache_key=cache_key,
-            data=data,
-            start_time=start_time,
-            event_id=event_id,
-            project=project,
-        )
+        # emit event_accepted once everything is done
+        event_accepted.send_robust(ip=remote_addr, data=data, project=project, sender=process_event)
 
-    # remember for an 1 hour that we saved this event (deduplication protection)
-    cache.set(deduplication_key, "", CACHE_TIMEOUT)
 
-    # emit event_accepted once everything is done
-    event_accepted.send_robust(ip=remote_addr, data=data, project=project, sender=process_event)
+@metrics.wraps("ingest_consumer.process_event")
+def _do_process_event(message, projects):
+    _do_process_events([message], projects)
 
 
 @trace_func(name="ingest_consumer.process_event")
@@ -178,6 +268,17 @@ def process_event(message, projects):
     return _do_process_event(message, projects)
 
 
+@trace_func(name="ingest_consumer.process_events")
+@metrics.wraps("ingest_consumer.process_events")
+def process_events(messages, projects):
+    """
+    Processes several event messages, writing their payloads to the
+    processing store at once.
+    """
+    metrics.timing("ingest_consumer.process_events.batch_size", len(messages))
+    return _do_process_events(messages, projects)
+
+
 @trace_func(name="ingest_consumer.process_attachment_chunk")
 @metrics.wraps("ingest_consumer.process_attachment_chunk")
 def process_attachment_chunk(message, projects):
@@ -265,7 +366,7 @@ def process_userreport(message, projects):
         return False
 
 
-def get_ingest_consumer(consumer_types, once=False, **options):
+def get_ingest_consumer(consumer_types, once=False, concurrency=None, **options):
     """
     Handles events coming via a kafka queue.
 
@@ -273,5 +374,5 @@ def get_ingest_consumer(consumer_types, once=False, **options):
     """
     topic_names = {ConsumerType.get_topic_name(consumer_type) for consumer_type in consumer_types}
     return create_batching_kafka_consumer(
-        topic_names=topic_names, worker=IngestConsumerWorker(), **options
+        topic_names=topic_names, worker=IngestConsumerWorker(concurrency=concurrency), **options
     )
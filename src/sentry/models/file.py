@@ -1,19 +1,20 @@
 import os
 import mmap
+import bisect
 import tempfile
 import time
 
+from collections import OrderedDict
 from hashlib import sha1
 from uuid import uuid4
-from threading import Semaphore
 from concurrent.futures import ThreadPoolExecutor
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 
 from django.conf import settings
 from django.core.files.base import File as FileObj
 from django.core.files.base import ContentFile
 from django.core.files.storage import get_storage_class
-from django.db import models, transaction, IntegrityError
+from django.db import models, router, transaction, IntegrityError
 from django.utils import timezone
 
 from sentry.app import locks
@@ -31,6 +32,10 @@ DEFAULT_BLOB_SIZE = 1024 * 1024  # one mb
 CHUNK_STATE_HEADER = "__state"
 MULTI_BLOB_UPLOAD_CONCURRENCY = 8
 MAX_FILE_SIZE = 2 ** 31  # 2GB is the maximum offset supported by fileblob
+# Number of blobs a chunked file keeps open for reading when it is not
+# prefetched, so that seeking back and forth between a few regions of a large
+# file does not fetch the same blobs from the storage again.
+OPEN_BLOB_CACHE_SIZE = 4
 
 
 class nooplogger:
@@ -73,6 +78,33 @@ def _locked_blob(checksum, logger=nooplogger):
     logger.debug("_locked_blob.end", extra={"checksum": checksum})
 
 
+def _ensure_blobs_owned(blobs, organization):
+    owned = set(
+        FileBlobOwner.objects.filter(organization=organization, blob__in=blobs).values_list(
+            "blob_id", flat=True
+        )
+    )
+    owners = [
+        FileBlobOwner(organization=organization, blob=blob)
+        for blob in blobs
+        if blob.id not in owned
+    ]
+    if not owners:
+        return
+
+    try:
+        with transaction.atomic(using=router.db_for_write(FileBlobOwner)):
+            FileBlobOwner.objects.bulk_create(owners)
+    except IntegrityError:
+        # Some of the owners were created concurrently.
+        for owner in owners:
+            try:
+                with transaction.atomic(using=router.db_for_write(FileBlobOwner)):
+                    owner.save()
+            except IntegrityError:
+                pass
+
+
 class AssembleChecksumMismatch(Exception):
     pass
 
@@ -112,117 +144,91 @@ class FileBlob(Model):
         If both are provided then a checksum check is performed.
 
         If the checksums mismatch an `IOError` is raised.
+
+        Blobs that already exist are looked up with a single query and not
+        uploaded again, so an interrupted upload can be resumed by sending the
+        same files again.  The remaining blobs are written to the storage
+        concurrently and inserted into the database in bulk.
         """
         logger.debug("FileBlob.from_files.start")
 
-        files_with_checksums = []
+        # Before we go and do something with the files we calculate the
+        # checksums and compare them against the references.  This also
+        # deduplicates files uploaded more than once in the same request.
+        files_by_checksum = {}
         for fileobj in files:
             if isinstance(fileobj, tuple):
-                files_with_checksums.append(fileobj)
+                fileobj, reference_checksum = fileobj
             else:
-                files_with_checksums.append((fileobj, None))
+                reference_checksum = None
+
+            size, checksum = _get_size_and_checksum(fileobj)
+            if reference_checksum is not None and checksum != reference_checksum:
+                raise OSError("Checksum mismatch")
+            files_by_checksum.setdefault(checksum, (fileobj, size))
 
-        checksums_seen = set()
-        blobs_created = []
-        blobs_to_save = []
-        locks = set()
-        semaphore = Semaphore(value=MULTI_BLOB_UPLOAD_CONCURRENCY)
+        def _get_existing(checksums):
+            return {
+                blob.checksum: blob for blob in cls.objects.filter(checksum__in=list(checksums))
+            }
 
-        def _upload_and_pend_chunk(fileobj, size, checksum, lock):
+        def _upload(checksum):
+            fileobj, size = files_by_checksum[checksum]
             logger.debug(
-                "FileBlob.from_files._upload_and_pend_chunk.start",
-                extra={"checksum": checksum, "size": size},
+                "FileBlob.from_files._upload.start", extra={"checksum": checksum, "size": size}
             )
             blob = cls(size=size, checksum=checksum)
             blob.path = cls.generate_unique_path()
-            storage = get_storage()
-            storage.save(blob.path, fileobj)
-            blobs_to_save.append((blob, lock))
+            get_storage().save(blob.path, fileobj)
             metrics.timing("filestore.blob-size", size, tags={"function": "from_files"})
             logger.debug(
-                "FileBlob.from_files._upload_and_pend_chunk.end",
-                extra={"checksum": checksum, "path": blob.path},
+                "FileBlob.from_files._upload.end", extra={"checksum": checksum, "path": blob.path}
             )
+            return blob
+
+        blobs = _get_existing(files_by_checksum)
+        missing = sorted(set(files_by_checksum) - set(blobs))
+
+        with ExitStack() as stack:
+            if missing:
+                # Lock the missing blobs in a stable order, so that concurrent
+                # requests uploading overlapping sets of blobs cannot deadlock.
+                for checksum in missing:
+                    lock = locks.get(f"fileblob:upload:{checksum}", duration=UPLOAD_RETRY_TIME)
+                    stack.enter_context(
+                        TimedRetryPolicy(UPLOAD_RETRY_TIME, metric_instance="lock.fileblob.upload")(
+                            lock.acquire
+                        )
+                    )
 
-        def _ensure_blob_owned(blob):
-            if organization is None:
-                return
-            try:
-                with transaction.atomic():
-                    FileBlobOwner.objects.create(organization=organization, blob=blob)
-            except IntegrityError:
-                pass
+                # Blobs may have been created while we were waiting for the locks.
+                blobs.update(_get_existing(missing))
+                missing = [checksum for checksum in missing if checksum not in blobs]
 
-        def _save_blob(blob):
-            logger.debug("FileBlob.from_files._save_blob.start", extra={"path": blob.path})
-            blob.save()
-            _ensure_blob_owned(blob)
-            logger.debug("FileBlob.from_files._save_blob.end", extra={"path": blob.path})
+            if missing:
+                with ThreadPoolExecutor(max_workers=MULTI_BLOB_UPLOAD_CONCURRENCY) as exe:
+                    uploaded = list(exe.map(_upload, missing))
 
-        def _flush_blobs():
-            while True:
                 try:
-                    blob, lock = blobs_to_save.pop()
-                except IndexError:
-                    break
+                    with transaction.atomic(using=router.db_for_write(cls)):
+                        cls.objects.bulk_create(uploaded)
+                except IntegrityError:
+                    # Someone created some of the blobs without holding the
+                    # lock.  Fall back to saving them one by one.
+                    for blob in uploaded:
+                        try:
+                            with transaction.atomic(using=router.db_for_write(cls)):
+                                blob.save()
+                        except IntegrityError:
+                            blob = cls.objects.get(checksum=blob.checksum)
+                        blobs[blob.checksum] = blob
+                else:
+                    blobs.update((blob.checksum, blob) for blob in uploaded)
 
-                _save_blob(blob)
-                lock.__exit__(None, None, None)
-                locks.discard(lock)
-                semaphore.release()
+        if organization is not None:
+            _ensure_blobs_owned(list(blobs.values()), organization)
 
-        try:
-            with ThreadPoolExecutor(max_workers=MULTI_BLOB_UPLOAD_CONCURRENCY) as exe:
-                for fileobj, reference_checksum in files_with_checksums:
-                    logger.debug(
-                        "FileBlob.from_files.executor_start", extra={"checksum": reference_checksum}
-                    )
-                    _flush_blobs()
-
-                    # Before we go and do something with the files we calculate
-                    # the checksums and compare it against the reference.  This
-                    # also deduplicates duplicates uploaded in the same request.
-                    # This is necessary because we acquire multiple locks in one
-                    # go which would let us deadlock otherwise.
-                    size, checksum = _get_size_and_checksum(fileobj)
-                    if reference_checksum is not None and checksum != reference_checksum:
-                        raise OSError("Checksum mismatch")
-                    if checksum in checksums_seen:
-                        continue
-                    checksums_seen.add(checksum)
-
-                    # Check if we need to lock the blob.  If we get a result back
-                    # here it means the blob already exists.
-                    lock = _locked_blob(checksum, logger=logger)
-                    existing = lock.__enter__()
-                    if existing is not None:
-                        lock.__exit__(None, None, None)
-                        blobs_created.append(existing)
-                        _ensure_blob_owned(existing)
-                        continue
-
-                    # Remember the lock to force unlock all at the end if we
-                    # encounter any difficulties.
-                    locks.add(lock)
-
-                    # Otherwise we leave the blob locked and submit the task.
-                    # We use the semaphore to ensure we never schedule too
-                    # many.  The upload will be done with a certain amount
-                    # of concurrency controlled by the semaphore and the
-                    # `_flush_blobs` call will take all those uploaded
-                    # blobs and associate them with the database.
-                    semaphore.acquire()
-                    exe.submit(_upload_and_pend_chunk(fileobj, size, checksum, lock))
-                    logger.debug("FileBlob.from_files.end", extra={"checksum": reference_checksum})
-
-            _flush_blobs()
-        finally:
-            for lock in locks:
-                try:
-                    lock.__exit__(None, None, None)
-                except Exception:
-                    pass
-            logger.debug("FileBlob.from_files.end")
+        logger.debug("FileBlob.from_files.end")
 
     @classmethod
     def from_file(cls, fileobj, logger=nooplogger):
@@ -468,8 +474,11 @@ class ChunkedFileBlobIndexWrapper:
     def __init__(self, indexes, mode=None, prefetch=False, prefetch_to=None, delete=True):
         # eager load from database incase its a queryset
         self._indexes = list(indexes)
+        self._offsets = [idx.offset for idx in self._indexes]
+        self._blobfiles = OrderedDict()
         self._curfile = None
         self._curidx = None
+        self._curpos = None
         if prefetch:
             self.prefetched = True
             self._prefetch(prefetch_to, delete)
@@ -493,19 +502,32 @@ class ChunkedFileBlobIndexWrapper:
         rv.seek(0)
         return rv
 
-    def _nextidx(self):
+    def _getblobfile(self, pos):
+        # Recently read blobs stay open, least recently used ones are closed.
+        f = self._blobfiles.pop(pos, None)
+        if f is None:
+            if len(self._blobfiles) >= OPEN_BLOB_CACHE_SIZE:
+                self._blobfiles.popitem(last=False)[1].close()
+            f = self._indexes[pos].blob.getfile()
+        self._blobfiles[pos] = f
+        return f
+
+    def _setidx(self, pos):
         assert not self.prefetched, "this makes no sense"
-        old_file = self._curfile
-        try:
-            try:
-                self._curidx = next(self._idxiter)
-                self._curfile = self._curidx.blob.getfile()
-            except StopIteration:
-                self._curidx = None
-                self._curfile = None
-        finally:
-            if old_file is not None:
-                old_file.close()
+        if pos < len(self._indexes):
+            self._curpos = pos
+            self._curidx = self._indexes[pos]
+            self._curfile = self._getblobfile(pos)
+        else:
+            self._curpos = None
+            self._curidx = None
+            self._curfile = None
+
+    def _nextidx(self):
+        self._setidx(self._curpos + 1)
+        # The blob might have been read from before.
+        if self._curfile is not None:
+            self._curfile.seek(0)
 
     @property
     def size(self):
@@ -546,10 +568,15 @@ class ChunkedFileBlobIndexWrapper:
         self._curfile = f
 
     def close(self):
-        if self._curfile:
+        # Outside of prefetch mode the current file is one of the open blobs.
+        if self._curfile and self.prefetched:
             self._curfile.close()
+        for f in self._blobfiles.values():
+            f.close()
+        self._blobfiles.clear()
         self._curfile = None
         self._curidx = None
+        self._curpos = None
         self.closed = True
 
     def seek(self, pos):
@@ -565,14 +592,12 @@ class ChunkedFileBlobIndexWrapper:
             # Empty file, there's no seeking to be done.
             return
 
-        for n, idx in enumerate(self._indexes[::-1]):
-            if idx.offset <= pos:
-                if idx != self._curidx:
-                    self._idxiter = iter(self._indexes[-(n + 1) :])
-                    self._nextidx()
-                break
-        else:
+        # Only the blob containing the position is fetched.
+        n = bisect.bisect_right(self._offsets, pos) - 1
+        if n < 0:
             raise ValueError("Cannot seek to pos")
+        if n != self._curpos:
+            self._setidx(n)
         self._curfile.seek(pos - self._curidx.offset)
 
     def tell(self):
@@ -8,7 +8,7 @@ from django.utils import timezone
 
 from sentry.db.models import Model, sane_repr
 from sentry.db.models.fields import FlexibleForeignKey, JSONField
-from sentry.ownership.grammar import load_schema
+from sentry.ownership.grammar import load_compiled_schema
 from sentry.utils import metrics
 from sentry.utils.cache import cache
 from functools import reduce
@@ -100,7 +100,7 @@ class ProjectOwnership(Model):
         codeowners = ProjectCodeOwners.get_codeowners_cached(project_id)
         ownership.schema = cls.get_combined_schema(ownership, codeowners)
 
-        rules = cls._matching_ownership_rules(ownership, project_id, data)
+        rules = cls._matching_ownership_rules(ownership, codeowners, data)
 
         if not rules:
             return cls.Everyone if ownership.fallthrough else [], None
@@ -139,7 +139,7 @@ class ProjectOwnership(Model):
 
             ownership.schema = cls.get_combined_schema(ownership, codeowners)
 
-            rules = cls._matching_ownership_rules(ownership, project_id, data)
+            rules = cls._matching_ownership_rules(ownership, codeowners, data)
             if not rules:
                 return ownership.auto_assignment, []
 
@@ -163,14 +163,19 @@ class ProjectOwnership(Model):
             return ownership.auto_assignment, ActorTuple.resolve_many(actors)
 
     @classmethod
-    def _matching_ownership_rules(cls, ownership, project_id, data):
-        rules = []
-        if ownership.schema is not None:
-            for rule in load_schema(ownership.schema):
-                if rule.test(data):
-                    rules.append(rule)
-
-        return rules
+    def _matching_ownership_rules(cls, ownership, codeowners, data):
+        if ownership.schema is None:
+            return []
+
+        # The combined schema changes whenever either of the rows it is built
+        # from is saved, which bumps their timestamps.
+        version = (
+            ownership.id,
+            ownership.last_updated if ownership.id else None,
+            codeowners.id if codeowners else None,
+            codeowners.date_updated if codeowners else None,
+        )
+        return load_compiled_schema(ownership.schema, version).get_matching_rules(data)
 
 
 def resolve_actors(owners, project_id):
@@ -3,7 +3,7 @@ import struct
 import zlib
 from datetime import timedelta
 from threading import Lock
-from typing import Iterator, Optional, Sequence, Tuple
+from typing import Iterator, Mapping, Optional, Sequence, Tuple
 
 import sentry_sdk
 import zstandard
@@ -159,9 +159,31 @@ class BigtableKVStorage:
         return _decompress_data(data, flags)
 
     def set(self, key: str, value: bytes, ttl: Optional[timedelta] = None) -> None:
+        row = self.__encode_row(self._get_table(), key, value, ttl)
+
+        status = row.commit()
+        if status.code != 0:
+            raise BigtableError(status.code, status.message)
+
+    def set_many(self, items: Mapping[str, bytes], ttl: Optional[timedelta] = None) -> None:
+        table = self._get_table()
+
+        rows = [self.__encode_row(table, key, value, ttl) for key, value in items.items()]
+        if not rows:
+            return
+
+        errors = []
+        for status in table.mutate_rows(rows):
+            if status.code != 0:
+                errors.append(BigtableError(status.code, status.message))
+
+        if errors:
+            raise BigtableError(errors)
+
+    def __encode_row(self, table: Table, key: str, value: bytes, ttl: Optional[timedelta]):
         # XXX: There is a type mismatch here -- ``direct_row`` expects
         # ``bytes`` but we are providing it with ``str``.
-        row = self._get_table().direct_row(key)
+        row = table.direct_row(key)
         # Call to delete is just a state mutation,
         # and in this case is just used to clear all columns
         # so the entire row will be replaced. Otherwise,
@@ -214,9 +236,7 @@ class BigtableKVStorage:
 
         row.set_cell(self.column_family, self.data_column, data, timestamp=ts)
 
-        status = row.commit()
-        if status.code != 0:
-            raise BigtableError(status.code, status.message)
+        return row
 
     def delete(self, key: str) -> None:
         # XXX: There is a type mismatch here -- ``direct_row`` expects
@@ -327,6 +347,17 @@ class BigtableNodeStorage(NodeStorage):
     def _set_bytes(self, id, data, ttl=None):
         self.store.set(id, data, ttl)
 
+    def _set_bytes_multi(self, items, ttl=None):
+        with sentry_sdk.start_span(op="nodestore.bigtable.set_multi") as span:
+            span.set_tag("num_ids", len(items))
+
+            if len(items) == 1:
+                ((id, data),) = items.items()
+                self._set_bytes(id, data, ttl)
+                return
+
+            self.store.set_many(items, ttl)
+
     def delete(self, id):
         if self.skip_deletes:
             return
@@ -0,0 +1,136 @@
+"""
+Compression codecs for nodestore payloads.
+
+Payloads compressed by a codec are prefixed with a header byte identifying the
+codec, so that the codec can be changed without rewriting existing data.
+Payloads written before codecs were introduced are plain zlib streams. Those
+never start with one of the header bytes (the first byte of a zlib stream
+always has its lower four bits set to 8) and are still decompressed as such.
+"""
+import os
+import zlib
+
+import zstandard
+
+DICTIONARY_SUFFIX = ".dict"
+
+
+class Codec:
+    #: The name the codec is selected with in the nodestore options.
+    name = None
+
+    #: The byte compressed payloads of this codec are prefixed with.
+    header = None
+
+    def compress(self, data, platform=None):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    header = b"\x01"
+
+    def compress(self, data, platform=None):
+        return zlib.compress(data)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    """
+    Compresses payloads with zstd, using the dictionary trained for the
+    platform of the payload if there is one.
+
+    The id of the dictionary is stored in the zstd frame header, so the
+    dictionary of a platform can be replaced by a newly trained one as long as
+    the old dictionary is kept around for reading.
+    """
+
+    name = "zstd"
+    header = b"\x02"
+
+    def __init__(self, dictionaries=None, level=3):
+        self.level = level
+        # platform -> dictionary
+        self.dictionaries = {}
+        # dictionary id -> dictionary
+        self.dictionaries_by_id = {}
+
+        for platform, dictionary in (dictionaries or {}).items():
+            self.dictionaries[platform] = dictionary
+            self.dictionaries_by_id[dictionary.dict_id()] = dictionary
+
+    def compress(self, data, platform=None):
+        dictionary = self.dictionaries.get(platform)
+        return zstandard.ZstdCompressor(level=self.level, dict_data=dictionary).compress(data)
+
+    def decompress(self, data):
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        if dict_id:
+            try:
+                dictionary = self.dictionaries_by_id[dict_id]
+            except KeyError:
+                raise ValueError(f"unknown zstd dictionary: {dict_id}")
+        else:
+            dictionary = None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+
+
+class CodecRegistry:
+    """
+    Compresses payloads with the configured codec, and decompresses payloads
+    of any known codec.
+
+    :param codec: The name of the codec to compress with. If ``None``,
+        payloads are written as plain zlib streams without a header byte,
+        which is readable by versions of Sentry that do not know about
+        codecs.
+    :param dictionaries: Mapping of platform to zstd dictionary, see
+        ``load_dictionaries``.
+    """
+
+    def __init__(self, codec=None, dictionaries=None):
+        codecs = [ZlibCodec(), ZstdCodec(dictionaries)]
+
+        self.codecs = {c.name: c for c in codecs}
+        self.codecs_by_header = {c.header: c for c in codecs}
+
+        if codec is not None and codec not in self.codecs:
+            raise ValueError(f"invalid nodestore compression codec: {codec!r}")
+        self.codec = codec
+
+    def compress(self, data, platform=None):
+        if self.codec is None:
+            return zlib.compress(data)
+
+        codec = self.codecs[self.codec]
+        return codec.header + codec.compress(data, platform=platform)
+
+    def decompress(self, data):
+        codec = self.codecs_by_header.get(data[:1])
+        if codec is None:
+            return zlib.decompress(data)
+
+        return codec.decompress(data[1:])
+
+
+def load_dictionaries(path):
+    """
+    Loads the zstd dictionaries that are stored as ``<platform>.dict`` files
+    in the directory at ``path``, as written by ``sentry nodestore
+    train-dictionaries``.
+    """
+    dictionaries = {}
+    for filename in os.listdir(path):
+        if not filename.endswith(DICTIONARY_SUFFIX):
+            continue
+
+        platform = filename[: -len(DICTIONARY_SUFFIX)]
+        with open(os.path.join(path, filename), "rb") as f:
+            dictionaries[platform] = zstandard.ZstdCompressionDict(f.read())
+
+    return dictionaries
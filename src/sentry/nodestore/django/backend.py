@@ -1,27 +1,64 @@
+import base64
 import math
 import logging
 import pickle
 
+from django.db import connections, router
 from django.utils import timezone
 
 from sentry.db.models import create_or_update
 from sentry.nodestore.base import NodeStorage
-from sentry.utils.strings import decompress, compress
+from sentry.nodestore.compression import CodecRegistry, load_dictionaries
 
 from .models import Node
 
 logger = logging.getLogger("sentry")
 
 
+def _to_text(data):
+    # The Django ORM works with unicode rather than bytes.
+    return base64.b64encode(data).decode("utf-8")
+
+
 class DjangoNodeStorage(NodeStorage):
+    """
+    A Postgres-based backend for storing node data.
+
+    :param compression: The codec to compress nodes with, ``"zlib"`` or
+        ``"zstd"``. By default nodes are stored in the format used before
+        codecs were introduced. Nodes written with any codec can be read
+        regardless of this setting.
+    :param dictionary_path: A directory with zstd dictionaries per platform,
+        as written by ``sentry nodestore train-dictionaries``.
+
+    >>> DjangoNodeStorage(
+    ...     compression='zstd',
+    ...     dictionary_path='/etc/sentry/nodestore-dictionaries',
+    ... )
+    """
+
+    def __init__(self, compression=None, dictionary_path=None):
+        dictionaries = load_dictionaries(dictionary_path) if dictionary_path else None
+        self.codecs = CodecRegistry(compression, dictionaries)
+
     def delete(self, id):
         Node.objects.filter(id=id).delete()
         self._delete_cache_item(id)
 
+    def _encode(self, data):
+        # Compression is part of the encoding rather than ``_set_bytes``, as the
+        # platform of the node selects the compression dictionary.
+        node = data.get(None)
+        platform = node.get("platform") if isinstance(node, dict) else None
+        return self.codecs.compress(NodeStorage._encode(self, data), platform=platform)
+
     def _decode(self, value, subkey):
         if value is None:
             return None
 
+        # Codec errors are raised rather than cached as an empty node.
+        value = self.codecs.decompress(value)
+
         try:
             if value.startswith(b"{"):
                 return NodeStorage._decode(self, value, subkey=subkey)
@@ -37,19 +74,43 @@ class DjangoNodeStorage(NodeStorage):
     def _get_bytes(self, id):
         try:
             data = Node.objects.get(id=id).data
-            return decompress(data)
+            return base64.b64decode(data)
         except Node.DoesNotExist:
             return None
 
     def _get_bytes_multi(self, id_list):
-        return {n.id: decompress(n.data) for n in Node.objects.filter(id__in=id_list)}
+        return {n.id: base64.b64decode(n.data) for n in Node.objects.filter(id__in=id_list)}
 
     def delete_multi(self, id_list):
         Node.objects.filter(id__in=id_list).delete()
         self._delete_cache_items(id_list)
 
     def _set_bytes(self, id, data, ttl=None):
-        create_or_update(Node, id=id, values={"data": compress(data), "timestamp": timezone.now()})
+        create_or_update(Node, id=id, values={"data": _to_text(data), "timestamp": timezone.now()})
+
+    def _set_bytes_multi(self, items, ttl=None):
+        if not items:
+            return
+
+        # A single ``INSERT ... ON CONFLICT`` statement replaces the
+        # update-then-insert roundtrips of ``create_or_update`` per node.
+        timestamp = timezone.now()
+        params = []
+        for id, data in items.items():
+            params.extend((id, _to_text(data), timestamp))
+
+        table = Node._meta.db_table
+        values = ", ".join(["(%s, %s, %s)"] * len(items))
+        connection = connections[router.db_for_write(Node)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (id, data, timestamp) VALUES {values}
+                ON CONFLICT (id) DO UPDATE
+                SET data = EXCLUDED.data, timestamp = EXCLUDED.timestamp
+                """,
+                params,
+            )
 
     def cleanup(self, cutoff_timestamp):
         from sentry.db.deletion import BulkDeleteQuery
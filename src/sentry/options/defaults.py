@@ -223,6 +223,10 @@ register("store.lie-about-filter-status", default=False)
 # (``False``) and spawning a save_event task (``True``).
 register("store.transactions-celery", default=False)  # unused
 
+# Collect the events of an ingest consumer batch that are ready to be saved and
+# save them with one save_event_many task per project.
+register("store.save-event-batching", default=False)
+
 # Symbolicator refactors
 # - Disabling minidump stackwalking in endpoints
 register("symbolicator.minidump-refactor-projects-opt-in", type=Sequence, default=[])  # unused
@@ -242,6 +246,10 @@ register("store.use-rust-data-scrubber", default=False)  # unused
 register("post-process.use-error-hook-sampling", default=False)  # unused
 # From 0.0 to 1.0: Randomly enqueue process_resource_change task
 register("post-process.error-hook-sample-rate", default=0.0)  # unused
+# Seconds to coalesce the post-processing of events of an existing group for.
+# The events of a group that arrive within the window are post-processed by a
+# single task, which does the work they share only once. 0 disables coalescing.
+register("post-process.coalesce-window", default=0.0)
 
 # Transaction events
 # True => kill switch to disable ingestion of transaction events for internal project.
@@ -1,14 +1,29 @@
 import re
-from collections import namedtuple
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
 from parsimonious.grammar import Grammar, NodeVisitor
 from parsimonious.exceptions import ParseError  # noqa
 from sentry.utils.safe import get_path
 from sentry.utils.glob import glob_match
 
-__all__ = ("parse_rules", "dump_schema", "load_schema")
+__all__ = ("parse_rules", "dump_schema", "load_schema", "load_compiled_schema")
 
 VERSION = 1
 
+# The number of compiled schemas kept per process, see `load_compiled_schema`.
+COMPILED_SCHEMA_CACHE_SIZE = 100
+
+_compiled_schemas = OrderedDict()
+_compiled_schemas_lock = threading.Lock()
+
+# Characters with a special meaning in glob patterns. Everything before the
+# first and after the last of them is matched literally.
+GLOB_SPECIAL_CHARS = re.compile(r"[*?\[\]{}\\]")
+
+# The frame attributes matchers of a type are tested against, in order of
+# preference, see `Matcher.test_frames`.
+FRAME_KEYS = {"path": ("filename", "abs_path"), "module": ("module",)}
+
 # Grammar is defined in EBNF syntax.
 ownership_grammar = Grammar(
     r"""
@@ -88,10 +103,8 @@ class Matcher(namedtuple("Matcher", "type pattern")):
     def test(self, data):
         if self.type == "url":
             return self.test_url(data)
-        elif self.type == "path":
-            return self.test_frames(data, ["filename", "abs_path"])
-        elif self.type == "module":
-            return self.test_frames(data, ["module"])
+        elif self.type in FRAME_KEYS:
+            return self.test_frames(data, FRAME_KEYS[self.type])
         elif self.type.startswith("tags."):
             return self.test_tag(data)
         return False
@@ -105,16 +118,19 @@ class Matcher(namedtuple("Matcher", "type pattern")):
 
     def test_frames(self, data, keys):
         for frame in _iter_frames(data):
-            value = next((frame.get(key) for key in keys if frame.get(key)), None)
+            value = _get_frame_value(frame, keys)
 
             if not value:
                 continue
 
-            if glob_match(value, self.pattern, ignorecase=True, path_normalize=True):
+            if self.test_frame_value(value):
                 return True
 
         return False
 
+    def test_frame_value(self, value):
+        return glob_match(value, self.pattern, ignorecase=True, path_normalize=True)
+
     def test_tag(self, data):
         tag = self.type[5:]
         for k, v in get_path(data, "tags", filter=True) or ():
@@ -216,6 +232,183 @@ def _iter_frames(data):
             continue
 
 
+def _get_frame_value(frame, keys):
+    return next((frame.get(key) for key in keys if frame.get(key)), None)
+
+
+def _is_ascii(value):
+    try:
+        value.encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _normalize_value(value):
+    # Lowercased and with backslashes replaced like `glob_match` does it for
+    # case insensitive path matches. Non-ASCII values cannot be normalized, as
+    # Unicode case folding does not agree with `str.lower` everywhere.
+    if not _is_ascii(value):
+        return None
+    return value.replace("\\", "/").lower()
+
+
+def _get_literal_affixes(pattern):
+    """Returns the literal prefix and suffix every value matched by the given
+    case insensitive pattern starts and ends with after `_normalize_value`, or
+    `None` if they are not known.
+    """
+    if "\\" in pattern or not _is_ascii(pattern):
+        return None
+    pattern = pattern.lower()
+
+    matches = [m.start() for m in GLOB_SPECIAL_CHARS.finditer(pattern)]
+    if not matches:
+        return pattern, pattern
+
+    prefix, suffix = pattern[: matches[0]], pattern[matches[-1] + 1 :]
+    # `**` next to a slash can match no directory at all, and the slash along
+    # with it, e.g. `**/foo.py` matches `foo.py`.
+    if prefix.endswith("/") and pattern[matches[0] :].startswith("**"):
+        prefix = prefix[:-1]
+    if suffix.startswith("/") and pattern[: matches[-1] + 1].endswith("**"):
+        suffix = suffix[1:]
+    return prefix, suffix
+
+
+class _AffixIndex:
+    """
+    Finds the items of case insensitive patterns that could match a value by
+    the literal prefix or suffix of the patterns, without comparing the value
+    to every pattern.
+
+    Items are returned as candidates only: they still have to be tested
+    against the value, but no item that is not returned can match it.
+    """
+
+    def __init__(self):
+        self.by_prefix = defaultdict(list)
+        self.by_suffix = defaultdict(list)
+        # The distinct lengths of the affixes, computed on first use
+        self.prefix_lengths = None
+        self.suffix_lengths = None
+        # Items whose patterns could match any value
+        self.unindexed = []
+        self.items = []
+
+    def add(self, pattern, item):
+        self.items.append(item)
+        affixes = _get_literal_affixes(pattern)
+        if affixes is None:
+            self.unindexed.append(item)
+            return
+
+        prefix, suffix = affixes
+        if prefix:
+            self.by_prefix[prefix].append((suffix, item))
+            self.prefix_lengths = None
+        elif suffix:
+            self.by_suffix[suffix].append((prefix, item))
+            self.suffix_lengths = None
+        else:
+            self.unindexed.append(item)
+
+    def get_candidates(self, value):
+        normalized = _normalize_value(value)
+        if normalized is None:
+            return self.items
+
+        if self.prefix_lengths is None:
+            self.prefix_lengths = sorted({len(prefix) for prefix in self.by_prefix})
+        if self.suffix_lengths is None:
+            self.suffix_lengths = sorted({len(suffix) for suffix in self.by_suffix})
+
+        candidates = list(self.unindexed)
+        for length in self.prefix_lengths:
+            if length > len(normalized):
+                break
+            for suffix, item in self.by_prefix.get(normalized[:length], ()):
+                if normalized.endswith(suffix):
+                    candidates.append(item)
+
+        for length in self.suffix_lengths:
+            if length > len(normalized):
+                break
+            candidates.extend(
+                item for _, item in self.by_suffix.get(normalized[len(normalized) - length :], ())
+            )
+
+        return candidates
+
+
+class CompiledRules:
+    """
+    Finds the rules of an ownership schema that match an event, without
+    testing every rule against the event.
+
+    Path and module rules are indexed by the literal prefix or suffix of their
+    patterns, so that the frames of an event are only tested against the
+    rules they could match. Tag rules are looked up by the tags of the event,
+    and URL rules by the URL of its request.
+
+    The rules found are exactly the ones `Rule.test` matches, in their
+    original order.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.frame_indexes = {matcher_type: _AffixIndex() for matcher_type in FRAME_KEYS}
+        self.url_index = _AffixIndex()
+        self.rules_by_tag = defaultdict(list)
+
+        for idx, rule in enumerate(rules):
+            matcher = rule.matcher
+            if matcher.type in FRAME_KEYS:
+                self.frame_indexes[matcher.type].add(matcher.pattern, idx)
+            elif matcher.type == "url":
+                self.url_index.add(matcher.pattern, idx)
+            elif matcher.type.startswith("tags."):
+                self.rules_by_tag[matcher.type[5:]].append(idx)
+            # Other matchers never match, see `Matcher.test`
+
+    def get_matching_rules(self, data):
+        matched = set()
+
+        for matcher_type, index in self.frame_indexes.items():
+            if not index.items:
+                continue
+
+            keys = FRAME_KEYS[matcher_type]
+            seen = set()
+            for frame in _iter_frames(data):
+                value = _get_frame_value(frame, keys)
+                if not value or value in seen:
+                    continue
+                seen.add(value)
+
+                for idx in index.get_candidates(value):
+                    if idx not in matched and self.rules[idx].matcher.test_frame_value(value):
+                        matched.add(idx)
+
+        if self.url_index.items:
+            try:
+                url = data["request"]["url"]
+            except KeyError:
+                url = None
+            if url:
+                for idx in self.url_index.get_candidates(url):
+                    if self.rules[idx].test(data):
+                        matched.add(idx)
+
+        if self.rules_by_tag:
+            for tag in {k for k, _ in get_path(data, "tags", filter=True) or ()}:
+                for idx in self.rules_by_tag.get(tag, ()):
+                    if self.rules[idx].test(data):
+                        matched.add(idx)
+
+        return [self.rules[idx] for idx in sorted(matched)]
+
+
 def parse_rules(data):
     """Convert a raw text input into a Rule tree"""
     tree = ownership_grammar.parse(data)
@@ -234,6 +427,29 @@ def load_schema(schema):
     return [Rule.load(r) for r in schema["rules"]]
 
 
+def load_compiled_schema(schema, version=None):
+    """Convert a JSON schema into `CompiledRules`.
+
+    If a `version` is given, the compiled rules are cached per process by it,
+    so it has to change whenever the schema does.
+    """
+    if version is None:
+        return CompiledRules(load_schema(schema))
+
+    with _compiled_schemas_lock:
+        compiled = _compiled_schemas.get(version)
+        if compiled is not None:
+            _compiled_schemas.move_to_end(version)
+            return compiled
+
+    compiled = CompiledRules(load_schema(schema))
+    with _compiled_schemas_lock:
+        _compiled_schemas[version] = compiled
+        while len(_compiled_schemas) > COMPILED_SCHEMA_CACHE_SIZE:
+            _compiled_schemas.popitem(last=False)
+    return compiled
+
+
 def parse_code_owners(data):
     """Parse a CODEOWNERS text and returns the list of team names, list of usernames"""
     teams = []
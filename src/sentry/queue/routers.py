@@ -6,6 +6,7 @@ COUNTER_TASKS = {"sentry.tasks.process_buffer.process_incr"}
 
 TRIGGER_TASKS = {
     "sentry.tasks.post_process.post_process_group",
+    "sentry.tasks.post_process.post_process_group_batch",
     "sentry.tasks.post_process.plugin_post_process_group",
 }
 
@@ -1,3 +1,4 @@
+import logging
 import re
 
 from datetime import timedelta
@@ -9,6 +10,8 @@ from sentry.receivers.rules import DEFAULT_RULE_LABEL
 from sentry.rules.conditions.base import EventCondition
 from sentry.utils import metrics
 
+logger = logging.getLogger("sentry.rules")
+
 intervals = {
     "1m": ("one minute", timedelta(minutes=1)),
     "1h": ("one hour", timedelta(hours=1)),
@@ -30,6 +33,41 @@ class EventFrequencyForm(forms.Form):
     value = forms.IntegerField(widget=forms.TextInput())
 
 
+class FrequencyQueryBatch:
+    """
+    Collects the TSDB queries of the frequency conditions of all rules that
+    are evaluated for an event, so that they can be sent to the TSDB backend
+    in one request. Identical queries of different rules are only made once,
+    which is why all conditions of a batch share the same end of their
+    window.
+    """
+
+    def __init__(self, tsdb=tsdb):
+        self.tsdb = tsdb
+        self.end = timezone.now()
+        self.results = {}
+        self.pending = []
+
+    def add(self, query):
+        if query not in self.results and query not in self.pending:
+            self.pending.append(query)
+
+    def execute(self):
+        queries, self.pending = self.pending, []
+        if not queries:
+            return
+
+        try:
+            totals = self.tsdb.get_totals_multi(queries, use_cache=True)
+        except Exception:
+            # The conditions query the TSDB on their own instead.
+            logger.exception("rules.conditions.frequency_batch_failed")
+            return
+
+        self.results.update(zip(queries, totals))
+        metrics.timing("rules.conditions.frequency_batch_size", len(queries))
+
+
 class BaseEventFrequencyCondition(EventCondition):
     form_cls = EventFrequencyForm
     form_fields = {
@@ -50,9 +88,29 @@ class BaseEventFrequencyCondition(EventCondition):
 
     def __init__(self, *args, **kwargs):
         self.tsdb = kwargs.pop("tsdb", tsdb)
+        self.query_batch = kwargs.pop("query_batch", None)
 
         super().__init__(*args, **kwargs)
 
+    def add_to_batch(self, event):
+        """
+        Adds the query this condition would make for the event to the query
+        batch of the condition.
+        """
+        interval = self.get_option("interval")
+        try:
+            int(self.get_option("value"))
+        except (TypeError, ValueError):
+            return
+
+        if interval not in intervals:
+            return
+
+        start, end = self.get_window(interval)
+        query = self.get_totals_query(event, start, end, self.rule.environment_id)
+        if query is not None:
+            self.query_batch.add(query)
+
     def passes(self, event, state):
         interval = self.get_option("interval")
         try:
@@ -68,7 +126,14 @@ class BaseEventFrequencyCondition(EventCondition):
         return current_value > value
 
     def query(self, event, start, end, environment_id):
-        query_result = self.query_hook(event, start, end, environment_id)
+        query = None
+        if self.query_batch is not None:
+            query = self.get_totals_query(event, start, end, environment_id)
+
+        if query is not None and query in self.query_batch.results:
+            query_result = self.query_batch.results[query]
+        else:
+            query_result = self.query_hook(event, start, end, environment_id)
         metrics.incr(
             "rules.conditions.queried_snuba",
             tags={
@@ -82,10 +147,21 @@ class BaseEventFrequencyCondition(EventCondition):
         """"""
         raise NotImplementedError  # subclass must implement
 
-    def get_rate(self, event, interval, environment_id):
+    def get_totals_query(self, event, start, end, environment_id):
+        """
+        Returns the query for ``BaseTSDB.get_totals_multi`` that is
+        equivalent to ``query_hook``, or ``None`` if it cannot be batched.
+        """
+        return None
+
+    def get_window(self, interval):
         _, duration = intervals[interval]
-        end = timezone.now()
-        return self.query(event, end - duration, end, environment_id=environment_id)
+        end = self.query_batch.end if self.query_batch is not None else timezone.now()
+        return end - duration, end
+
+    def get_rate(self, event, interval, environment_id):
+        start, end = self.get_window(interval)
+        return self.query(event, start, end, environment_id=environment_id)
 
     @property
     def is_guessed_to_be_created_on_project_creation(self):
@@ -112,6 +188,9 @@ class EventFrequencyCondition(BaseEventFrequencyCondition):
             use_cache=True,
         )[event.group_id]
 
+    def get_totals_query(self, event, start, end, environment_id):
+        return ("get_sums", self.tsdb.models.group, event.group_id, start, end, environment_id)
+
 
 class EventUniqueUserFrequencyCondition(BaseEventFrequencyCondition):
     label = "The issue is seen by more than {value} users in {interval}"
@@ -125,3 +204,13 @@ class EventUniqueUserFrequencyCondition(BaseEventFrequencyCondition):
             environment_id=environment_id,
             use_cache=True,
         )[event.group_id]
+
+    def get_totals_query(self, event, start, end, environment_id):
+        return (
+            "get_distinct_counts_totals",
+            self.tsdb.models.users_affected_by_group,
+            event.group_id,
+            start,
+            end,
+            environment_id,
+        )
@@ -3,12 +3,17 @@ import logging
 from collections import namedtuple
 from datetime import timedelta
 from django.core.cache import cache
+from django.db import IntegrityError, router, transaction
 from django.utils import timezone
 from random import randrange
 
 from sentry import analytics
 from sentry.models import GroupRuleStatus, Rule
 from sentry.rules import EventState, rules
+from sentry.rules.conditions.event_frequency import (
+    BaseEventFrequencyCondition,
+    FrequencyQueryBatch,
+)
 from sentry.utils.hashlib import hash_values
 from sentry.utils.safe import safe_execute
 
@@ -18,7 +23,23 @@ RuleFuture = namedtuple("RuleFuture", ["rule", "kwargs"])
 class RuleProcessor:
     logger = logging.getLogger("sentry.rules")
 
-    def __init__(self, event, is_new, is_regression, is_new_group_environment, has_reappeared):
+    def __init__(
+        self,
+        event,
+        is_new,
+        is_regression,
+        is_new_group_environment,
+        has_reappeared,
+        rule_statuses=None,
+    ):
+        """
+        :param rule_statuses: a dict of rule id to `GroupRuleStatus` of the
+            group, shared between the processors of several events of the
+            group. Statuses that are missing are loaded and added to it. A
+            status that is outdated because the rule fired in another process
+            only costs the evaluation of the rule, as firing it updates the
+            status conditionally.
+        """
         self.event = event
         self.group = event.group
         self.project = event.project
@@ -28,7 +49,9 @@ class RuleProcessor:
         self.is_new_group_environment = is_new_group_environment
         self.has_reappeared = has_reappeared
 
+        self.rule_statuses = rule_statuses
         self.grouped_futures = {}
+        self.query_batch = None
 
     def get_rules(self):
         """
@@ -38,15 +61,85 @@ class RuleProcessor:
         """
         return Rule.get_for_project(self.project.id)
 
+    def _get_rule_status_cache_key(self, rule_id):
+        return "grouprulestatus:1:%s" % hash_values([self.group.id, rule_id])
+
+    def _fetch_rule_statuses(self, rule_ids):
+        return {
+            status.rule_id: status
+            for status in GroupRuleStatus.objects.filter(group=self.group, rule_id__in=rule_ids)
+        }
+
+    def get_rule_statuses(self, rules):
+        """
+        Get the `GroupRuleStatus` of this group for each of the given rules,
+        creating the ones that do not exist yet.
+
+        Statuses are read from the cache in one go, the missing ones are
+        fetched from the DB with a single query, and rules without a status
+        get theirs with a single bulk insert.
+
+        :return: a dict of rule id to `GroupRuleStatus`
+        """
+        if self.rule_statuses is not None:
+            statuses = {
+                rule.id: self.rule_statuses[rule.id]
+                for rule in rules
+                if rule.id in self.rule_statuses
+            }
+            missing_rules = [rule for rule in rules if rule.id not in statuses]
+            if missing_rules:
+                statuses.update(self._get_rule_statuses(missing_rules))
+                self.rule_statuses.update(statuses)
+            return statuses
+
+        return self._get_rule_statuses(rules)
+
+    def _get_rule_statuses(self, rules):
+        cache_keys = {rule.id: self._get_rule_status_cache_key(rule.id) for rule in rules}
+        cached = cache.get_many(list(cache_keys.values()))
+
+        statuses = {}
+        missing_rule_ids = []
+        for rule_id, key in cache_keys.items():
+            if cached.get(key) is not None:
+                statuses[rule_id] = cached[key]
+            else:
+                missing_rule_ids.append(rule_id)
+
+        if not missing_rule_ids:
+            return statuses
+
+        fetched = self._fetch_rule_statuses(missing_rule_ids)
+        to_create = [
+            GroupRuleStatus(rule_id=rule_id, group=self.group, project=self.project)
+            for rule_id in missing_rule_ids
+            if rule_id not in fetched
+        ]
+        if to_create:
+            try:
+                with transaction.atomic(using=router.db_for_write(GroupRuleStatus)):
+                    GroupRuleStatus.objects.bulk_create(to_create)
+            except IntegrityError:
+                # Another event of this group created some of the statuses
+                # in the meantime, which are picked up below.
+                pass
+            fetched.update(self._fetch_rule_statuses([s.rule_id for s in to_create]))
+
+        for rule_id in missing_rule_ids:
+            if rule_id not in fetched:
+                # The statuses were not created in bulk and a concurrent
+                # insert only created some of them.
+                fetched[rule_id], _ = GroupRuleStatus.objects.get_or_create(
+                    rule_id=rule_id, group=self.group, defaults={"project": self.project}
+                )
+
+        cache.set_many({cache_keys[rule_id]: status for rule_id, status in fetched.items()}, 300)
+        statuses.update(fetched)
+        return statuses
+
     def get_rule_status(self, rule):
-        key = "grouprulestatus:1:%s" % hash_values([self.group.id, rule.id])
-        rule_status = cache.get(key)
-        if rule_status is None:
-            rule_status, _ = GroupRuleStatus.objects.get_or_create(
-                rule=rule, group=self.group, defaults={"project": self.project}
-            )
-            cache.set(key, rule_status, 300)
-        return rule_status
+        return self.get_rule_statuses([rule])[rule.id]
 
     def condition_matches(self, condition, state, rule):
         condition_cls = rules.get(condition["id"])
@@ -54,9 +147,46 @@ class RuleProcessor:
             self.logger.warn("Unregistered condition %r", condition["id"])
             return
 
-        condition_inst = condition_cls(self.project, data=condition, rule=rule)
+        kwargs = {}
+        if self.query_batch is not None and issubclass(condition_cls, BaseEventFrequencyCondition):
+            kwargs["query_batch"] = self.query_batch
+
+        condition_inst = condition_cls(self.project, data=condition, rule=rule, **kwargs)
         return safe_execute(condition_inst.passes, self.event, state, _with_transaction=False)
 
+    def prepare_frequency_queries(self, rule_list, statuses):
+        """
+        Collects the TSDB queries of the frequency conditions of every rule
+        that is not rate limited by its frequency, and makes them in a single
+        request before the rules are applied.
+
+        :param rule_list: a list of `Rule`s
+        :param statuses: a dict of rule id to `GroupRuleStatus`
+        :return: void
+        """
+        now = timezone.now()
+        batch = FrequencyQueryBatch()
+        for rule in rule_list:
+            frequency = rule.data.get("frequency") or Rule.DEFAULT_FREQUENCY
+            last_active = statuses[rule.id].last_active
+            if last_active and last_active > now - timedelta(minutes=frequency):
+                continue
+
+            for condition in rule.data.get("conditions", ()):
+                condition_cls = rules.get(condition["id"])
+                if condition_cls is None or not issubclass(
+                    condition_cls, BaseEventFrequencyCondition
+                ):
+                    continue
+
+                condition_inst = condition_cls(
+                    self.project, data=condition, rule=rule, query_batch=batch
+                )
+                safe_execute(condition_inst.add_to_batch, self.event, _with_transaction=False)
+
+        batch.execute()
+        self.query_batch = batch
+
     def get_rule_type(self, condition):
         rule_cls = rules.get(condition["id"])
         if rule_cls is None:
@@ -82,11 +212,15 @@ class RuleProcessor:
             return lambda bool_iter: not any(bool_iter)
         return None
 
-    def apply_rule(self, rule):
+    def is_rule_environment_match(self, rule):
+        return rule.environment_id is None or self.event.get_environment().id == rule.environment_id
+
+    def apply_rule(self, rule, status):
         """
         If all conditions and filters pass, execute every action.
 
         :param rule: `Rule` object
+        :param status: the `GroupRuleStatus` of this group for the rule
         :return: void
         """
         condition_match = rule.data.get("action_match") or Rule.DEFAULT_CONDITION_MATCH
@@ -94,14 +228,6 @@ class RuleProcessor:
         rule_condition_list = rule.data.get("conditions", ())
         frequency = rule.data.get("frequency") or Rule.DEFAULT_FREQUENCY
 
-        if (
-            rule.environment_id is not None
-            and self.event.get_environment().id != rule.environment_id
-        ):
-            return
-
-        status = self.get_rule_status(rule)
-
         now = timezone.now()
         freq_offset = now - timedelta(minutes=frequency)
 
@@ -156,6 +282,9 @@ class RuleProcessor:
         if not passed:
             return
 
+        # Keep statuses that are shared between processors up to date.
+        status.last_active = now
+
         if randrange(10) == 0:
             analytics.record(
                 "issue_alert.fired",
@@ -194,6 +323,13 @@ class RuleProcessor:
             return {}.values()
 
         self.grouped_futures.clear()
-        for rule in self.get_rules():
-            self.apply_rule(rule)
+        self.query_batch = None
+        rule_list = [rule for rule in self.get_rules() if self.is_rule_environment_match(rule)]
+        if not rule_list:
+            return self.grouped_futures.values()
+
+        statuses = self.get_rule_statuses(rule_list)
+        self.prepare_frequency_queries(rule_list, statuses)
+        for rule in rule_list:
+            self.apply_rule(rule, statuses[rule.id])
         return self.grouped_futures.values()
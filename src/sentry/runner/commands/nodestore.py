@@ -0,0 +1,93 @@
+import os
+from datetime import timedelta
+
+import click
+
+from sentry.runner.decorators import configuration
+
+
+@click.group()
+def nodestore():
+    """Tools for interacting with the node storage."""
+
+
+@nodestore.command("train-dictionaries")
+@click.argument("platforms", nargs=-1, required=True)
+@click.option(
+    "--project",
+    "project_ids",
+    type=int,
+    multiple=True,
+    required=True,
+    help="ID of a project to sample events from. Can be passed multiple times.",
+)
+@click.option("--samples", default=1000, show_default=True, help="Events to sample per platform.")
+@click.option("--days", default=7, show_default=True, help="Sample events of the last N days.")
+@click.option(
+    "--size", default=110 * 1024, show_default=True, help="Maximum dictionary size in bytes."
+)
+@click.option(
+    "--output",
+    required=True,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to write the dictionaries to.",
+)
+@configuration
+def train_dictionaries(platforms, project_ids, samples, days, size, output):
+    """
+    Train zstd compression dictionaries for nodestore.
+
+    Events of the given platforms are sampled from the given projects and a
+    dictionary is trained for each platform. The dictionaries are written as
+    <platform>.dict files to the output directory, which can be passed as
+    `dictionary_path` to the nodestore backend.
+    """
+    import zstandard
+    from django.utils import timezone
+
+    from sentry import eventstore
+    from sentry.nodestore.base import json_dumps
+    from sentry.nodestore.compression import DICTIONARY_SUFFIX
+
+    end = timezone.now()
+    start = end - timedelta(days=days)
+
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    for platform in platforms:
+        events = eventstore.get_events(
+            filter=eventstore.Filter(
+                conditions=[["platform", "=", platform]],
+                project_ids=list(project_ids),
+                start=start,
+                end=end,
+            ),
+            limit=samples,
+            referrer="runner.nodestore.train_dictionaries",
+        )
+        eventstore.bind_nodes(events, "data")
+
+        # Train on the same serialization the nodestore compresses.
+        payloads = [
+            json_dumps(dict(event.data.data.items())).encode("utf8")
+            for event in events
+            if event.data
+        ]
+        if not payloads:
+            click.echo(f"No events found for {platform}, skipping.")
+            continue
+
+        try:
+            dictionary = zstandard.train_dictionary(size, payloads)
+        except zstandard.ZstdError as e:
+            raise click.ClickException(f"Failed to train dictionary for {platform}: {e}")
+
+        path = os.path.join(output, platform + DICTIONARY_SUFFIX)
+        with open(path, "wb") as f:
+            f.write(dictionary.as_bytes())
+
+        click.echo(
+            f"Trained dictionary {dictionary.dict_id()} for {platform} "
+            f"from {len(payloads)} events: {path}"
+        )
@@ -0,0 +1,16 @@
+-- Removes the first ARGV[1] entries of the list at KEYS[1] once they have
+-- been post-processed. If no entries are left, the schedule marker at KEYS[2]
+-- is deleted so that the next event schedules a new task. Otherwise it is
+-- kept for another ARGV[2] seconds for the task that picks up the rest.
+-- Returns the number of entries left.
+local key = KEYS[1]
+local marker = KEYS[2]
+
+redis.call('LTRIM', key, tonumber(ARGV[1]), -1)
+local remaining = redis.call('LLEN', key)
+if remaining == 0 then
+    redis.call('DEL', marker)
+else
+    redis.call('EXPIRE', marker, tonumber(ARGV[2]))
+end
+return remaining
@@ -0,0 +1,31 @@
+-- Applies a batch of time series writes for a single host.
+--
+-- Every key in ``KEYS`` has a corresponding operation in ``ARGV``, encoded as
+-- ``kind, expiry, count`` followed by ``count`` arguments:
+--
+--   * ``c`` (counter): ``count`` is the number of arguments that follow as
+--     ``field, amount`` pairs, each of which is applied with ``HINCRBY``.
+--   * ``h`` (HyperLogLog): ``count`` values that are added with ``PFADD``.
+--
+-- After applying the operation, the key is expired at ``expiry``.
+
+local cursor = 1
+for _, key in ipairs(KEYS) do
+    local kind = ARGV[cursor]
+    local expiry = ARGV[cursor + 1]
+    local count = tonumber(ARGV[cursor + 2])
+    cursor = cursor + 3
+
+    if kind == 'c' then
+        for i = cursor, cursor + count - 1, 2 do
+            redis.call('HINCRBY', key, ARGV[i], ARGV[i + 1])
+        end
+    elseif kind == 'h' then
+        redis.call('PFADD', key, unpack(ARGV, cursor, cursor + count - 1))
+    else
+        return redis.error_reply(string.format('Unknown operation: %s', kind))
+    end
+
+    redis.call('EXPIREAT', key, expiry)
+    cursor = cursor + count
+end
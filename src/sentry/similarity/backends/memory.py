@@ -0,0 +1,455 @@
+import fnmatch
+import os
+import threading
+import time
+from collections import defaultdict
+
+import msgpack
+
+from sentry.similarity.backends.abstract import AbstractIndexBackend
+from sentry.similarity.backends.redis import band as get_bands
+from sentry.utils.compat import map
+
+
+class _Index:
+    def __init__(self):
+        # key -> [expiration, [{bucket: count}, ...]]
+        self.frequencies = {}
+        # (band, bucket) -> time series index -> {key, ...}
+        self.members = defaultdict(dict)
+        # Timestamp at which expired entries are evicted next.
+        self.next_eviction = 0
+
+
+class InMemoryMinHashIndexBackend(AbstractIndexBackend):
+    """
+    A MinHash index that is kept in process memory, with the same semantics
+    as the Redis backend. Exported data can be imported into either backend.
+
+    If a ``path`` is given, the index is loaded from that file when the
+    backend is created, and written back to it by ``save``.
+    """
+
+    def __init__(
+        self, signature_builder, bands, interval, retention, candidate_set_limit, path=None
+    ):
+        self.signature_builder = signature_builder
+        self.bands = bands
+        self.interval = interval
+        self.retention = retention
+        self.candidate_set_limit = candidate_set_limit
+        self.path = path
+
+        # (scope, index) -> _Index
+        self._indexes = defaultdict(_Index)
+        self._lock = threading.RLock()
+
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def _build_frequencies_many(self, feature_sets):
+        signatures = iter(
+            self.signature_builder.build_many([features for features in feature_sets if features])
+        )
+
+        results = []
+        for features in feature_sets:
+            if not features:
+                results.append([{} for _ in range(self.bands)])
+                continue
+
+            results.append(
+                [
+                    {",".join(map("{}".format, bucket)): 1}
+                    for bucket in get_bands(self.bands, next(signatures))
+                ]
+            )
+        return results
+
+    def _get_time_series_index(self, timestamp):
+        return int(timestamp // self.interval)
+
+    def _get_frequencies(self, index, key, timestamp):
+        entry = index.frequencies.get(key)
+        if entry is None or entry[0] <= timestamp:
+            return None
+        return entry[1]
+
+    def _set_frequencies(self, index, key, frequencies, expiration):
+        entry = index.frequencies.get(key)
+        if entry is None:
+            entry = index.frequencies[key] = [expiration, [{} for _ in range(self.bands)]]
+        else:
+            entry[0] = expiration
+
+        for current, buckets in zip(entry[1], frequencies):
+            for bucket, count in buckets.items():
+                current[bucket] = current.get(bucket, 0) + count
+
+    def _add_member(self, index, band, bucket, key, time_series_index):
+        time_series = index.members[(band, bucket)]
+        for i in [i for i in time_series if i < time_series_index - self.retention]:
+            del time_series[i]
+        time_series.setdefault(time_series_index, set()).add(key)
+
+    def _evict(self, index, timestamp):
+        # Expired entries are never read again, but would otherwise be kept
+        # around forever. The index is swept at most once per interval so that
+        # the cost of a sweep is amortized over the writes in between.
+        if timestamp < index.next_eviction:
+            return
+        index.next_eviction = timestamp + self.interval
+
+        for key in [
+            key for key, (expiration, _) in index.frequencies.items() if expiration <= timestamp
+        ]:
+            del index.frequencies[key]
+
+        oldest = self._get_time_series_index(timestamp) - self.retention
+        for member in list(index.members):
+            time_series = index.members[member]
+            for i in [i for i, keys in time_series.items() if i < oldest or not keys]:
+                del time_series[i]
+            if not time_series:
+                del index.members[member]
+
+    def _get_live_time_series(self, index, band, bucket, timestamp):
+        time_series = index.members.get((band, bucket))
+        if not time_series:
+            return []
+
+        current = self._get_time_series_index(timestamp)
+        return [
+            (i, time_series[i])
+            for i in range(current - self.retention, current + 1)
+            if i in time_series
+        ]
+
+    def _fetch_candidates(self, index, frequencies, timestamp):
+        candidates = defaultdict(set)
+        for band, buckets in enumerate(frequencies):
+            for bucket in buckets:
+                members = set()
+                for _, keys in self._get_live_time_series(index, band, bucket, timestamp):
+                    for key in sorted(keys):
+                        members.add(key)
+                        if len(members) >= self.candidate_set_limit:
+                            break
+                    if len(members) >= self.candidate_set_limit:
+                        break
+
+                for member in members:
+                    candidates[member].add(band)
+
+        return {candidate: len(bands) for candidate, bands in candidates.items()}
+
+    def _calculate_similarity(self, item_frequencies, candidate_frequencies):
+        item_empty = not item_frequencies or not item_frequencies[0]
+        candidate_empty = not candidate_frequencies or not candidate_frequencies[0]
+        if item_empty and candidate_empty:
+            return None  # both items don't have the feature (no comparison)
+        elif item_empty or candidate_empty:
+            return 0  # one item doesn't have the feature (totally dissimilar)
+
+        def scale_to_total(values):
+            total = sum(values.values())
+            return {bucket: value / total for bucket, value in values.items()}
+
+        scores = []
+        for item_buckets, candidate_buckets in zip(item_frequencies, candidate_frequencies):
+            item_buckets = scale_to_total(item_buckets)
+            candidate_buckets = scale_to_total(candidate_buckets)
+            distance = sum(
+                abs(item_buckets.get(bucket, 0) - candidate_buckets.get(bucket, 0))
+                for bucket in set(item_buckets) | set(candidate_buckets)
+            )
+            # Normalize the distance to a [0, 1] similarity.
+            scores.append(1 - (distance / 2))
+
+        # Round like the scores returned by the Redis backend.
+        return float("%f" % (sum(scores) / len(scores)))
+
+    def _search(self, scope, parameters, limit, timestamp):
+        possible_candidates = defaultdict(dict)
+        for i, (idx, threshold, frequencies) in enumerate(parameters):
+            index = self._indexes.get((scope, idx))
+            if index is None:
+                continue
+            for candidate, hits in self._fetch_candidates(index, frequencies, timestamp).items():
+                if hits >= threshold:
+                    possible_candidates[candidate][i] = hits
+
+        candidates = list(possible_candidates.items())
+        if limit is not None and limit >= 0 and len(candidates) > limit:
+            # Rank by the average number of matching bands over all indices.
+            candidates.sort(
+                key=lambda candidate: (
+                    sum(candidate[1].values()) / len(parameters) * -1,
+                    len(candidate[1]) * -1,
+                    candidate[0],
+                )
+            )
+            candidates = candidates[:limit]
+
+        results = []
+        for key, _ in candidates:
+            scores = []
+            for idx, _, frequencies in parameters:
+                index = self._indexes.get((scope, idx))
+                candidate_frequencies = (
+                    self._get_frequencies(index, key, timestamp) if index is not None else None
+                )
+                scores.append(self._calculate_similarity(frequencies, candidate_frequencies))
+            results.append((key, scores))
+
+        def get_comparison_key(result):
+            key, scores = result
+
+            scores = [score for score in scores if score is not None]
+
+            return (
+                sum(scores) / len(scores) * -1,  # average score, descending
+                len(scores) * -1,  # number of indexes with scores, descending
+                key,  # lexicographical sort on key, ascending
+            )
+
+        return sorted(results, key=get_comparison_key)
+
+    def classify(self, scope, items, limit=None, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        frequencies = self._build_frequencies_many([features for _, _, features in items])
+        parameters = [
+            (f"{idx}", threshold, item_frequencies)
+            for (idx, threshold, _), item_frequencies in zip(items, frequencies)
+        ]
+
+        with self._lock:
+            return self._search(f"{scope}", parameters, limit, timestamp)
+
+    def compare(self, scope, key, items, limit=None, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        scope = f"{scope}"
+        key = f"{key}"
+
+        with self._lock:
+            parameters = []
+            for idx, threshold in items:
+                index = self._indexes.get((scope, f"{idx}"))
+                frequencies = (
+                    self._get_frequencies(index, key, timestamp) if index is not None else None
+                )
+                parameters.append((f"{idx}", threshold, frequencies or []))
+
+            return self._search(scope, parameters, limit, timestamp)
+
+    def record(self, scope, key, items, timestamp=None):
+        if not items:
+            return  # nothing to do
+
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        frequencies = self._build_frequencies_many([features for _, features in items])
+        expiration = timestamp + self.interval * self.retention
+        time_series_index = self._get_time_series_index(timestamp)
+
+        scope = f"{scope}"
+        key = f"{key}"
+
+        with self._lock:
+            for (idx, _), item_frequencies in zip(items, frequencies):
+                if not any(item_frequencies):
+                    continue
+
+                index = self._indexes[(scope, f"{idx}")]
+                self._evict(index, timestamp)
+                self._set_frequencies(index, key, item_frequencies, expiration)
+                for band, buckets in enumerate(item_frequencies):
+                    for bucket in buckets:
+                        self._add_member(index, band, bucket, key, time_series_index)
+
+    def merge(self, scope, destination, items, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        scope = f"{scope}"
+        destination = f"{destination}"
+
+        with self._lock:
+            for idx, source in items:
+                source = f"{source}"
+                assert source != destination, "cannot merge destination into itself"
+
+                index = self._indexes.get((scope, f"{idx}"))
+                if index is None:
+                    continue
+
+                frequencies = self._get_frequencies(index, source, timestamp)
+                if frequencies is None:
+                    continue
+
+                expiration = index.frequencies.pop(source)[0]
+                destination_entry = index.frequencies.get(destination)
+                if destination_entry is not None:
+                    expiration = max(expiration, destination_entry[0])
+                self._set_frequencies(index, destination, frequencies, expiration)
+
+                for band, buckets in enumerate(frequencies):
+                    for bucket in buckets:
+                        for _, keys in self._get_live_time_series(index, band, bucket, timestamp):
+                            if source in keys:
+                                keys.remove(source)
+                                keys.add(destination)
+
+    def delete(self, scope, items, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        scope = f"{scope}"
+
+        with self._lock:
+            for idx, key in items:
+                key = f"{key}"
+
+                index = self._indexes.get((scope, f"{idx}"))
+                if index is None or key not in index.frequencies:
+                    continue
+
+                frequencies = index.frequencies.pop(key)[1]
+                for band, buckets in enumerate(frequencies):
+                    for bucket in buckets:
+                        for _, keys in self._get_live_time_series(index, band, bucket, timestamp):
+                            keys.discard(key)
+
+    def _get_matching_indexes(self, scope, idx):
+        # Scopes can be glob patterns, like the Redis backend matches keys.
+        return [
+            (index_scope, index)
+            for (index_scope, index_idx), index in self._indexes.items()
+            if index_idx == f"{idx}" and fnmatch.fnmatchcase(index_scope, f"{scope}")
+        ]
+
+    def scan(self, scope, indices, batch=1000, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        for idx in indices:
+            with self._lock:
+                keys = sorted(
+                    (index_scope, key)
+                    for index_scope, index in self._get_matching_indexes(scope, idx)
+                    for key, (expiration, _) in index.frequencies.items()
+                    if expiration > timestamp
+                )
+
+            for i in range(0, len(keys), batch):
+                yield idx, keys[i : i + batch]
+
+    def flush(self, scope, indices, batch=1000, timestamp=None):
+        with self._lock:
+            for idx in indices:
+                for index_scope, _ in self._get_matching_indexes(scope, idx):
+                    del self._indexes[(index_scope, f"{idx}")]
+
+    def _export(self, index, key, timestamp):
+        frequencies = self._get_frequencies(index, key, timestamp)
+        if frequencies is None:
+            return []
+
+        data = []
+        for band, buckets in enumerate(frequencies):
+            data.append(
+                {
+                    bucket: [
+                        count,
+                        [
+                            i
+                            for i, keys in self._get_live_time_series(
+                                index, band, bucket, timestamp
+                            )
+                            if key in keys
+                        ],
+                    ]
+                    for bucket, count in buckets.items()
+                }
+            )
+
+        return [data, index.frequencies[key][0]]
+
+    def export(self, scope, items, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        scope = f"{scope}"
+
+        results = []
+        with self._lock:
+            for idx, key in items:
+                index = self._indexes.get((scope, f"{idx}"))
+                data = self._export(index, f"{key}", timestamp) if index is not None else []
+                results.append(msgpack.packb(data))
+        return results
+
+    def _import(self, index, key, data):
+        if not data:
+            return
+
+        data, expiration = data
+        frequencies = []
+        for band, buckets in enumerate(data):
+            # Bands without buckets may be encoded as empty arrays.
+            buckets = buckets or {}
+            frequencies.append({bucket: value[0] for bucket, value in buckets.items()})
+            for bucket, (_, time_series_indices) in buckets.items():
+                for i in time_series_indices:
+                    index.members[(band, bucket)].setdefault(i, set()).add(key)
+
+        self._set_frequencies(index, key, frequencies, expiration)
+
+    def import_(self, scope, items, timestamp=None):
+        scope = f"{scope}"
+
+        with self._lock:
+            for idx, key, data in items:
+                self._import(self._indexes[(scope, f"{idx}")], f"{key}", msgpack.unpackb(data))
+
+    def save(self, timestamp=None):
+        """
+        Writes the index to the file it was created with. The file is
+        replaced atomically, so a concurrent reader never sees a partially
+        written index. Expired entries are evicted from memory first.
+        """
+        assert self.path is not None, "cannot save an index without a path"
+
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        with self._lock:
+            for name, index in list(self._indexes.items()):
+                index.next_eviction = 0
+                self._evict(index, timestamp)
+                if not index.frequencies and not index.members:
+                    del self._indexes[name]
+
+            entries = [
+                [scope, idx, key, self._export(index, key, timestamp)]
+                for (scope, idx), index in self._indexes.items()
+                for key in index.frequencies
+            ]
+
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as f:
+            msgpack.pack([entry for entry in entries if entry[3]], f)
+        os.replace(temporary_path, self.path)
+
+    def _load(self, path):
+        with open(path, "rb") as f:
+            entries = msgpack.unpack(f)
+
+        with self._lock:
+            for scope, idx, key, data in entries:
+                self._import(self._indexes[(scope, idx)], key, data)
@@ -35,13 +35,26 @@ class RedisScriptMinHashIndexBackend(AbstractIndexBackend):
         self.candidate_set_limit = candidate_set_limit
 
     def _build_signature_arguments(self, features):
-        if not features:
-            return [0] * self.bands
-
-        arguments = []
-        for bucket in band(self.bands, self.signature_builder(features)):
-            arguments.extend([1, ",".join(map("{}".format, bucket)), 1])
-        return arguments
+        return self._build_signature_arguments_many([features])[0]
+
+    def _build_signature_arguments_many(self, feature_sets):
+        # The signatures of all non-empty feature sets are built in one go, so
+        # that features shared between the sets are only hashed once.
+        signatures = iter(
+            self.signature_builder.build_many([features for features in feature_sets if features])
+        )
+
+        results = []
+        for features in feature_sets:
+            if not features:
+                results.append([0] * self.bands)
+                continue
+
+            arguments = []
+            for bucket in band(self.bands, next(signatures)):
+                arguments.extend([1, ",".join(map("{}".format, bucket)), 1])
+            results.append(arguments)
+        return results
 
     def __index(self, scope, args):
         # scope must be passed into the script call as a key to allow the
@@ -92,9 +105,10 @@ class RedisScriptMinHashIndexBackend(AbstractIndexBackend):
             limit if limit is not None else -1,
         ]
 
-        for idx, threshold, features in items:
+        signatures = self._build_signature_arguments_many([features for _, _, features in items])
+        for (idx, threshold, _), signature in zip(items, signatures):
             arguments.extend([idx, threshold])
-            arguments.extend(self._build_signature_arguments(features))
+            arguments.extend(signature)
 
         return self._as_search_result(self.__index(scope, arguments))
 
@@ -139,9 +153,10 @@ class RedisScriptMinHashIndexBackend(AbstractIndexBackend):
             key,
         ]
 
-        for idx, features in items:
+        signatures = self._build_signature_arguments_many([features for _, features in items])
+        for (idx, _), signature in zip(items, signatures):
             arguments.append(idx)
-            arguments.extend(self._build_signature_arguments(features))
+            arguments.extend(signature)
 
         return self.__index(scope, arguments)
 
@@ -1,5 +1,17 @@
+import functools
+
 import mmh3
-from sentry.utils.compat import map
+
+# Maximum number of distinct features the hashes are cached for per process.
+# Features like frame pairs and message shingles repeat across most events of
+# a group, so the hashes of the bulk of the features of an event are usually
+# already known.
+FEATURE_HASH_CACHE_SIZE = 10000
+
+
+@functools.lru_cache(maxsize=FEATURE_HASH_CACHE_SIZE)
+def _get_feature_hashes(feature, columns, rows):
+    return tuple(mmh3.hash(feature, column) % rows for column in range(columns))
 
 
 class MinHashSignatureBuilder:
@@ -8,9 +20,21 @@ class MinHashSignatureBuilder:
         self.rows = rows
 
     def __call__(self, features):
-        return map(
-            lambda column: min(
-                map(lambda feature: mmh3.hash(feature, column) % self.rows, features)
-            ),
-            range(self.columns),
-        )
+        return self.build_many([features])[0]
+
+    def build_many(self, feature_sets):
+        """
+        Builds the signatures of several feature sets at once.
+
+        Every distinct feature is hashed once for all columns, and the
+        signature is the column-wise minimum of the hashes of the features of
+        a set. The signatures are the same as if every set was passed to the
+        builder on its own.
+        """
+        signatures = []
+        for features in feature_sets:
+            hashes = [_get_feature_hashes(feature, self.columns, self.rows) for feature in features]
+            if not hashes:
+                raise ValueError("cannot build the signature of an empty feature set")
+            signatures.append([min(column) for column in zip(*hashes)])
+        return signatures
@@ -1,18 +1,40 @@
 import logging
 
+from django.conf import settings
+
 from sentry import features
 from sentry.app import locks
 from sentry.exceptions import PluginError
 from sentry.signals import event_processed, issue_unignored
 from sentry.tasks.base import instrumented_task
-from sentry.utils import metrics
+from sentry.utils import json, metrics
 from sentry.utils.cache import cache
 from sentry.utils.locking import UnableToAcquireLock
+from sentry.utils.redis import load_script, redis_clusters
 from sentry.utils.safe import safe_execute
 from sentry.utils.sdk import set_current_event_project, bind_organization_context
 
 logger = logging.getLogger("sentry")
 
+trim_coalesced = load_script("post_process/trim_coalesced.lua")
+
+# Coalesced events are dropped if no task picks them up within this time.
+COALESCE_TTL = 60 * 60
+
+# The maximum number of coalesced events a single task post-processes. The
+# rest is left to a follow-up task.
+COALESCE_BATCH_SIZE = 100
+
+# Seconds a scheduled task has to start and finish after the coalescing window
+# has passed. If it has not by then, e.g. because it was lost, the next event
+# of the group schedules a new one.
+COALESCE_SCHEDULE_TIMEOUT = 5 * 60
+
+# Seconds a task may take to post-process its events. The events of a group
+# are only post-processed by one task at a time, tasks that are scheduled
+# while another one is still running leave the events to that one.
+COALESCE_PROCESS_TIMEOUT = 5 * 60
+
 
 def _get_service_hooks(project_id):
     from sentry.models import ServiceHook
@@ -168,6 +190,24 @@ def update_existing_attachments(event):
     )
 
 
+class _SharedWork:
+    """
+    Results of work that the events of a group share when they are
+    post-processed together by ``post_process_group_batch``. Every event that
+    is post-processed on its own gets a fresh instance.
+    """
+
+    def __init__(self, batched=False):
+        self.batched = batched
+        self.projects = {}
+        self.groups = {}
+        self.snoozes_processed = False
+        self.owners_assigned = False
+        # Rule statuses are only shared within a batch, see `RuleProcessor`.
+        self.rule_statuses = {} if batched else None
+        self.similarity_events = []
+
+
 @instrumented_task(name="sentry.tasks.post_process.post_process_group")
 def post_process_group(
     is_new, is_regression, is_new_group_environment, cache_key, group_id=None, **kwargs
@@ -175,181 +215,339 @@ def post_process_group(
     """
     Fires post processing hooks for a group.
     """
-    from sentry.eventstore.models import Event
-    from sentry.eventstore.processing import event_processing_store
     from sentry.utils import snuba
-    from sentry.reprocessing2 import is_reprocessed_event
 
     with snuba.options_override({"consistent": True}):
-        # We use the data being present/missing in the processing store
-        # to ensure that we don't duplicate work should the forwarding consumers
-        # need to rewind history.
-        data = event_processing_store.get(cache_key)
-        if not data:
-            logger.info(
-                "post_process.skipped",
-                extra={"cache_key": cache_key, "reason": "missing_cache"},
-            )
-            return
-        event = Event(
-            project_id=data["project"], event_id=data["event_id"], group_id=group_id, data=data
+        _post_process_event(
+            _SharedWork(),
+            is_new=is_new,
+            is_regression=is_regression,
+            is_new_group_environment=is_new_group_environment,
+            cache_key=cache_key,
+            group_id=group_id,
+            **kwargs,
         )
 
-        set_current_event_project(event.project_id)
 
-        is_reprocessed = is_reprocessed_event(event.data)
+@instrumented_task(
+    name="sentry.tasks.post_process.post_process_group_batch",
+    time_limit=COALESCE_PROCESS_TIMEOUT,
+)
+def post_process_group_batch(group_id, **kwargs):
+    """
+    Fires post processing hooks for the events of a group that were
+    coalesced by ``coalesce_post_process_group``.
 
-        # NOTE: we must pass through the full Event object, and not an
-        # event_id since the Event object may not actually have been stored
-        # in the database due to sampling.
-        from sentry.models import (
-            Commit,
-            Project,
-            Organization,
-            EventDict,
-            GroupInboxReason,
-        )
-        from sentry.models.groupinbox import add_group_to_inbox
-        from sentry.models.group import get_group_with_redirect
-        from sentry.rules.processor import RuleProcessor
-        from sentry.tasks.servicehooks import process_service_hook
-        from sentry.tasks.groupowner import process_suspect_commits
-
-        # Re-bind node data to avoid renormalization. We only want to
-        # renormalize when loading old data from the database.
-        event.data = EventDict(event.data, skip_renormalization=True)
-
-        # Re-bind Project and Org since we're reading the Event object
-        # from cache which may contain stale parent models.
-        event.project = Project.objects.get_from_cache(id=event.project_id)
-        event.project._organization_cache = Organization.objects.get_from_cache(
-            id=event.project.organization_id
-        )
+    Models are loaded, snoozes are processed and owners are assigned once for
+    all events, and rule statuses are shared between them. Rules, hooks and
+    plugins still run for every event.
+    """
+    # The task holding the lock picks up the events that are added while it
+    # runs, or schedules a task that does.
+    lock = locks.get(f"ppg:{group_id}", duration=COALESCE_PROCESS_TIMEOUT)
+    try:
+        with lock.acquire():
+            _post_process_group_batch(group_id)
+    except UnableToAcquireLock:
+        metrics.incr("tasks.post_process.batch.locked", skip_internal=False)
+
+
+def _post_process_group_batch(group_id):
+    from sentry import similarity
+    from sentry.utils import snuba
 
-        if event.group_id:
-            # Re-bind Group since we're reading the Event object
-            # from cache, which may contain a stale group and project
-            event.group, _ = get_group_with_redirect(event.group_id)
-            event.group_id = event.group.id
+    client = _get_coalesce_client()
+    key = _get_coalesce_key(group_id)
+    entries = _get_coalesced_events(group_id)
+    metrics.timing("tasks.post_process.batch_size", len(entries))
 
-            event.group.project = event.project
-            event.group.project._organization_cache = event.project._organization_cache
+    shared = _SharedWork(batched=True)
+    with snuba.options_override({"consistent": True}):
+        for entry in entries:
+            try:
+                _post_process_event(shared, **entry)
+            except Exception:
+                logger.exception(
+                    "post_process.batch.failed", extra={"cache_key": entry.get("cache_key")}
+                )
 
-        bind_organization_context(event.project.organization)
+        if shared.similarity_events:
+            safe_execute(
+                similarity.record,
+                shared.similarity_events[0].project,
+                shared.similarity_events,
+                _with_transaction=False,
+            )
 
-        _capture_stats(event, is_new)
+    # Entries are only removed once they have been post-processed, so that
+    # they are picked up again if the worker dies. Events that were done by
+    # then are skipped, as their payload is gone from the processing store.
+    remaining = trim_coalesced(
+        client,
+        [key, _get_coalesce_schedule_key(group_id)],
+        [len(entries), COALESCE_SCHEDULE_TIMEOUT],
+    )
+    if remaining:
+        _schedule_post_process_group_batch(group_id, countdown=0)
 
-        if event.group_id and is_reprocessed and is_new:
-            add_group_to_inbox(event.group, GroupInboxReason.REPROCESSED)
 
-        if event.group_id and not is_reprocessed:
-            # we process snoozes before rules as it might create a regression
-            # but not if it's new because you can't immediately snooze a new group
-            has_reappeared = False if is_new else process_snoozes(event.group)
-            if not has_reappeared:  # If true, we added the .UNIGNORED reason already
-                if is_new:
-                    add_group_to_inbox(event.group, GroupInboxReason.NEW)
-                elif is_regression:
-                    add_group_to_inbox(event.group, GroupInboxReason.REGRESSION)
+def _get_coalesce_client():
+    return redis_clusters.get(settings.SENTRY_POST_PROCESS_COALESCE_REDIS_CLUSTER)
 
-            handle_owner_assignment(event.project, event.group, event)
 
-            rp = RuleProcessor(
-                event, is_new, is_regression, is_new_group_environment, has_reappeared
-            )
-            has_alert = False
-            # TODO(dcramer): ideally this would fanout, but serializing giant
-            # objects back and forth isn't super efficient
-            for callback, futures in rp.apply():
-                has_alert = True
-                safe_execute(callback, event, futures, _with_transaction=False)
+# The keys of a group share a hash tag, so that they are on the same node.
+def _get_coalesce_key(group_id):
+    return f"ppg:c:{{{group_id}}}"
 
-            try:
-                lock = locks.get(
-                    f"w-o:{event.group_id}-d-l",
-                    duration=10,
-                )
-                with lock.acquire():
-                    has_commit_key = f"w-o:{event.project.organization_id}-h-c"
-                    org_has_commit = cache.get(has_commit_key)
-                    if org_has_commit is None:
-                        org_has_commit = Commit.objects.filter(
-                            organization_id=event.project.organization_id
-                        ).exists()
-                        cache.set(has_commit_key, org_has_commit, 3600)
-
-                    if org_has_commit:
-                        group_cache_key = f"w-o-i:g-{event.group_id}"
-                        if cache.get(group_cache_key):
-                            metrics.incr(
-                                "sentry.tasks.process_suspect_commits.debounce",
-                                tags={"detail": "w-o-i:g debounce"},
-                            )
-                        else:
-                            from sentry.utils.committers import get_frame_paths
-
-                            cache.set(group_cache_key, True, 604800)  # 1 week in seconds
-                            event_frames = get_frame_paths(event.data)
-                            process_suspect_commits.delay(
-                                event_id=event.event_id,
-                                event_platform=event.platform,
-                                event_frames=event_frames,
-                                group_id=event.group_id,
-                                project_id=event.project_id,
-                            )
-            except UnableToAcquireLock:
-                pass
-            except Exception:
-                logger.exception("Failed to process suspect commits")
 
-            if features.has("projects:servicehooks", project=event.project):
-                allowed_events = {"event.created"}
-                if has_alert:
-                    allowed_events.add("event.alert")
+def _get_coalesce_schedule_key(group_id):
+    return f"ppg:s:{{{group_id}}}"
 
-                if allowed_events:
-                    for servicehook_id, events in _get_service_hooks(project_id=event.project_id):
-                        if any(e in allowed_events for e in events):
-                            process_service_hook.delay(servicehook_id=servicehook_id, event=event)
 
-            from sentry.tasks.sentry_apps import process_resource_change_bound
+def coalesce_post_process_group(window, group_id, **kwargs):
+    """
+    Buffers the post-processing of an event of a group, so that it is done
+    by a single ``post_process_group_batch`` task together with the other
+    events of the group that arrive within ``window`` seconds.
 
-            if event.get_event_type() == "error" and _should_send_error_created_hooks(
-                event.project
-            ):
-                process_resource_change_bound.delay(
-                    action="created", sender="Error", instance_id=event.event_id, instance=event
-                )
+    Takes the arguments of ``post_process_group``.
+    """
+    key = _get_coalesce_key(group_id)
+    entry = dict(kwargs, group_id=group_id)
+
+    # A task is scheduled by the event that sets the schedule marker. The
+    # marker is removed by the task once all events are done, or expires if
+    # the task does not finish in time.
+    with _get_coalesce_client().pipeline() as pipe:
+        pipe.rpush(key, json.dumps(entry))
+        pipe.expire(key, COALESCE_TTL)
+        pipe.set(
+            _get_coalesce_schedule_key(group_id),
+            "1",
+            nx=True,
+            ex=int(window) + COALESCE_SCHEDULE_TIMEOUT,
+        )
+        _, _, schedule = pipe.execute()
+
+    if schedule:
+        _schedule_post_process_group_batch(group_id, countdown=window)
+
+
+def _schedule_post_process_group_batch(group_id, countdown):
+    try:
+        post_process_group_batch.apply_async(kwargs={"group_id": group_id}, countdown=countdown)
+    except Exception:
+        # Leave it to the next event to schedule the task.
+        _get_coalesce_client().delete(_get_coalesce_schedule_key(group_id))
+        raise
+
+
+def _get_coalesced_events(group_id):
+    entries = _get_coalesce_client().lrange(_get_coalesce_key(group_id), 0, COALESCE_BATCH_SIZE - 1)
+    return [json.loads(entry) for entry in entries]
+
+
+def _post_process_event(
+    shared, is_new, is_regression, is_new_group_environment, cache_key, group_id=None, **kwargs
+):
+    from sentry.eventstore.models import Event
+    from sentry.eventstore.processing import event_processing_store
+    from sentry.reprocessing2 import is_reprocessed_event
+
+    # We use the data being present/missing in the processing store
+    # to ensure that we don't duplicate work should the forwarding consumers
+    # need to rewind history.
+    data = event_processing_store.get(cache_key)
+    if not data:
+        logger.info(
+            "post_process.skipped",
+            extra={"cache_key": cache_key, "reason": "missing_cache"},
+        )
+        return
+    event = Event(
+        project_id=data["project"], event_id=data["event_id"], group_id=group_id, data=data
+    )
+
+    set_current_event_project(event.project_id)
+
+    is_reprocessed = is_reprocessed_event(event.data)
+
+    # NOTE: we must pass through the full Event object, and not an
+    # event_id since the Event object may not actually have been stored
+    # in the database due to sampling.
+    from sentry.models import (
+        Commit,
+        Project,
+        Organization,
+        EventDict,
+        GroupInboxReason,
+    )
+    from sentry.models.groupinbox import add_group_to_inbox
+    from sentry.models.group import get_group_with_redirect
+    from sentry.rules.processor import RuleProcessor
+    from sentry.tasks.servicehooks import process_service_hook
+    from sentry.tasks.groupowner import process_suspect_commits
+
+    # Re-bind node data to avoid renormalization. We only want to
+    # renormalize when loading old data from the database.
+    event.data = EventDict(event.data, skip_renormalization=True)
+
+    # Re-bind Project and Org since we're reading the Event object
+    # from cache which may contain stale parent models.
+    project = shared.projects.get(event.project_id)
+    if project is None:
+        project = Project.objects.get_from_cache(id=event.project_id)
+        project._organization_cache = Organization.objects.get_from_cache(
+            id=project.organization_id
+        )
+        shared.projects[event.project_id] = project
+    event.project = project
+
+    if event.group_id:
+        # Re-bind Group since we're reading the Event object
+        # from cache, which may contain a stale group and project
+        group = shared.groups.get(event.group_id)
+        if group is None:
+            group, _ = get_group_with_redirect(event.group_id)
+            group.project = event.project
+            group.project._organization_cache = event.project._organization_cache
+            shared.groups[event.group_id] = group
+
+        event.group = group
+        event.group_id = group.id
+
+    bind_organization_context(event.project.organization)
+
+    _capture_stats(event, is_new)
+
+    if event.group_id and is_reprocessed and is_new:
+        add_group_to_inbox(event.group, GroupInboxReason.REPROCESSED)
+
+    if event.group_id and not is_reprocessed:
+        # we process snoozes before rules as it might create a regression
+        # but not if it's new because you can't immediately snooze a new group.
+        # Snoozes are only processed for the first event of a batch, as
+        # processing them unignores the group if they are no longer valid.
+        has_reappeared = False
+        if not is_new and not shared.snoozes_processed:
+            has_reappeared = process_snoozes(event.group)
+            shared.snoozes_processed = True
+        if not has_reappeared:  # If true, we added the .UNIGNORED reason already
             if is_new:
-                process_resource_change_bound.delay(
-                    action="created", sender="Group", instance_id=event.group_id
-                )
+                add_group_to_inbox(event.group, GroupInboxReason.NEW)
+            elif is_regression:
+                add_group_to_inbox(event.group, GroupInboxReason.REGRESSION)
 
-            from sentry.plugins.base import plugins
+        if not shared.owners_assigned:
+            handle_owner_assignment(event.project, event.group, event)
+            shared.owners_assigned = True
+
+        rule_processor_kwargs = {}
+        if shared.rule_statuses is not None:
+            rule_processor_kwargs["rule_statuses"] = shared.rule_statuses
+        rp = RuleProcessor(
+            event,
+            is_new,
+            is_regression,
+            is_new_group_environment,
+            has_reappeared,
+            **rule_processor_kwargs,
+        )
+        has_alert = False
+        # TODO(dcramer): ideally this would fanout, but serializing giant
+        # objects back and forth isn't super efficient
+        for callback, futures in rp.apply():
+            has_alert = True
+            safe_execute(callback, event, futures, _with_transaction=False)
 
-            for plugin in plugins.for_project(event.project):
-                plugin_post_process_group(
-                    plugin_slug=plugin.slug, event=event, is_new=is_new, is_regresion=is_regression
-                )
+        try:
+            lock = locks.get(
+                f"w-o:{event.group_id}-d-l",
+                duration=10,
+            )
+            with lock.acquire():
+                has_commit_key = f"w-o:{event.project.organization_id}-h-c"
+                org_has_commit = cache.get(has_commit_key)
+                if org_has_commit is None:
+                    org_has_commit = Commit.objects.filter(
+                        organization_id=event.project.organization_id
+                    ).exists()
+                    cache.set(has_commit_key, org_has_commit, 3600)
+
+                if org_has_commit:
+                    group_cache_key = f"w-o-i:g-{event.group_id}"
+                    if cache.get(group_cache_key):
+                        metrics.incr(
+                            "sentry.tasks.process_suspect_commits.debounce",
+                            tags={"detail": "w-o-i:g debounce"},
+                        )
+                    else:
+                        from sentry.utils.committers import get_frame_paths
+
+                        cache.set(group_cache_key, True, 604800)  # 1 week in seconds
+                        event_frames = get_frame_paths(event.data)
+                        process_suspect_commits.delay(
+                            event_id=event.event_id,
+                            event_platform=event.platform,
+                            event_frames=event_frames,
+                            group_id=event.group_id,
+                            project_id=event.project_id,
+                        )
+        except UnableToAcquireLock:
+            pass
+        except Exception:
+            logger.exception("Failed to process suspect commits")
+
+        if features.has("projects:servicehooks", project=event.project):
+            allowed_events = {"event.created"}
+            if has_alert:
+                allowed_events.add("event.alert")
+
+            if allowed_events:
+                for servicehook_id, events in _get_service_hooks(project_id=event.project_id):
+                    if any(e in allowed_events for e in events):
+                        process_service_hook.delay(servicehook_id=servicehook_id, event=event)
+
+        from sentry.tasks.sentry_apps import process_resource_change_bound
+
+        if event.get_event_type() == "error" and _should_send_error_created_hooks(event.project):
+            process_resource_change_bound.delay(
+                action="created", sender="Error", instance_id=event.event_id, instance=event
+            )
+        if is_new:
+            process_resource_change_bound.delay(
+                action="created", sender="Group", instance_id=event.group_id
+            )
+
+        from sentry.plugins.base import plugins
 
+        for plugin in plugins.for_project(event.project):
+            plugin_post_process_group(
+                plugin_slug=plugin.slug, event=event, is_new=is_new, is_regresion=is_regression
+            )
+
+        # Similarity is recorded for all events of a batch at once.
+        if shared.batched:
+            shared.similarity_events.append(event)
+        else:
             from sentry import similarity
 
             safe_execute(similarity.record, event.project, [event], _with_transaction=False)
 
-        if event.group_id:
-            # Patch attachments that were ingested on the standalone path.
-            update_existing_attachments(event)
+    if event.group_id:
+        # Patch attachments that were ingested on the standalone path.
+        update_existing_attachments(event)
 
-        if not is_reprocessed:
-            event_processed.send_robust(
-                sender=post_process_group,
-                project=event.project,
-                event=event,
-                primary_hash=kwargs.get("primary_hash"),
-            )
+    if not is_reprocessed:
+        event_processed.send_robust(
+            sender=post_process_group,
+            project=event.project,
+            event=event,
+            primary_hash=kwargs.get("primary_hash"),
+        )
 
-        with metrics.timer("tasks.post_process.delete_event_cache"):
-            event_processing_store.delete_by_key(cache_key)
+    with metrics.timer("tasks.post_process.delete_event_cache"):
+        event_processing_store.delete_by_key(cache_key)
 
 
 def process_snoozes(group):
@@ -1,4 +1,7 @@
 import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
 
 from time import time, sleep
@@ -30,6 +33,15 @@ REPROCESSING_DEFAULT = False
 
 SYMBOLICATOR_MAX_RETRY_AFTER = settings.SYMBOLICATOR_MAX_RETRY_AFTER
 
+# The maximum number of events saved by one ``save_event_many`` task, and the
+# soft time limit of such a task. Batches are saved in a fraction of the time
+# of their events saved one by one, but the events of a failing batch may be
+# saved one by one again.
+SAVE_EVENT_MANY_BATCH_SIZE = 20
+SAVE_EVENT_MANY_TIME_LIMIT = 180
+
+_save_event_batch = threading.local()
+
 
 class RetryProcessing(Exception):
     pass
@@ -93,13 +105,47 @@ def submit_save_event(project, from_reprocessing, cache_key, event_id, start_tim
 
     # XXX: honor from_reprocessing
 
-    save_event.delay(
-        cache_key=cache_key,
-        data=data,
-        start_time=start_time,
-        event_id=event_id,
-        project_id=project.id,
-    )
+    task_kwargs = {
+        "cache_key": cache_key,
+        "data": data,
+        "start_time": start_time,
+        "event_id": event_id,
+        "project_id": project.id,
+    }
+
+    batch = getattr(_save_event_batch, "events", None)
+    if batch is not None:
+        batch.append(task_kwargs)
+        return
+
+    save_event.delay(**task_kwargs)
+
+
+@contextmanager
+def batch_save_events():
+    """
+    Collects all events submitted for saving within the context and spawns a
+    ``save_event_many`` task per project and up to ``SAVE_EVENT_MANY_BATCH_SIZE``
+    events for them on exit.
+    """
+    if getattr(_save_event_batch, "events", None) is not None:
+        # already batching, the outermost context submits the events
+        yield
+        return
+
+    _save_event_batch.events = events = []
+    try:
+        yield
+    finally:
+        _save_event_batch.events = None
+
+        events_by_project = defaultdict(list)
+        for task_kwargs in events:
+            events_by_project[task_kwargs["project_id"]].append(task_kwargs)
+
+        for project_events in events_by_project.values():
+            for i in range(0, len(project_events), SAVE_EVENT_MANY_BATCH_SIZE):
+                save_event_many.delay(events=project_events[i : i + SAVE_EVENT_MANY_BATCH_SIZE])
 
 
 def _do_preprocess_event(cache_key, data, start_time, event_id, process_task, project):
@@ -682,6 +728,78 @@ def create_failed_event(
     return True
 
 
+def _get_event_to_save(cache_key, data, event_id, project_id):
+    """
+    Prepares the payload of an event for saving. Returns the payload along
+    with the event and project id, the payload is `None` if there is nothing
+    to save.
+    """
+    if data is not None:
+        data = CanonicalKeyDict(data)
+
+    if event_id is None and data is not None:
+        event_id = data["event_id"]
+
+    # only when we come from reprocessing we get a project_id sent into
+    # the task.
+    if project_id is None:
+        project_id = data.pop("project")
+        set_current_event_project(project_id)
+
+    # We only need to delete raw events for events that support
+    # reprocessing.  If the data cannot be found we want to assume
+    # that we need to delete the raw event.
+    if not data or reprocessing.event_supports_reprocessing(data):
+        with metrics.timer("tasks.store.do_save_event.delete_raw_event"):
+            delete_raw_event(project_id, event_id, allow_hint_clear=True)
+
+    # This covers two cases: where data is None because we did not manage
+    # to fetch it from the default cache or the empty dictionary was
+    # stored in the default cache.  The former happens if the event
+    # expired while being on the queue, the second happens on reprocessing
+    # if the raw event was deleted concurrently while we held on to
+    # it.  This causes the node store to delete the data and we end up
+    # fetching an empty dict.  We could in theory not invoke `save_event`
+    # in those cases but it's important that we always clean up the
+    # reprocessing reports correctly or they will screw up the UI.  So
+    # to future proof this correctly we just handle this case here.
+    if not data:
+        metrics.incr(
+            "events.failed", tags={"reason": "cache", "stage": "post"}, skip_internal=False
+        )
+        return None, event_id, project_id
+
+    return data, event_id, project_id
+
+
+def _get_saved_event_data(manager):
+    # The updated event is put back into the cache so that post_process has
+    # the most recent data.
+    data = manager.get_data()
+    if isinstance(data, CANONICAL_TYPES):
+        data = dict(data.items())
+    return data
+
+
+def _delete_discarded_event(cache_key):
+    # Delete the event payload from cache since it won't show up in post-processing.
+    if cache_key:
+        with metrics.timer("tasks.store.do_save_event.delete_cache"):
+            event_processing_store.delete_by_key(cache_key)
+
+
+def _finish_save_event(data, cache_key, start_time, project_id):
+    reprocessing2.mark_event_reprocessed(data)
+    if cache_key:
+        with metrics.timer("tasks.store.do_save_event.delete_attachment_cache"):
+            attachment_cache.delete(cache_key)
+
+    if start_time:
+        metrics.timing("events.time-to-process", time() - start_time, instance=data["platform"])
+
+    time_synthetic_monitoring_event(data, project_id, start_time)
+
+
 def _do_save_event(
     cache_key=None, data=None, start_time=None, event_id=None, project_id=None, **kwargs
 ):
@@ -702,39 +820,8 @@ def _do_save_event(
                 metric_tags["event_type"] = event_type = data.get("type") or "none"
 
     with metrics.global_tags(event_type=event_type):
-        if data is not None:
-            data = CanonicalKeyDict(data)
-
-        if event_id is None and data is not None:
-            event_id = data["event_id"]
-
-        # only when we come from reprocessing we get a project_id sent into
-        # the task.
-        if project_id is None:
-            project_id = data.pop("project")
-            set_current_event_project(project_id)
-
-        # We only need to delete raw events for events that support
-        # reprocessing.  If the data cannot be found we want to assume
-        # that we need to delete the raw event.
-        if not data or reprocessing.event_supports_reprocessing(data):
-            with metrics.timer("tasks.store.do_save_event.delete_raw_event"):
-                delete_raw_event(project_id, event_id, allow_hint_clear=True)
-
-        # This covers two cases: where data is None because we did not manage
-        # to fetch it from the default cache or the empty dictionary was
-        # stored in the default cache.  The former happens if the event
-        # expired while being on the queue, the second happens on reprocessing
-        # if the raw event was deleted concurrently while we held on to
-        # it.  This causes the node store to delete the data and we end up
-        # fetching an empty dict.  We could in theory not invoke `save_event`
-        # in those cases but it's important that we always clean up the
-        # reprocessing reports correctly or they will screw up the UI.  So
-        # to future proof this correctly we just handle this case here.
-        if not data:
-            metrics.incr(
-                "events.failed", tags={"reason": "cache", "stage": "post"}, skip_internal=False
-            )
+        data, event_id, project_id = _get_event_to_save(cache_key, data, event_id, project_id)
+        if data is None:
             return
 
         try:
@@ -744,31 +831,128 @@ def _do_save_event(
                 manager.save(
                     project_id, assume_normalized=True, start_time=start_time, cache_key=cache_key
                 )
-                # Put the updated event back into the cache so that post_process
-                # has the most recent data.
-                data = manager.get_data()
-                if isinstance(data, CANONICAL_TYPES):
-                    data = dict(data.items())
+                data = _get_saved_event_data(manager)
                 with metrics.timer("tasks.store.do_save_event.write_processing_cache"):
                     event_processing_store.store(data)
         except HashDiscarded:
-            # Delete the event payload from cache since it won't show up in post-processing.
-            if cache_key:
-                with metrics.timer("tasks.store.do_save_event.delete_cache"):
-                    event_processing_store.delete_by_key(cache_key)
+            _delete_discarded_event(cache_key)
 
         finally:
-            reprocessing2.mark_event_reprocessed(data)
-            if cache_key:
-                with metrics.timer("tasks.store.do_save_event.delete_attachment_cache"):
-                    attachment_cache.delete(cache_key)
-
-            if start_time:
-                metrics.timing(
-                    "events.time-to-process", time() - start_time, instance=data["platform"]
+            _finish_save_event(data, cache_key, start_time, project_id)
+
+
+def _do_save_event_many(events):
+    """
+    Saves a batch of events to the database.
+
+    ``events`` is a list of the keyword arguments ``save_event`` would have
+    been called with for each event. All events of a project and type are
+    saved together with ``EventManager.save_many``. If that fails, the events
+    that were not saved at all are saved one by one, so that a single bad
+    event does not fail the rest of the batch. Events that were partially
+    saved are not saved again, as that would count them twice.
+    """
+
+    from sentry.event_manager import EventManager, HashDiscarded, SaveManyError
+
+    batches = defaultdict(list)
+    errors = []
+
+    # The payloads of all events that were not passed directly are fetched
+    # at once.
+    cache_keys = [
+        task_kwargs.get("cache_key")
+        for task_kwargs in events
+        if task_kwargs.get("cache_key") and task_kwargs.get("data") is None
+    ]
+    with metrics.timer("tasks.store.do_save_event_many.get_cache"):
+        cached_data = dict(zip(cache_keys, event_processing_store.get_many(cache_keys)))
+
+    for task_kwargs in events:
+        cache_key = task_kwargs.get("cache_key")
+        data = task_kwargs.get("data")
+        if cache_key and data is None:
+            data = cached_data[cache_key]
+
+        event_type = (data.get("type") if data else None) or "none"
+        with metrics.global_tags(event_type=event_type):
+            try:
+                data, _, project_id = _get_event_to_save(
+                    cache_key, data, task_kwargs.get("event_id"), task_kwargs.get("project_id")
                 )
+            except Exception as e:
+                errors.append(e)
+                continue
 
-            time_synthetic_monitoring_event(data, project_id, start_time)
+        if data is not None:
+            batches[project_id, event_type].append((task_kwargs, data))
+
+    for (project_id, event_type), batch in batches.items():
+        set_current_event_project(project_id)
+
+        with metrics.global_tags(event_type=event_type):
+            managers = [EventManager(data) for _, data in batch]
+            try:
+                with metrics.timer("tasks.store.do_save_event_many.event_manager.save_many"):
+                    results = EventManager.save_many(
+                        managers,
+                        project_id,
+                        assume_normalized=True,
+                        start_times=[task_kwargs.get("start_time") for task_kwargs, _ in batch],
+                        cache_keys=[task_kwargs.get("cache_key") for task_kwargs, _ in batch],
+                    )
+            except Exception as e:
+                unsaved = e.unsaved if isinstance(e, SaveManyError) else []
+                if len(unsaved) < len(batch):
+                    errors.append(e)
+                metrics.incr(
+                    "tasks.store.do_save_event_many.fallback",
+                    amount=len(unsaved),
+                    skip_internal=False,
+                )
+                metrics.incr(
+                    "tasks.store.do_save_event_many.partially_saved",
+                    amount=len(batch) - len(unsaved),
+                    skip_internal=False,
+                )
+                for i in unsaved:
+                    try:
+                        _do_save_event(**batch[i][0])
+                    except Exception as e:
+                        errors.append(e)
+                continue
+
+            saved_data = []
+            for (task_kwargs, _), manager, result in zip(batch, managers, results):
+                if isinstance(result, HashDiscarded):
+                    _delete_discarded_event(task_kwargs.get("cache_key"))
+                else:
+                    saved_data.append(_get_saved_event_data(manager))
+
+            try:
+                if saved_data:
+                    with metrics.timer("tasks.store.do_save_event_many.write_processing_cache"):
+                        event_processing_store.store_many(saved_data)
+            except Exception as e:
+                errors.append(e)
+
+            for (task_kwargs, _), manager in zip(batch, managers):
+                try:
+                    _finish_save_event(
+                        _get_saved_event_data(manager),
+                        task_kwargs.get("cache_key"),
+                        task_kwargs.get("start_time"),
+                        project_id,
+                    )
+                except Exception as e:
+                    errors.append(e)
+
+        metrics.timing("tasks.store.do_save_event_many.batch_size", len(batch))
+
+    if errors:
+        for e in errors[1:]:
+            error_logger.error("save_event_many.failed", exc_info=e)
+        raise errors[0]
 
 
 def time_synthetic_monitoring_event(data, project_id, start_time):
@@ -829,3 +1013,13 @@ def save_event(
     cache_key=None, data=None, start_time=None, event_id=None, project_id=None, **kwargs
 ):
     _do_save_event(cache_key, data, start_time, event_id, project_id, **kwargs)
+
+
+@instrumented_task(
+    name="sentry.tasks.store.save_event_many",
+    queue="events.save_event",
+    time_limit=SAVE_EVENT_MANY_TIME_LIMIT + 5,
+    soft_time_limit=SAVE_EVENT_MANY_TIME_LIMIT,
+)
+def save_event_many(events=None, **kwargs):
+    _do_save_event_many(events or [])
@@ -14,6 +14,9 @@ ONE_MINUTE = 60
 ONE_HOUR = ONE_MINUTE * 60
 ONE_DAY = ONE_HOUR * 24
 
+# The methods that queries of ``BaseTSDB.get_totals_multi`` can be made for.
+TOTALS_METHODS = frozenset(["get_sums", "get_distinct_counts_totals"])
+
 
 class TSDBModel(Enum):
     internal = 0
@@ -104,6 +107,7 @@ class BaseTSDB(Service):
             "get_distinct_counts_series",
             "get_distinct_counts_totals",
             "get_distinct_counts_union",
+            "get_totals_multi",
             "get_most_frequent",
             "get_most_frequent_series",
             "get_frequency_series",
@@ -438,6 +442,31 @@ class BaseTSDB(Service):
         """
         raise NotImplementedError
 
+    def get_totals_multi(self, queries, use_cache=False):
+        """
+        Fetch several totals at once.
+
+        Each query is a ``(method, model, key, start, end, environment_id)``
+        tuple, where ``method`` is either ``get_sums`` or
+        ``get_distinct_counts_totals``. Returns the total of each query, in
+        the order of the queries.
+        """
+        results = []
+        for method, model, key, start, end, environment_id in queries:
+            if method not in TOTALS_METHODS:
+                raise ValueError(f"Unsupported totals method: {method}")
+            results.append(
+                getattr(self, method)(
+                    model,
+                    [key],
+                    start,
+                    end,
+                    environment_id=environment_id,
+                    use_cache=use_cache,
+                )[key]
+            )
+        return results
+
     def merge_distinct_counts(
         self, model, destination, sources, timestamp=None, environment_ids=None
     ):
@@ -23,6 +23,8 @@ SketchParameters = namedtuple("SketchParameters", "depth width capacity")
 
 CountMinScript = SentryScript(None, resource_string("sentry", "scripts/tsdb/cmsketch.lua"))
 
+WriteScript = SentryScript(None, resource_string("sentry", "scripts/tsdb/write.lua"))
+
 
 class SuppressionWrapper:
     """\
@@ -112,6 +114,9 @@ class RedisTSDB(BaseTSDB):
         self.prefix = prefix
         self.vnodes = vnodes
         self.enable_frequency_sketches = options.pop("enable_frequency_sketches", False)
+        # When enabled, counter and distinct counter writes are applied with a
+        # single script invocation per host instead of a command per key.
+        self.enable_write_scripts = options.pop("enable_write_scripts", False)
         super().__init__(**options)
 
     def validate(self):
@@ -222,44 +227,92 @@ class RedisTSDB(BaseTSDB):
             default_timestamp = timezone.now()
 
         for (cluster, durable), environment_ids in self.get_cluster_groups({None, environment_id}):
-            manager = cluster.map()
-            if not durable:
-                manager = SuppressionWrapper(manager)
-
-            with manager as client:
-                # (hash_key, hash_field) -> count
-                key_operations = defaultdict(lambda: 0)
-                # (hash_key) -> "max expiration encountered"
-                key_expiries = defaultdict(lambda: 0.0)
-
-                for rollup, max_values in self.rollups.items():
-                    for item in items:
-                        if len(item) == 2:
-                            model, key = item
-                            options = {}
-                        else:
-                            model, key, options = item
-
-                        count = options.get("count", default_count)
-                        timestamp = options.get("timestamp", default_timestamp)
+            # (hash_key, hash_field) -> count
+            key_operations = defaultdict(lambda: 0)
+            # (hash_key) -> "max expiration encountered"
+            key_expiries = defaultdict(lambda: 0.0)
+
+            for rollup, max_values in self.rollups.items():
+                for item in items:
+                    if len(item) == 2:
+                        model, key = item
+                        options = {}
+                    else:
+                        model, key, options = item
+
+                    count = options.get("count", default_count)
+                    timestamp = options.get("timestamp", default_timestamp)
+
+                    expiry = self.calculate_expiry(rollup, max_values, timestamp)
+
+                    for environment_id in environment_ids:
+                        hash_key, hash_field = self.make_counter_key(
+                            model, rollup, timestamp, key, environment_id
+                        )
 
-                        expiry = self.calculate_expiry(rollup, max_values, timestamp)
+                        if key_expiries[hash_key] < expiry:
+                            key_expiries[hash_key] = expiry
 
-                        for environment_id in environment_ids:
-                            hash_key, hash_field = self.make_counter_key(
-                                model, rollup, timestamp, key, environment_id
-                            )
+                        key_operations[(hash_key, hash_field)] += count
 
-                            if key_expiries[hash_key] < expiry:
-                                key_expiries[hash_key] = expiry
+            if self.enable_write_scripts:
+                fields = defaultdict(list)
+                for (hash_key, hash_field), count in key_operations.items():
+                    fields[hash_key].extend((hash_field, count))
+
+                self.execute_write_script(
+                    cluster,
+                    durable,
+                    [
+                        (hash_key, hash_key, "c", key_expiries[hash_key], arguments)
+                        for hash_key, arguments in fields.items()
+                    ],
+                )
+                continue
 
-                            key_operations[(hash_key, hash_field)] += count
+            manager = cluster.map()
+            if not durable:
+                manager = SuppressionWrapper(manager)
 
+            with manager as client:
                 for (hash_key, hash_field), count in key_operations.items():
                     client.hincrby(hash_key, hash_field, count)
                     if key_expiries.get(hash_key):
                         client.expireat(hash_key, key_expiries.pop(hash_key))
 
+    def execute_write_script(self, cluster, durable, operations):
+        """
+        Applies write operations with a single ``WriteScript`` invocation per
+        host.
+
+        ``operations`` is a sequence of ``(routing_key, key, kind, expiry,
+        arguments)`` tuples, where ``routing_key`` determines the host the
+        operation is executed on. (See ``write.lua`` for the supported
+        operation kinds and their arguments.)
+        """
+        router = cluster.get_router()
+
+        # host -> (routing key, keys, arguments)
+        batches = {}
+        for routing_key, key, kind, expiry, arguments in operations:
+            host = router.get_host_for_key(routing_key)
+            if host not in batches:
+                batches[host] = (routing_key, [], [])
+            _, keys, args = batches[host]
+            keys.append(key)
+            args.extend((kind, int(expiry), len(arguments)))
+            args.extend(arguments)
+
+        commands = {
+            routing_key: [(WriteScript, keys, args)] for routing_key, keys, args in batches.values()
+        }
+
+        try:
+            cluster.execute_commands(commands)
+        except Exception:
+            if durable:
+                raise
+
     def get_range(
         self, model, keys, start, end, rollup=None, environment_ids=None, use_cache=False
     ):
@@ -279,27 +332,53 @@ class RedisTSDB(BaseTSDB):
         self.validate_arguments([model], [environment_id])
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
-        series = map(to_datetime, series)
 
-        results = []
+        responses = self._get_counter_responses(model, keys, rollup, series, environment_id)
+
+        # ``series`` is already sorted, so the points can be zipped up as-is
+        # instead of going through an intermediate mapping per key.
+        return {
+            key: [
+                (float(epoch), int(promise.value or 0)) for epoch, promise in zip(series, promises)
+            ]
+            for key, promises in responses.items()
+        }
+
+    def get_sums(self, model, keys, start, end, rollup=None, environment_id=None, use_cache=False):
+        self.validate_arguments([model], [environment_id])
+
+        rollup, series = self.get_optimal_rollup_series(start, end, rollup)
+
+        responses = self._get_counter_responses(model, keys, rollup, series, environment_id)
+
+        return {
+            key: sum(int(promise.value or 0) for promise in promises)
+            for key, promises in responses.items()
+        }
+
+    def _get_counter_responses(self, model, keys, rollup, series, environment_id):
+        """
+        Fetches the counters of ``keys`` for every epoch in ``series``.
+
+        Returns a mapping of key => [promise, ...], where the promises are in
+        the same order as ``series``.
+        """
+        timestamps = map(to_datetime, series)
+
+        responses = {}
         cluster, _ = self.get_cluster(environment_id)
         with cluster.map() as client:
             for key in keys:
-                for timestamp in series:
+                if key in responses:
+                    continue
+                promises = responses[key] = []
+                for timestamp in timestamps:
                     hash_key, hash_field = self.make_counter_key(
                         model, rollup, timestamp, key, environment_id
                     )
-                    results.append(
-                        (to_timestamp(timestamp), key, client.hget(hash_key, hash_field))
-                    )
-
-        results_by_key = defaultdict(dict)
-        for epoch, key, count in results:
-            results_by_key[key][epoch] = int(count.value or 0)
+                    promises.append(client.hget(hash_key, hash_field))
 
-        for key, points in results_by_key.items():
-            results_by_key[key] = sorted(points.items())
-        return dict(results_by_key)
+        return responses
 
     def merge(self, model, destination, sources, timestamp=None, environment_ids=None):
         environment_ids = (set(environment_ids) if environment_ids is not None else set()).union(
@@ -392,6 +471,18 @@ class RedisTSDB(BaseTSDB):
         ts = int(to_timestamp(timestamp))  # ``timestamp`` is not actually a timestamp :(
 
         for (cluster, durable), environment_ids in self.get_cluster_groups({None, environment_id}):
+            if self.enable_write_scripts:
+                operations = []
+                for model, key, values in items:
+                    for rollup, max_values in self.rollups.items():
+                        expiry = self.calculate_expiry(rollup, max_values, timestamp)
+                        for environment_id in environment_ids:
+                            k = self.make_key(model, rollup, ts, key, environment_id)
+                            operations.append((key, k, "h", expiry, list(values)))
+
+                self.execute_write_script(cluster, durable, operations)
+                continue
+
             manager = cluster.fanout()
             if not durable:
                 manager = SuppressionWrapper(manager)
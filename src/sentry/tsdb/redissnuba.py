@@ -1,6 +1,8 @@
 import time
 import inspect
 
+from collections import defaultdict
+
 from sentry.tsdb.base import BaseTSDB
 from sentry.tsdb.dummy import DummyTSDB
 from sentry.tsdb.redis import RedisTSDB
@@ -30,6 +32,7 @@ method_specifications = {
     "get_distinct_counts_series": (READ, single_model_argument),
     "get_distinct_counts_totals": (READ, single_model_argument),
     "get_distinct_counts_union": (READ, single_model_argument),
+    "get_totals_multi": (READ, lambda callargs: {query[1] for query in callargs["queries"]}),
     "get_most_frequent": (READ, single_model_argument),
     "get_most_frequent_series": (READ, single_model_argument),
     "get_frequency_series": (READ, single_model_argument),
@@ -93,7 +96,8 @@ def make_method(key):
 class RedisSnubaTSDBMeta(type):
     def __new__(cls, name, bases, attrs):
         for key in method_specifications.keys():
-            attrs[key] = make_method(key)
+            # Methods that are defined on the class dispatch by themselves.
+            attrs.setdefault(key, make_method(key))
         return type.__new__(cls, name, bases, attrs)
 
 
@@ -122,3 +126,22 @@ class RedisSnubaTSDB(BaseTSDB, metaclass=RedisSnubaTSDBMeta):
             "snuba": SnubaTSDB(**options.pop("snuba", {})),
         }
         super().__init__(**options)
+
+    def get_totals_multi(self, queries, use_cache=False):
+        # Unlike other reads, the queries can be for models of different
+        # backends, so they are split up by backend.
+        queries_by_backend = defaultdict(list)
+        for idx, query in enumerate(queries):
+            backend = selector_func(
+                "get_totals_multi", {"queries": [query]}, self.switchover_timestamp
+            )
+            queries_by_backend[backend].append((idx, query))
+
+        results = [None] * len(queries)
+        for backend, indexed_queries in queries_by_backend.items():
+            totals = self.backends[backend].get_totals_multi(
+                [query for _, query in indexed_queries], use_cache=use_cache
+            )
+            for (idx, _), total in zip(indexed_queries, totals):
+                results[idx] = total
+        return results
@@ -20,6 +20,15 @@ SnubaModelQuerySettings = collections.namedtuple(
     ["dataset", "groupby", "aggregate", "conditions"],
 )
 
+SnubaTSDBQuery = collections.namedtuple(
+    # `params` - the keyword arguments to `snuba.query`
+    # `keys` - the keys the query is made for
+    # `keys_map` - the keys of each group column, used to zerofill the result
+    # `groupby` - the columns the result is nested by
+    "SnubaTSDBQuery",
+    ["params", "keys", "keys_map", "groupby"],
+)
+
 # combine DEFAULT, ERROR, and SECURITY as errors. We are now recording outcome by
 # category, and these TSDB models and where they're used assume only errors.
 # see relay: py/sentry_relay/consts.py and relay-cabi/include/relay.h
@@ -252,6 +261,43 @@ class SnubaTSDB(BaseTSDB):
         `group_on_time`: whether to add a GROUP BY clause on the 'time' field.
         `group_on_model`: whether to add a GROUP BY clause on the primary model.
         """
+        query = self.get_data_query(
+            model,
+            keys,
+            start,
+            end,
+            rollup,
+            environment_ids,
+            aggregation=aggregation,
+            group_on_model=group_on_model,
+            group_on_time=group_on_time,
+            conditions=conditions,
+        )
+
+        if query.keys:
+            result = snuba.query(use_cache=use_cache, **query.params)
+        else:
+            result = {}
+
+        return self.get_data_result(query, result)
+
+    def get_data_query(
+        self,
+        model,
+        keys,
+        start,
+        end,
+        rollup=None,
+        environment_ids=None,
+        aggregation="count()",
+        group_on_model=True,
+        group_on_time=False,
+        conditions=None,
+    ):
+        """
+        Builds the snuba query for the parameters of ``get_data``, without
+        sending it.
+        """
         # XXX: to counteract the hack in project_key_stats.py
         if model in [
             TSDBModel.key_total_received,
@@ -260,15 +306,7 @@ class SnubaTSDB(BaseTSDB):
         ]:
             keys = list(set(map(lambda x: int(x), keys)))
 
-        # 10s is the only rollup under an hour that we support
-        if rollup and rollup == 10 and model in self.lower_rollup_query_settings:
-            model_query_settings = self.lower_rollup_query_settings.get(model)
-        else:
-            model_query_settings = self.model_query_settings.get(model)
-
-        if model_query_settings is None:
-            raise Exception(f"Unsupported TSDBModel: {model.name}")
-
+        model_query_settings = self.get_model_query_settings(model, rollup)
         model_group = model_query_settings.groupby
         model_aggregate = model_query_settings.aggregate
 
@@ -311,30 +349,33 @@ class SnubaTSDB(BaseTSDB):
         if group_on_model and model_group is not None:
             orderby.append(model_group)
 
-        if keys:
-            result = snuba.query(
-                dataset=model_query_settings.dataset,
-                start=start,
-                end=end,
-                groupby=groupby,
-                conditions=conditions,
-                filter_keys=keys_map,
-                aggregations=aggregations,
-                rollup=rollup,
-                limit=limit,
-                orderby=orderby,
-                referrer=f"tsdb-modelid:{model.value}",
-                is_grouprelease=(model == TSDBModel.frequent_releases_by_group),
-                use_cache=use_cache,
-            )
-        else:
-            result = {}
+        params = {
+            "dataset": model_query_settings.dataset,
+            "start": start,
+            "end": end,
+            "groupby": groupby,
+            "conditions": conditions,
+            "filter_keys": keys_map,
+            "aggregations": aggregations,
+            "rollup": rollup,
+            "limit": limit,
+            "orderby": orderby,
+            "referrer": f"tsdb-modelid:{model.value}",
+            "is_grouprelease": (model == TSDBModel.frequent_releases_by_group),
+        }
 
         if group_on_time:
-            keys_map["time"] = series
+            keys_map = dict(keys_map, time=series)
+
+        return SnubaTSDBQuery(params, keys, keys_map, groupby)
 
-        self.zerofill(result, groupby, keys_map)
-        self.trim(result, groupby, keys)
+    def get_data_result(self, query, result):
+        """
+        Fills in and trims the nested ``result`` of the given query, as built
+        by ``get_data_query``.
+        """
+        self.zerofill(result, query.groupby, query.keys_map)
+        self.trim(result, query.groupby, query.keys)
 
         return result
 
@@ -386,18 +427,7 @@ class SnubaTSDB(BaseTSDB):
         conditions=None,
         use_cache=False,
     ):
-        # 10s is the only rollup under an hour that we support
-        if rollup and rollup == 10 and model in self.lower_rollup_query_settings:
-            model_query_settings = self.lower_rollup_query_settings.get(model)
-        else:
-            model_query_settings = self.model_query_settings.get(model)
-
-        assert model_query_settings is not None, f"Unsupported TSDBModel: {model.name}"
-
-        if model_query_settings.dataset == snuba.Dataset.Outcomes:
-            aggregate_function = "sum"
-        else:
-            aggregate_function = "count()"
+        aggregate_function = self.get_aggregate_function(model, rollup)
 
         result = self.get_data(
             model,
@@ -417,6 +447,43 @@ class SnubaTSDB(BaseTSDB):
         #    {group: [(timestamp, count), ...]}
         return {k: sorted(result[k].items()) for k in result}
 
+    def get_sums(self, model, keys, start, end, rollup=None, environment_id=None, use_cache=False):
+        if self.get_model_query_settings(model, rollup).aggregate is not None:
+            return super().get_sums(
+                model, keys, start, end, rollup, environment_id, use_cache=use_cache
+            )
+
+        # Let Snuba sum up the buckets rather than fetching every bucket of
+        # every key just to add them up again here.
+        return self.get_data(
+            model,
+            keys,
+            start,
+            end,
+            rollup,
+            [environment_id] if environment_id is not None else None,
+            aggregation=self.get_aggregate_function(model, rollup),
+            use_cache=use_cache,
+        )
+
+    def get_model_query_settings(self, model, rollup):
+        # 10s is the only rollup under an hour that we support
+        if rollup and rollup == 10 and model in self.lower_rollup_query_settings:
+            model_query_settings = self.lower_rollup_query_settings.get(model)
+        else:
+            model_query_settings = self.model_query_settings.get(model)
+
+        if model_query_settings is None:
+            raise Exception(f"Unsupported TSDBModel: {model.name}")
+
+        return model_query_settings
+
+    def get_aggregate_function(self, model, rollup):
+        if self.get_model_query_settings(model, rollup).dataset == snuba.Dataset.Outcomes:
+            return "sum"
+        else:
+            return "count()"
+
     def get_distinct_counts_series(
         self, model, keys, start, end=None, rollup=None, environment_id=None
     ):
@@ -450,6 +517,64 @@ class SnubaTSDB(BaseTSDB):
             use_cache=use_cache,
         )
 
+    def get_totals_multi(self, queries, use_cache=False):
+        # All queries that can be answered by a single aggregate are sent to
+        # snuba together, the others are fetched one by one.
+        results = [None] * len(queries)
+        snuba_queries = []
+        for idx, (method, model, key, start, end, environment_id) in enumerate(queries):
+            if method == "get_distinct_counts_totals":
+                aggregation = "uniq"
+            elif (
+                method == "get_sums"
+                and self.get_model_query_settings(model, None).aggregate is None
+            ):
+                aggregation = self.get_aggregate_function(model, None)
+            else:
+                results[idx] = super().get_totals_multi([queries[idx]], use_cache=use_cache)[0]
+                continue
+
+            query = self.get_data_query(
+                model,
+                [key],
+                start,
+                end,
+                environment_ids=[environment_id] if environment_id is not None else None,
+                aggregation=aggregation,
+            )
+            snuba_queries.append((idx, key, query))
+
+        if not snuba_queries:
+            return results
+
+        try:
+            bodies = snuba.bulk_raw_query(
+                [
+                    # The conditions are extended while the query is prepared,
+                    # copy them so the query can be sent again on its own.
+                    snuba.SnubaQueryParams(
+                        **dict(query.params, conditions=list(query.params["conditions"]))
+                    )
+                    for _, _, query in snuba_queries
+                ],
+                referrer="tsdb.get_totals_multi",
+                use_cache=use_cache,
+            )
+        except (snuba.QueryOutsideRetentionError, snuba.QueryOutsideGroupActivityError):
+            # These are raised for the whole batch when preparing the
+            # queries, while `snuba.query` turns them into empty results.
+            for idx, key, query in snuba_queries:
+                results[idx] = self.get_data_result(
+                    query, snuba.query(use_cache=use_cache, **query.params)
+                )[key]
+            return results
+
+        for (idx, key, query), body in zip(snuba_queries, bodies):
+            result = snuba.nest_groups(body["data"], query.groupby, ["aggregate"])
+            results[idx] = self.get_data_result(query, result)[key]
+
+        return results
+
     def get_distinct_counts_union(
         self, model, keys, start, end=None, rollup=None, environment_id=None
     ):
@@ -0,0 +1,269 @@
+import atexit
+import logging
+import math
+import os
+import queue
+import threading
+from collections import defaultdict
+from functools import reduce
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.utils import timezone
+
+from sentry.utils import metrics
+from sentry.utils.dates import to_datetime, to_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Placed on the queue to stop the writer thread.
+_STOP = object()
+
+# Backend methods that can be applied twice without changing the result, so
+# that they can be retried when they fail. Counters may have been written to
+# some of the hosts of the backend before a failure.
+_IDEMPOTENT_METHODS = frozenset(["record_multi"])
+
+
+class WriteBehindTSDB:
+    """
+    Records TSDB writes asynchronously.
+
+    ``incr_multi``, ``record_multi`` and ``record_frequency_multi`` calls are
+    placed on a bounded in-process queue and applied to the wrapped backend by
+    a background thread. Writes that are drained together are merged before
+    they are sent to the backend, so that a burst of events for the same keys
+    only results in a handful of backend calls. Timestamps are rounded down to
+    the finest granularity of the backend's rollups first, which does not
+    change the bucket of any rollup a write ends up in.
+
+    Failed ``record_multi`` calls are retried once before the write is given
+    up on. Counter and frequency writes are not retried, as they may have been
+    applied in part.
+
+    When the queue is full the write is applied synchronously instead, which
+    applies backpressure to the caller rather than dropping data. Pending writes
+    are flushed when the interpreter or a worker process shuts down.
+    """
+
+    def __init__(self, backend, max_queue_size=10000, max_batch_size=1000):
+        assert max_queue_size > 0
+        assert max_batch_size > 0
+        self.backend = backend
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+        # Forked worker processes exit with ``os._exit``, which skips atexit.
+        worker_process_shutdown.connect(self._on_worker_shutdown, weak=False)
+
+    # The timestamps default to the time of the call rather than the time the
+    # write is eventually applied.
+
+    def incr_multi(self, items, timestamp=None, count=1, environment_id=None):
+        timestamp = timestamp or timezone.now()
+        self._enqueue(("incr_multi", (items, timestamp, count, environment_id)))
+
+    def record_multi(self, items, timestamp=None, environment_id=None):
+        timestamp = timestamp or timezone.now()
+        self._enqueue(("record_multi", (items, timestamp, environment_id)))
+
+    def record_frequency_multi(self, requests, timestamp=None, environment_id=None):
+        timestamp = timestamp or timezone.now()
+        self._enqueue(("record_frequency_multi", (requests, timestamp, environment_id)))
+
+    def flush(self):
+        """
+        Stops the writer thread and applies all pending writes in the calling
+        thread.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            thread, pending = self._thread, self._queue
+            self._thread = self._queue = self._pid = None
+
+        pending.put(_STOP)
+        thread.join()
+
+        operations = []
+        while True:
+            try:
+                operation = pending.get_nowait()
+            except queue.Empty:
+                break
+            if operation is not _STOP:
+                operations.append(operation)
+
+        if operations:
+            self._write(operations)
+
+    def _on_worker_shutdown(self, **kwargs):
+        self.flush()
+
+    def _enqueue(self, operation):
+        try:
+            self._ensure_thread().put_nowait(operation)
+        except queue.Full:
+            metrics.incr("tsdb.write_behind.queue_full", skip_internal=False)
+            self._write([operation])
+
+    def _ensure_thread(self):
+        # Worker processes are usually forked after the writer has been
+        # created, in which case the thread needs to be started again.
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._queue
+
+        with self._lock:
+            if self._pid != pid:
+                self._queue = queue.Queue(self.max_queue_size)
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name="sentry.tsdb.write_behind"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = pid
+            return self._queue
+
+    def _run(self, pending):
+        while True:
+            operations = [pending.get()]
+            while len(operations) < self.max_batch_size:
+                try:
+                    operations.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in operations
+            operations = [operation for operation in operations if operation is not _STOP]
+
+            if operations:
+                try:
+                    self._write(operations)
+                except Exception:
+                    metrics.incr("tsdb.write_behind.failed", skip_internal=False)
+                    logger.exception("tsdb.write_behind.failed")
+
+            if stop:
+                return
+
+    def _get_granularity(self):
+        # The largest interval every rollup is a multiple of
+        return reduce(math.gcd, self.backend.get_rollups())
+
+    def _normalize(self, timestamp, granularity):
+        epoch = int(to_timestamp(timestamp))
+        return to_datetime(epoch - epoch % granularity)
+
+    def _write(self, operations):
+        granularity = self._get_granularity()
+        # environment_id -> (model, key, timestamp) -> count
+        incrs = defaultdict(lambda: defaultdict(int))
+        # (timestamp, environment_id) -> (model, key) -> values
+        records = defaultdict(lambda: defaultdict(set))
+        # (timestamp, environment_id) -> model -> key -> member -> score
+        frequencies = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        )
+
+        for method, args in operations:
+            if method == "incr_multi":
+                items, timestamp, default_count, environment_id = args
+                for item in items:
+                    model, key = item[:2]
+                    options = item[2] if len(item) > 2 else {}
+                    item_timestamp = self._normalize(
+                        options.get("timestamp", timestamp), granularity
+                    )
+                    incrs[environment_id][(model, key, item_timestamp)] += options.get(
+                        "count", default_count
+                    )
+            elif method == "record_multi":
+                items, timestamp, environment_id = args
+                timestamp = self._normalize(timestamp, granularity)
+                for model, key, values in items:
+                    records[(timestamp, environment_id)][(model, key)].update(values)
+            elif method == "record_frequency_multi":
+                requests, timestamp, environment_id = args
+                timestamp = self._normalize(timestamp, granularity)
+                for model, request in requests:
+                    for key, items in request.items():
+                        for member, score in items.items():
+                            frequencies[(timestamp, environment_id)][model][key][member] += score
+
+        for environment_id, counts in incrs.items():
+            self._call(
+                "incr_multi",
+                [
+                    (model, key, {"timestamp": timestamp, "count": count})
+                    for (model, key, timestamp), count in counts.items()
+                ],
+                environment_id=environment_id,
+            )
+
+        for (timestamp, environment_id), values in records.items():
+            self._call(
+                "record_multi",
+                [(model, key, values) for (model, key), values in values.items()],
+                timestamp=timestamp,
+                environment_id=environment_id,
+            )
+
+        for (timestamp, environment_id), requests in frequencies.items():
+            self._call(
+                "record_frequency_multi",
+                [(model, dict(request)) for model, request in requests.items()],
+                timestamp=timestamp,
+                environment_id=environment_id,
+            )
+
+        metrics.timing("tsdb.write_behind.batch_size", len(operations))
+
+    def _call(self, method, *args, **kwargs):
+        # Calls are retried on their own, retrying the whole batch would apply
+        # the calls that succeeded twice.
+        func = getattr(self.backend, method)
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            if method not in _IDEMPOTENT_METHODS:
+                self._log_failure(method)
+                return
+
+            metrics.incr("tsdb.write_behind.retried", tags={"method": method}, skip_internal=False)
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                self._log_failure(method)
+
+    def _log_failure(self, method):
+        metrics.incr("tsdb.write_behind.failed", tags={"method": method}, skip_internal=False)
+        logger.exception("tsdb.write_behind.failed", extra={"method": method})
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_tsdb_writer():
+    """
+    Returns the object that TSDB writes from the event save path should go
+    to: the TSDB backend itself, or a ``WriteBehindTSDB`` wrapping it if
+    ``SENTRY_TSDB_WRITE_BEHIND`` is enabled.
+    """
+    global _writer
+
+    from sentry import tsdb
+
+    if not settings.SENTRY_TSDB_WRITE_BEHIND:
+        return tsdb
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindTSDB(tsdb, **settings.SENTRY_TSDB_WRITE_BEHIND_OPTIONS)
+    return _writer
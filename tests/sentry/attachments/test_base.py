@@ -1,6 +1,13 @@
 import copy
 
-from sentry.attachments.base import CachedAttachment, BaseAttachmentCache
+import pytest
+
+from sentry.attachments.base import (
+    BaseAttachmentCache,
+    CachedAttachment,
+    ChunkedAttachmentFile,
+    MissingAttachmentChunks,
+)
 
 
 class InMemoryCache:
@@ -18,6 +25,9 @@ class InMemoryCache:
         assert key not in self.raw_map or raw == self.raw_map[key]
         return copy.deepcopy(self.data.get(key))
 
+    def get_many(self, keys, raw=False):
+        return [self.get(key, raw=raw) for key in keys]
+
     def set(self, key, value, timeout=None, raw=False):
         # Attachment chunks MUST be bytestrings. Josh please don't change this
         # to unicode.
@@ -110,3 +120,59 @@ def test_basic_rate_limited():
     assert att2.id == att.id == 0
     assert att2.data == att.data == b"Hello World! Bye."
     assert att2.rate_limited is True
+
+
+def test_open_chunked():
+    data = InMemoryCache()
+    cache = BaseAttachmentCache(data)
+
+    chunks = [b"Hello World! ", b"", b"Bye."] * 5
+    for chunk_index, chunk in enumerate(chunks):
+        cache.set_chunk("c:foo", 123, chunk_index, chunk)
+
+    att = CachedAttachment(
+        key="c:foo", id=123, name="lol.txt", content_type="text/plain", chunks=len(chunks)
+    )
+    cache.set("c:foo", [att])
+
+    (att2,) = cache.get("c:foo")
+    with att2.open() as f:
+        assert f.read(5) == b"Hello"
+        assert f.read(10) == b" World! By"
+        assert f.read() == b"".join(chunks)[15:]
+        assert f.read(1) == b""
+
+    assert b"".join(cache.get_chunks(att2)) == att2.data
+
+    # Loaded data is not fetched from the cache again.
+    data.data.clear()
+    assert att2.open().read() == b"".join(chunks)
+
+
+def test_open_missing_chunks():
+    data = InMemoryCache()
+    cache = BaseAttachmentCache(data)
+
+    cache.set_chunk("c:foo", 123, 0, b"Hello World! ")
+
+    att = CachedAttachment(key="c:foo", id=123, name="lol.txt", content_type="text/plain", chunks=2)
+    cache.set("c:foo", [att])
+
+    (att2,) = cache.get("c:foo")
+    f = att2.open()
+    with pytest.raises(MissingAttachmentChunks):
+        f.read()
+
+
+def test_chunked_attachment_file():
+    chunks = [b"abc", b"defg", b"", b"h"]
+
+    f = ChunkedAttachmentFile(chunks)
+    # Reads aligned with chunks return the chunks themselves.
+    assert f.read(3) is chunks[0]
+    assert f.read(2) == b"de"
+    assert f.read(10) == b"fgh"
+    assert f.read(10) == b""
+
+    f = ChunkedAttachmentFile(iter(chunks))
+    assert f.read() == b"abcdefgh"
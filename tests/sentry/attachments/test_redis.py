@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from sentry.utils.compat import mock
 import zlib
 import pytest
@@ -9,6 +11,31 @@ from sentry.utils.imports import import_string
 KEY_FMT = "c:1:%s"
 
 
+class FakePromise:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.keys = []
+
+    def get(self, key):
+        self.keys.append(key)
+
+    def execute(self):
+        return [self.client.get(key) for key in self.keys]
+
+
+class FakeMappingClient:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return FakePromise(self.client.get(key))
+
+
 class FakeClient:
     def __init__(self):
         self.data = {}
@@ -16,6 +43,13 @@ class FakeClient:
     def get(self, key):
         return self.data[key]
 
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    @contextmanager
+    def map(self):
+        yield FakeMappingClient(self)
+
 
 @pytest.fixture
 def mock_client():
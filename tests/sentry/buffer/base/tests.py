@@ -72,3 +72,39 @@ class BufferTest(TestCase):
         self.buf.process(Group, columns, filters, {"last_seen": the_date}, signal_only=True)
         group.refresh_from_db()
         assert group.times_seen == prev_times_seen
+
+    def test_process_batch_bulk_updates(self):
+        group = Group.objects.create(project=Project(id=1))
+        group2 = Group.objects.create(project=Project(id=1))
+        the_date = timezone.now() + timedelta(days=5)
+        with mock.patch("sentry.buffer.base.buffer_incr_complete") as signal:
+            self.buf.process_batch(
+                [
+                    (Group, {"times_seen": 2}, {"id": group.id}, {"last_seen": the_date}, None),
+                    (Group, {"times_seen": 3}, {"id": group2.id}, {"last_seen": the_date}, None),
+                ]
+            )
+        assert len(signal.send_robust.mock_calls) == 2
+
+        group_ = Group.objects.get(id=group.id)
+        assert group_.times_seen == group.times_seen + 2
+        assert group_.last_seen == the_date
+        group2_ = Group.objects.get(id=group2.id)
+        assert group2_.times_seen == group2.times_seen + 3
+        assert group2_.last_seen == the_date
+
+    def test_process_batch_without_existing_row(self):
+        group = Group.objects.create(project=Project(id=1))
+        self.buf.process_batch(
+            [
+                (Group, {"times_seen": 1}, {"id": group.id}, None, None),
+                (Group, {"times_seen": 1}, {"message": "foo bar", "project_id": 1}, None, None),
+            ]
+        )
+        assert Group.objects.get(id=group.id).times_seen == group.times_seen + 1
+        assert Group.objects.get(message="foo bar").times_seen == 2
+
+    @mock.patch("sentry.buffer.base.Buffer.process")
+    def test_process_batch_signal_only(self, process):
+        self.buf.process_batch([(Group, {"times_seen": 1}, {"id": 1}, None, True)])
+        process.assert_called_once_with(Group, {"times_seen": 1}, {"id": 1}, None, True)
@@ -1,13 +1,17 @@
 from datetime import datetime
 import pickle
+import threading
+from time import time
 
 from sentry.utils.compat import mock
 
 from django.utils import timezone
 from django.utils.encoding import force_text
-from sentry.buffer.redis import RedisBuffer
+from sentry.buffer.redis import LocalFlushError, LocalIncrBuffer, RedisBuffer
+from sentry.event_manager import ScoreClause
 from sentry.models import Group, Project
 from sentry.testutils import TestCase
+from sentry.utils import json
 
 
 class RedisBufferTest(TestCase):
@@ -45,6 +49,30 @@ class RedisBufferTest(TestCase):
         client = self.buf.cluster.get_routing_client()
         assert client.zrange("b:p", 0, -1) == []
 
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_chunked(self, process_incr):
+        self.buf.incr_batch_size = 2
+        self.buf.pending_chunk_size = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"foo": 1, "bar": 2, "baz": 3, "new": time() + 60})
+        self.buf.process_pending()
+        assert len(process_incr.apply_async.mock_calls) == 2
+        process_incr.apply_async.assert_any_call(kwargs={"batch_keys": ["foo", "bar"]})
+        process_incr.apply_async.assert_any_call(kwargs={"batch_keys": ["baz"]})
+        client = self.buf.cluster.get_routing_client()
+        # keys added after the run started are left to the next one
+        assert client.zrange("b:p", 0, -1) == [b"new"]
+        assert client.get("l:b:p") is None
+
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_chunked_locked(self, process_incr):
+        self.buf.pending_chunk_size = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"foo": 1})
+            client.set("l:b:p", "1")
+        self.buf.process_pending()
+        assert len(process_incr.apply_async.mock_calls) == 0
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.base.Buffer.process")
     def test_process_does_bubble_up_json(self, process):
@@ -86,6 +114,44 @@ class RedisBufferTest(TestCase):
         self.buf.process("foo")
         process.assert_called_once_with(Group, columns, filters, extra, signal_only)
 
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_batch_flush(self, process_batch):
+        self.buf.incr_batch_flush = True
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo", {"f": '{"pk": ["i","1"]}', "i+times_seen": "2", "m": "sentry.models.Group"}
+        )
+        client.hmset(
+            "bar", {"f": '{"pk": ["i","2"]}', "i+times_seen": "3", "m": "sentry.models.Group"}
+        )
+        client.zadd("b:p", {"foo": 1, "bar": 2})
+        self.buf.process(batch_keys=["foo", "bar", "baz"])
+        process_batch.assert_called_once_with(
+            [
+                (Group, {"times_seen": 2}, {"pk": 1}, {}, None),
+                (Group, {"times_seen": 3}, {"pk": 2}, {}, None),
+            ]
+        )
+        assert client.zrange("b:p", 0, -1) == []
+        assert client.exists("foo", "bar") == 0
+        assert client.keys("l:*") == []
+
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_batch_flush_skips_locked(self, process_batch):
+        self.buf.incr_batch_flush = True
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo", {"f": '{"pk": ["i","1"]}', "i+times_seen": "2", "m": "sentry.models.Group"}
+        )
+        client.hmset(
+            "bar", {"f": '{"pk": ["i","2"]}', "i+times_seen": "3", "m": "sentry.models.Group"}
+        )
+        client.set("l:bar", "1")
+        self.buf.process(batch_keys=["foo", "bar"])
+        process_batch.assert_called_once_with([(Group, {"times_seen": 2}, {"pk": 1}, {}, None)])
+        assert client.exists("bar") == 1
+        assert client.get("l:bar") == b"1"
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.redis.process_incr", mock.Mock())
     def test_incr_saves_to_redis(self):
@@ -121,6 +187,149 @@ class RedisBufferTest(TestCase):
         pending = client.zrange("b:p", 0, -1)
         assert pending == [b"foo"]
 
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.redis.process_incr", mock.Mock())
+    def test_incr_saves_to_redis_json(self):
+        self.buf.wire_format = "json"
+        now = datetime(2017, 5, 3, 6, 6, 6, tzinfo=timezone.utc)
+        client = self.buf.cluster.get_routing_client()
+        model = mock.Mock()
+        model.__name__ = "Mock"
+        columns = {"times_seen": 1}
+        filters = {"pk": 1, "datetime": now}
+        self.buf.incr(
+            model,
+            columns,
+            filters,
+            extra={"foo": "bar", "datetime": now, "data": {"a": [1]}, "score": ScoreClause()},
+        )
+        result = client.hgetall("foo")
+        result = {force_text(k): v for k, v in result.items()}
+        assert result == {
+            "e+foo": b'v1:["s","bar"]',
+            "e+datetime": b'v1:["d","1493791566.000000"]',
+            "e+data": b'v1:["j",{"a":[1]}]',
+            "e+score": b'v1:["sc",""]',
+            "f": b'v1:{"pk":["i","1"],"datetime":["d","1493791566.000000"]}',
+            "i+times_seen": b"1",
+            "m": b"mock.mock.Mock",
+        }
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.base.Buffer.process")
+    def test_process_does_bubble_up_versioned_json(self, process):
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo",
+            {
+                "e+foo": 'v1:["s","bar"]',
+                "f": 'v1:{"pk": ["i","1"]}',
+                "i+times_seen": "2",
+                "m": "sentry.models.Group",
+            },
+        )
+        self.buf.process("foo")
+        process.assert_called_once_with(Group, {"times_seen": 2}, {"pk": 1}, {"foo": "bar"}, None)
+
+    def test_load_json_unknown_version(self):
+        with self.assertRaises(ValueError):
+            self.buf._load_json(b'v2:{"pk": ["i","1"]}', b"{")
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.redis.process_incr", mock.Mock())
+    def test_incr_json_falls_back_to_pickle(self):
+        self.buf.wire_format = "json"
+        client = self.buf.cluster.get_routing_client()
+        model = mock.Mock()
+        model.__name__ = "Mock"
+        self.buf.incr(model, {"times_seen": 1}, {"pk": 1}, extra={"foo": ("bar",)})
+        assert pickle.loads(client.hget("foo", "e+foo")) == ("bar",)
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    def test_incr_local_buffer_coalesces(self):
+        buf = RedisBuffer(local_flush_interval=60)
+        self.addCleanup(buf.local_buffer.close)
+        client = buf.cluster.get_routing_client()
+        model = mock.Mock()
+        model.__name__ = "Mock"
+        buf.incr(model, {"times_seen": 1}, {"pk": 1}, extra={"foo": "bar"})
+        buf.incr(model, {"times_seen": 2}, {"pk": 1}, extra={"foo": "baz"}, signal_only=True)
+        assert client.hgetall("foo") == {}
+
+        buf.local_buffer.flush()
+        result = client.hgetall("foo")
+        result = {force_text(k): v for k, v in result.items()}
+        assert pickle.loads(result.pop("f")) == {"pk": 1}
+        assert pickle.loads(result.pop("e+foo")) == "baz"
+        assert result == {"i+times_seen": b"3", "m": b"mock.mock.Mock", "s": b"1"}
+        assert client.zrange("b:p", 0, -1) == [b"foo"]
+
+    def test_local_buffer_flushes_when_full(self):
+        flushed = threading.Event()
+        buf = LocalIncrBuffer(lambda items: flushed.set(), interval=60, max_keys=2)
+        self.addCleanup(buf.close)
+        buf.incr("foo", Group, {"times_seen": 1}, {"pk": 1})
+        assert not flushed.is_set()
+        buf.incr("bar", Group, {"times_seen": 1}, {"pk": 2})
+        assert flushed.wait(5)
+
+    def test_local_buffer_keeps_failed_flush(self):
+        flush = mock.Mock(side_effect=Exception("redis is down"))
+        buf = LocalIncrBuffer(flush, interval=60, max_keys=10)
+        self.addCleanup(buf.close)
+        buf.incr("foo", Group, {"times_seen": 1}, {"pk": 1}, extra={"a": 1, "b": 1})
+        with self.assertRaises(Exception):
+            buf.flush()
+
+        buf.incr("foo", Group, {"times_seen": 2}, {"pk": 1}, extra={"a": 2})
+        flush.side_effect = None
+        buf.flush()
+        flush.assert_called_with(
+            [("foo", Group, {"times_seen": 3}, {"pk": 1}, {"a": 2, "b": 1}, None)]
+        )
+
+    def test_local_buffer_keeps_failed_hosts(self):
+        buf = RedisBuffer(local_flush_interval=60)
+        self.addCleanup(buf.local_buffer.close)
+
+        # "foo" and "bar" are on different hosts, the second of which fails.
+        pipes = {0: mock.Mock(), 1: mock.Mock()}
+        pipes[1].execute.side_effect = Exception("host is down")
+        buf.cluster = mock.Mock()
+        buf.cluster.get_router.return_value.get_host_for_key.side_effect = lambda key: (
+            0 if key == "foo" else 1
+        )
+        buf.cluster.get_local_client.side_effect = lambda host_id: mock.Mock(
+            pipeline=mock.Mock(return_value=pipes[host_id])
+        )
+
+        buf.local_buffer.incr("foo", Group, {"times_seen": 1}, {"pk": 1})
+        buf.local_buffer.incr("bar", Group, {"times_seen": 1}, {"pk": 2})
+        with self.assertRaises(LocalFlushError):
+            buf.local_buffer.flush()
+
+        # Only the increments of the failed host are written again.
+        pipes[1].execute.side_effect = None
+        buf.local_buffer.flush()
+        pipes[0].hincrby.assert_called_once_with("foo", "i+times_seen", 1)
+        assert pipes[1].hincrby.call_args_list == [mock.call("bar", "i+times_seen", 1)] * 2
+        assert pipes[1].execute.call_count == 2
+
+    def test_local_buffer_close(self):
+        flush = mock.Mock()
+        buf = LocalIncrBuffer(flush, interval=60, max_keys=10)
+        buf.incr("foo", Group, {"times_seen": 1}, {"pk": 1})
+        buf.close()
+        assert not buf._thread.is_alive()
+        flush.assert_called_once_with([("foo", Group, {"times_seen": 1}, {"pk": 1}, None, None)])
+
+    def test_dump_load_value_roundtrip(self):
+        now = datetime(2017, 5, 3, 6, 6, 6, 123456, tzinfo=timezone.utc)
+        for value in ("bar", now, 1, 1.5, True, None, {"a": ["b", 1, None]}):
+            assert (
+                self.buf._load_value(json.loads(json.dumps(self.buf._dump_value(value)))) == value
+            )
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.redis.process_incr")
     @mock.patch("sentry.buffer.redis.process_pending")
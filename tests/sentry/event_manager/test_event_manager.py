@@ -17,6 +17,7 @@ from sentry.event_manager import (
     EventManager,
     EventUser,
     has_pending_commit_resolution,
+    SaveManyError,
 )
 from sentry.grouping.utils import hash_from_values
 from sentry.models import (
@@ -78,6 +79,47 @@ class EventManagerTest(TestCase):
 
         assert event1.group_id != event2.group_id
 
+    def test_save_many(self):
+        managers = []
+        for event_id, message in (("a", "foo bar"), ("b", "foo baz"), ("c", "foo bar")):
+            manager = EventManager(make_event(event_id=event_id * 32, message=message))
+            manager.normalize()
+            managers.append(manager)
+
+        event1, event2, event3 = EventManager.save_many(managers, self.project.id)
+
+        assert event1.event_id == "a" * 32
+        assert event1.group_id != event2.group_id
+        assert event1.group_id == event3.group_id
+        assert Group.objects.get(id=event1.group_id).times_seen == 2
+
+    def test_save_many_failure(self):
+        def make_managers():
+            managers = []
+            for event_id in ("a", "b"):
+                manager = EventManager(make_event(event_id=event_id * 32, message="foo"))
+                manager.normalize()
+                managers.append(manager)
+            return managers
+
+        # Events that failed before they were grouped can be saved again.
+        with mock.patch(
+            "sentry.event_manager._get_hashes_many", side_effect=ValueError("bad batch")
+        ):
+            with pytest.raises(SaveManyError) as excinfo:
+                EventManager.save_many(make_managers(), self.project.id)
+        assert excinfo.value.unsaved == [0, 1]
+        assert not Group.objects.filter(project=self.project).exists()
+
+        # Events that have been counted already cannot.
+        with mock.patch(
+            "sentry.event_manager._tsdb_record_all_metrics", side_effect=ValueError("bad batch")
+        ):
+            with pytest.raises(SaveManyError) as excinfo:
+                EventManager.save_many(make_managers(), self.project.id)
+        assert excinfo.value.unsaved == []
+        assert Group.objects.get(project=self.project).times_seen == 2
+
     def test_ephemeral_interfaces_removed_on_save(self):
         manager = EventManager(make_event(platform="python"))
         manager.normalize()
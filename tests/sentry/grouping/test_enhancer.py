@@ -42,6 +42,15 @@ family:native                                   max-frames=3
     assert isinstance(dumped, str)
 
 
+def test_loads_cached():
+    dumped = Enhancements.from_config_string("function:foo -app", bases=["common:v1"]).dumps()
+
+    enhancements = Enhancements.loads_cached(dumped)
+    assert enhancements.dumps() == dumped
+    assert Enhancements.loads_cached(dumped) is enhancements
+    assert Enhancements.loads_cached(dumped.encode("ascii")) is enhancements
+
+
 def test_parsing_errors():
     with pytest.raises(InvalidEnhancerConfig):
         Enhancements.from_config_string("invalid.message:foo -> bar")
@@ -200,3 +209,69 @@ def test_package_matching():
     assert not bool(
         bundled_rule.get_matching_frame_actions({"package": "/usr/lib/linux-gate.so"}, "native")
     )
+
+
+def test_literal_affixes():
+    enhancement = Enhancements.from_config_string(
+        """
+        path:/Users/*/Code/**                   +app
+        package:linux-gate.so                   -app
+        function:std::*                         -app
+        module:foo.bar                          +app
+    """
+    )
+    path_rule, package_rule, function_rule, module_rule = enhancement.rules
+
+    # Case insensitive, backslashes are normalized and a leading slash is
+    # added for path matches
+    assert path_rule.get_matching_frame_actions({"abs_path": "/users/a/code/x.c"}, "native")
+    assert path_rule.get_matching_frame_actions({"abs_path": "\\Users\\a\\Code\\x.c"}, "native")
+    assert path_rule.get_matching_frame_actions({"abs_path": "Users/a/Code/x.c"}, "native")
+    assert not path_rule.get_matching_frame_actions({"abs_path": "/home/a/Code/x.c"}, "native")
+    assert package_rule.get_matching_frame_actions({"package": "Linux-Gate.so"}, "native")
+    assert not package_rule.get_matching_frame_actions({"package": "linux-gate.so.1"}, "native")
+
+    # Case sensitive for everything else
+    assert function_rule.get_matching_frame_actions({"function": "std::foo"}, "native")
+    assert not function_rule.get_matching_frame_actions({"function": "Std::foo"}, "native")
+    assert module_rule.get_matching_frame_actions({"module": "foo.bar"}, "python")
+    assert not module_rule.get_matching_frame_actions({"module": "foo.bar.baz"}, "python")
+
+
+def test_rules_skipped_by_family():
+    enhancement = Enhancements.from_config_string(
+        """
+        family:native function:foo              -app
+        family:javascript function:foo          +app
+        function:bar                            -app
+    """
+    )
+    native_rule, js_rule, any_rule = enhancement.rules
+
+    frames = [{"function": "foo", "platform": "javascript"}, {"function": "bar"}]
+    caches = [{} for _ in frames]
+    assert list(enhancement._iter_rules_for_frames(frames, "javascript", caches)) == [
+        js_rule,
+        any_rule,
+    ]
+
+    enhancement.apply_modifications_to_frame(frames, "javascript")
+    assert frames[0]["in_app"] is True
+    assert frames[1]["in_app"] is False
+
+
+def test_match_cache_ignores_app():
+    enhancement = Enhancements.from_config_string(
+        """
+        function:foo                            -app
+        function:foo app:no                     +group
+    """
+    )
+    app_rule, group_rule = enhancement.rules
+
+    frame = {"function": "foo", "in_app": True}
+    cache = {}
+    assert not group_rule.get_matching_frame_actions(frame, "python", cache)
+    assert app_rule.get_matching_frame_actions(frame, "python", cache)
+    frame["in_app"] = False
+    assert group_rule.get_matching_frame_actions(frame, "python", cache)
@@ -1,5 +1,6 @@
 import pytest
 
+from sentry.grouping.api import get_fingerprinting_config_for_project
 from sentry.grouping.fingerprinting import FingerprintingRules, InvalidFingerprintingConfig
 
 from tests.sentry.grouping import with_fingerprint_input
@@ -78,6 +79,58 @@ logger:sentry.*                                 -> logger, {{ logger }}, title="
     }
 
 
+@pytest.mark.django_db
+def test_project_config_cached(default_project):
+    default_project.update_option("sentry:fingerprinting_rules", "type:Foo -> foo")
+    rules = get_fingerprinting_config_for_project(default_project)
+    assert rules.to_json()["rules"][0]["fingerprint"] == ["foo"]
+    assert get_fingerprinting_config_for_project(default_project) is rules
+
+    default_project.update_option("sentry:fingerprinting_rules", "type:Foo -> bar")
+    rules = get_fingerprinting_config_for_project(default_project)
+    assert rules.to_json()["rules"][0]["fingerprint"] == ["bar"]
+
+
+def test_indexed_rules():
+    rules = FingerprintingRules.from_config_string(
+        """
+type:DatabaseUnavailable                        -> database
+function:foo module:bar*                        -> foo-bar
+tags.server_name:web-1                          -> web-1
+function:foo module:baz*                        -> foo-baz
+message:*timeout*                               -> timeout
+type:DatabaseUnavailable function:foo           -> never
+"""
+    )
+    index_keys = [rule.index_key for rule in rules.rules]
+    assert index_keys == [
+        ("type", "DatabaseUnavailable"),
+        ("function", "foo"),
+        ("tags.server_name", "web-1"),
+        ("function", "foo"),
+        None,
+        ("type", "DatabaseUnavailable"),
+    ]
+
+    def get_fingerprint(event):
+        rv = rules.get_fingerprint_values_for_event(event)
+        return rv[1] if rv is not None else None
+
+    frames = [{"function": "foo", "module": "bazinga"}, {"function": "main"}]
+    assert get_fingerprint({"stacktrace": {"frames": frames}}) == ["foo-baz"]
+    assert get_fingerprint(
+        {"stacktrace": {"frames": frames}, "tags": [["server_name", "web-1"]]}
+    ) == ["web-1"]
+    assert get_fingerprint(
+        {"stacktrace": {"frames": frames}, "logentry": {"formatted": "read timeout"}}
+    ) == ["foo-baz"]
+    assert get_fingerprint({"logentry": {"formatted": "read timeout"}}) == ["timeout"]
+    assert get_fingerprint({"exception": {"values": [{"type": "DatabaseUnavailable"}]}}) == [
+        "database"
+    ]
+    assert get_fingerprint({"exception": {"values": [{"type": "ValueError"}]}}) is None
+
+
 def test_parsing_errors():
     with pytest.raises(InvalidFingerprintingConfig):
         FingerprintingRules.from_config_string("invalid.message:foo -> bar")
@@ -1,9 +1,13 @@
 import pytest
 
+from django.test.utils import override_settings
+
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
+from sentry.grouping import api
 from sentry.grouping.api import get_default_grouping_config_dict
 from sentry.utils import json
+from sentry.utils.compat import mock
 
 from tests.sentry.grouping import with_grouping_input
 
@@ -69,3 +73,25 @@ def test_event_hash_variant(config_name, grouping_input, insta_snapshot, log):
     assert evt.get_grouping_config() == grouping_config
 
     insta_snapshot(output)
+
+
+@with_grouping_input("grouping_input")
+def test_event_hash_variant_cached(grouping_input):
+    grouping_config = get_default_grouping_config_dict()
+    evt = grouping_input.create_event(grouping_config)
+    evt.project = None
+
+    def get_variants():
+        return {k: v.as_dict() for k, v in evt.get_grouping_variants().items()}
+
+    expected = get_variants()
+
+    api._component_cache.clear()
+    with override_settings(SENTRY_GROUPING_COMPONENT_CACHE_SIZE=10), mock.patch(
+        "sentry.grouping.api._get_calculated_grouping_variants_for_event",
+        wraps=api._get_calculated_grouping_variants_for_event,
+    ) as calculate:
+        assert get_variants() == expected
+        assert get_variants() == expected
+        # Events with a checksum are not grouped by components at all
+        assert calculate.call_count == (0 if evt.data.get("checksum") else 1)
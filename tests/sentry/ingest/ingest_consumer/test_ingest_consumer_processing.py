@@ -4,12 +4,15 @@ import time
 
 from sentry.utils import json
 from sentry.ingest.ingest_consumer import (
+    IngestConsumerWorker,
     process_event,
+    process_events,
     process_attachment_chunk,
     process_individual_attachment,
     process_userreport,
 )
 from sentry.event_manager import EventManager
+from sentry.eventstore.processing import event_processing_store
 from sentry.models import EventAttachment, EventUser, File, UserReport
 
 
@@ -59,6 +62,34 @@ def test_deduplication_works(default_project, task_runner, preprocess_event):
     }
 
 
+@pytest.mark.django_db
+def test_process_events(default_project, task_runner, preprocess_event):
+    payloads = [
+        get_normalized_event({"message": message}, default_project)
+        for message in ("hello", "world")
+    ]
+    start_time = time.time() - 3600
+
+    messages = [
+        {
+            "payload": json.dumps(payload),
+            "start_time": start_time,
+            "event_id": payload["event_id"],
+            "project_id": default_project.id,
+            "remote_addr": "127.0.0.1",
+        }
+        for payload in payloads
+    ]
+
+    # The duplicated event is only processed once.
+    process_events(messages + messages[:1], projects={default_project.id: default_project})
+
+    cache_keys = [f"e:{payload['event_id']}:{default_project.id}" for payload in payloads]
+    assert [kwargs["cache_key"] for kwargs in preprocess_event] == cache_keys
+    assert [kwargs["data"] for kwargs in preprocess_event] == payloads
+    assert event_processing_store.get_many(cache_keys) == payloads
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize("missing_chunks", (True, False))
 def test_with_attachments(default_project, task_runner, missing_chunks, monkeypatch):
@@ -311,3 +342,81 @@ def test_individual_attachments_missing_chunks(default_project, factories, monke
     attachments = list(EventAttachment.objects.filter(project_id=project_id, event_id=event_id))
 
     assert not attachments
+    # The file the chunks were streamed into is removed again.
+    assert not File.objects.filter(name="foo.txt").exists()
+
+
+@pytest.fixture
+def processed_messages(monkeypatch):
+    calls = []
+
+    def record(message, projects):
+        if message.get("fail"):
+            raise ValueError("processing failed")
+        calls.append((message["type"], message["project_id"], message["event_id"]))
+
+    def record_many(messages, projects):
+        for message in messages:
+            record(message, projects)
+
+    for name in ("process_event", "process_attachment_chunk", "process_individual_attachment"):
+        monkeypatch.setattr(f"sentry.ingest.ingest_consumer.{name}", record)
+    monkeypatch.setattr("sentry.ingest.ingest_consumer.process_events", record_many)
+    return calls
+
+
+@pytest.mark.django_db
+def test_concurrent_flush(default_project, factories, processed_messages):
+    other_project = factories.create_project(organization=default_project.organization)
+
+    batch = []
+    for i in range(10):
+        for project in (default_project, other_project):
+            batch.append({"type": "event", "project_id": project.id, "event_id": i})
+            batch.append({"type": "attachment_chunk", "project_id": project.id, "event_id": i})
+            batch.append({"type": "attachment", "project_id": project.id, "event_id": i})
+
+    worker = IngestConsumerWorker(concurrency=4)
+    try:
+        worker.flush_batch(batch)
+    finally:
+        worker.shutdown()
+
+    assert len(processed_messages) == len(batch)
+
+    # All attachment chunks are stored before any other message is processed.
+    message_types = [message_type for message_type, _, _ in processed_messages]
+    assert set(message_types[:20]) == {"attachment_chunk"}
+
+    # The messages of a project are processed in order.
+    for project in (default_project, other_project):
+        expected = [
+            (message["type"], message["project_id"], message["event_id"])
+            for message in batch
+            if message["project_id"] == project.id and message["type"] != "attachment_chunk"
+        ]
+        assert [
+            call
+            for call in processed_messages
+            if call[1] == project.id and call[0] != "attachment_chunk"
+        ] == expected
+
+
+@pytest.mark.django_db
+def test_concurrent_flush_failure(default_project, factories, processed_messages):
+    other_project = factories.create_project(organization=default_project.organization)
+
+    batch = [
+        {"type": "event", "project_id": default_project.id, "event_id": 1, "fail": True},
+        {"type": "event", "project_id": other_project.id, "event_id": 2},
+    ]
+
+    worker = IngestConsumerWorker(concurrency=2)
+    try:
+        with pytest.raises(ValueError):
+            worker.flush_batch(batch)
+    finally:
+        worker.shutdown()
+
+    # The other partitions are processed before the error is raised.
+    assert processed_messages == [("event", other_project.id, 2)]
@@ -1,10 +1,12 @@
 import os
+from hashlib import sha1
 
 from django.core.files.base import ContentFile
 from django.db import DatabaseError
 from unittest.mock import patch
 
-from sentry.models import File, FileBlob, FileBlobIndex
+from sentry.models import File, FileBlob, FileBlobIndex, FileBlobOwner
+from sentry.models.file import get_storage
 from sentry.testutils import TestCase
 from sentry.utils.compat import map
 
@@ -25,6 +27,33 @@ class FileBlobTest(TestCase):
         assert my_file1.checksum == my_file2.checksum
         assert my_file1.path == my_file2.path
 
+    def test_from_files(self):
+        existing = FileBlob.from_file(ContentFile(b"foo"))
+        FileBlobOwner.objects.create(organization=self.organization, blob=existing)
+
+        files = [ContentFile(b"foo"), ContentFile(b"bar"), ContentFile(b"baz"), ContentFile(b"bar")]
+        with patch("sentry.models.file.get_storage", wraps=get_storage) as storage:
+            FileBlob.from_files(files, organization=self.organization)
+
+        # Only the blobs that did not exist yet are uploaded, once each.
+        assert storage.call_count == 2
+
+        blobs = FileBlob.objects.filter(
+            checksum__in=[sha1(x).hexdigest() for x in (b"foo", b"bar", b"baz")]
+        )
+        assert len(blobs) == 3
+        assert existing in blobs
+        for blob in blobs:
+            FileBlobOwner.objects.get(organization=self.organization, blob=blob)
+            assert blob.getfile().read() in (b"foo", b"bar", b"baz")
+
+    def test_from_files_checksum_mismatch(self):
+        files = [(ContentFile(b"foo"), sha1(b"foo").hexdigest()), (ContentFile(b"bar"), "0" * 40)]
+        with self.assertRaises(OSError):
+            FileBlob.from_files(files, organization=self.organization)
+
+        assert not FileBlob.objects.exists()
+
     def test_generate_unique_path(self):
         path = FileBlob.generate_unique_path()
         assert path
@@ -135,3 +164,30 @@ class FileTest(TestCase):
 
         f = file.getfile(prefetch=True)
         assert f.read() == random_data
+
+    def test_range_read(self):
+        random_data = os.urandom(10000)
+
+        fileobj = ContentFile(random_data)
+        file = File.objects.create(name="test.bin", type="default", size=len(random_data))
+        file.putfile(fileobj, 1000)
+
+        with patch.object(
+            FileBlob, "getfile", autospec=True, side_effect=FileBlob.getfile
+        ) as getfile, file.getfile() as fp:
+            # Opening the file fetches the first blob, after that only the
+            # blobs covering the requested range are fetched.
+            fp.seek(7990)
+            assert fp.tell() == 7990
+            assert fp.read(20) == random_data[7990:8010]
+            assert fp.tell() == 8010
+            assert getfile.call_count == 3
+
+            # Recently read blobs are not fetched again.
+            fp.seek(7500)
+            assert fp.read(10) == random_data[7500:7510]
+            fp.seek(0)
+            assert fp.read(10) == random_data[:10]
+            fp.seek(7995)
+            assert fp.read() == random_data[7995:]
+            assert getfile.call_count == 4
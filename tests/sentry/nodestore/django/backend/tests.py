@@ -1,3 +1,4 @@
+import base64
 from datetime import timedelta
 import pickle
 
@@ -51,6 +52,26 @@ class TestDjangoNodeStorage:
             b'{"foo":"bar"}'
         )
 
+    def test_set_compression(self):
+        ns = DjangoNodeStorage(compression="zstd")
+        ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+        data = Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data
+        assert base64.b64decode(data)[:1] == b"\x02"
+
+        # Nodes are readable regardless of the configured codec
+        for storage in [ns, self.ns]:
+            value = storage._get_bytes("d2502ebbd7df41ceba8d3275595cac33")
+            assert storage._decode(value, subkey=None) == {"foo": "bar"}
+
+    def test_get_corrupt(self):
+        # Codec errors are raised rather than returning an empty node
+        Node.objects.create(
+            id="d2502ebbd7df41ceba8d3275595cac33",
+            data=base64.b64encode(b"\x02not zstd").decode("utf-8"),
+        )
+        with pytest.raises(Exception):
+            self.ns.get("d2502ebbd7df41ceba8d3275595cac33")
+
     def test_delete(self):
         node = Node.objects.create(id="d2502ebbd7df41ceba8d3275595cac33", data=b'{"foo": "bar"}')
 
@@ -125,6 +146,15 @@ class TestDjangoNodeStorage:
             assert self.ns.get(node_1[0]) == new_value
             assert mock_get.call_count == 0
 
+        # Setting multiple items updates cache
+        self.ns.set_multi({node_1[0]: node_1[1], node_2[0]: node_2[1]})
+        with mock.patch.object(Node.objects, "filter") as mock_filter:
+            assert self.ns.get_multi([node_1[0], node_2[0]]) == {
+                node_1[0]: node_1[1],
+                node_2[0]: node_2[1],
+            }
+            assert mock_filter.call_count == 0
+
         # Missing rows are never cached
         assert self.ns.get("node_4") is None
         with mock.patch.object(Node.objects, "get") as mock_get:
@@ -51,6 +51,19 @@ def test_set(ns):
     assert ns.get(node_id) == data
 
 
+def test_set_multi(ns):
+    nodes = {"a" * 32: {"foo": "a"}, "b" * 32: {"foo": "b"}}
+    ns.set_subkeys("a" * 32, {None: {"foo": "old"}, "other": {"foo": "old"}})
+
+    ns.set_multi(nodes)
+    assert ns.get_multi(list(nodes)) == nodes
+    assert ns.get("a" * 32, subkey="other") is None
+
+    ns.set_subkeys_multi({"a" * 32: {None: {"foo": "a"}, "other": {"foo": "b"}}})
+    assert ns.get("a" * 32) == {"foo": "a"}
+    assert ns.get("a" * 32, subkey="other") == {"foo": "b"}
+
+
 def test_delete(ns):
     node_id = "d2502ebbd7df41ceba8d3275595cac33"
     data = {"foo": "bar"}
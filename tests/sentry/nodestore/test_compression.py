@@ -0,0 +1,62 @@
+import zlib
+
+import pytest
+import zstandard
+
+from sentry.nodestore.compression import CodecRegistry, load_dictionaries
+from sentry.utils import json
+
+
+@pytest.fixture
+def samples():
+    return [
+        json.dumps(
+            {"platform": "python", "event_id": str(i), "logentry": {"formatted": "x" * (i % 7)}}
+        ).encode("utf8")
+        for i in range(500)
+    ]
+
+
+@pytest.fixture
+def dictionaries(samples):
+    return {"python": zstandard.train_dictionary(4096, samples)}
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_roundtrip(codec, samples, dictionaries):
+    codecs = CodecRegistry(codec, dictionaries)
+
+    for platform in ["python", "javascript", None]:
+        data = codecs.compress(samples[0], platform=platform)
+        assert data[:1] == codecs.codecs[codec].header
+        assert codecs.decompress(data) == samples[0]
+
+
+def test_legacy_format():
+    assert CodecRegistry().compress(b"foo") == zlib.compress(b"foo")
+    assert CodecRegistry("zstd").decompress(zlib.compress(b"foo")) == b"foo"
+
+
+def test_dictionary(samples, dictionaries):
+    codecs = CodecRegistry("zstd", dictionaries)
+
+    data = codecs.compress(samples[0], platform="python")
+    assert len(data) < len(codecs.compress(samples[0]))
+    assert codecs.decompress(data) == samples[0]
+
+    with pytest.raises(ValueError):
+        CodecRegistry("zstd").decompress(data)
+
+
+def test_invalid_codec():
+    with pytest.raises(ValueError):
+        CodecRegistry("lzma")
+
+
+def test_load_dictionaries(tmpdir, dictionaries):
+    tmpdir.join("python.dict").write_binary(dictionaries["python"].as_bytes())
+    tmpdir.join("README").write("not a dictionary")
+
+    loaded = load_dictionaries(str(tmpdir))
+    assert list(loaded) == ["python"]
+    assert loaded["python"].dict_id() == dictionaries["python"].dict_id()
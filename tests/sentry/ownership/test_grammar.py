@@ -1,12 +1,14 @@
 import pytest
 
 from sentry.ownership.grammar import (
+    CompiledRules,
     Rule,
     Matcher,
     Owner,
     parse_rules,
     dump_schema,
     load_schema,
+    load_compiled_schema,
     parse_code_owners,
     convert_codeowners_syntax,
 )
@@ -212,3 +214,60 @@ def test_convert_codeowners_syntax():
         )
         == "\n# cool stuff comment\npath:*.js front-sentry nisanthan.nanthakumar@sentry.io\n# good comment\n\n\npath:webpack://docs/* docs-sentry ecosystem\npath:src/sentry/* anotheruser@sentry.io\npath:api/* nisanthan.nanthakumar@sentry.io\n"
     )
+
+
+def test_compiled_rules():
+    rules = [
+        Rule(Matcher("path", "src/sentry/*"), []),
+        Rule(Matcher("path", "*.js"), []),
+        Rule(Matcher("path", "*foo*"), []),
+        Rule(Matcher("path", "SRC\\app\\*"), []),
+        Rule(Matcher("module", "foo.*"), []),
+        Rule(Matcher("url", "http://google.com/*"), []),
+        Rule(Matcher("tags.foo", "bar*"), []),
+        Rule(Matcher("tags.baz", "qux"), []),
+    ]
+    compiled = CompiledRules(rules)
+
+    events = [
+        {"exception": {"values": [{"stacktrace": {"frames": [{"filename": "src/sentry/a.py"}]}}]}},
+        {"stacktrace": {"frames": [{"abs_path": "SRC\\Sentry\\A.JS"}, {"module": "foo.bar"}]}},
+        {"stacktrace": {"frames": [{"filename": "src/app/foo.py"}, {"filename": "lib/b.py"}]}},
+        {"request": {"url": "http://google.com/search"}, "tags": [["foo", "barbaz"]]},
+        {"request": {"url": "http://example.com/"}, "tags": [["baz", "qux"], ["foo", "x"]]},
+        {},
+    ]
+    for data in events:
+        assert compiled.get_matching_rules(data) == [rule for rule in rules if rule.test(data)]
+
+
+def test_compiled_rules_double_star():
+    rules = [
+        Rule(Matcher("path", "**/foo.py"), []),
+        Rule(Matcher("path", "**/src/foo.py"), []),
+        Rule(Matcher("path", "src/**/bar.py"), []),
+        Rule(Matcher("path", "lib/**"), []),
+    ]
+    compiled = CompiledRules(rules)
+
+    events = [
+        {"stacktrace": {"frames": [{"filename": "foo.py"}]}},
+        {"stacktrace": {"frames": [{"filename": "src/foo.py"}]}},
+        {"stacktrace": {"frames": [{"filename": "app/src/foo.py"}]}},
+        {"stacktrace": {"frames": [{"filename": "src/bar.py"}]}},
+        {"stacktrace": {"frames": [{"filename": "lib"}, {"filename": "lib/a.py"}]}},
+    ]
+    # A leading `**/` matches top-level files too
+    assert 0 in compiled.frame_indexes["path"].get_candidates("foo.py")
+    assert 1 in compiled.frame_indexes["path"].get_candidates("src/foo.py")
+    for data in events:
+        assert compiled.get_matching_rules(data) == [rule for rule in rules if rule.test(data)]
+
+
+def test_load_compiled_schema_cached():
+    schema = dump_schema(parse_rules(fixture_data))
+    compiled = load_compiled_schema(schema, ("test", 1))
+    assert [rule.dump() for rule in compiled.rules] == schema["rules"]
+    assert load_compiled_schema(schema, ("test", 1)) is compiled
+    assert load_compiled_schema(schema, ("test", 2)) is not compiled
+    assert load_compiled_schema(schema) is not compiled
@@ -83,6 +83,133 @@ class RuleProcessorTest(TestCase):
         results = list(rp.apply())
         assert len(results) == 0
 
+    def test_get_rule_statuses(self):
+        other_rule = Rule.objects.create(
+            project=self.event.project,
+            data={"conditions": [EVERY_EVENT_COND_DATA], "actions": [EMAIL_ACTION_DATA]},
+        )
+        existing = GroupRuleStatus.objects.create(
+            rule=other_rule, group=self.event.group, project=self.event.project
+        )
+        rp = RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+        )
+
+        statuses = rp.get_rule_statuses([self.rule, other_rule])
+        assert statuses[other_rule.id] == existing
+        assert statuses[self.rule.id] == GroupRuleStatus.objects.get(
+            rule=self.rule, group=self.event.group
+        )
+        assert GroupRuleStatus.objects.filter(group=self.event.group).count() == 2
+
+        # The statuses are cached now
+        with self.assertNumQueries(0):
+            assert rp.get_rule_statuses([self.rule, other_rule]) == statuses
+
+    def test_get_rule_statuses_concurrently_created(self):
+        rp = RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+        )
+
+        fetch_rule_statuses = rp._fetch_rule_statuses
+
+        def fetch_and_create(rule_ids):
+            # Simulates another process creating the status between the
+            # lookup and the bulk insert.
+            statuses = fetch_rule_statuses(rule_ids)
+            GroupRuleStatus.objects.get_or_create(
+                rule=self.rule, group=self.event.group, defaults={"project": self.event.project}
+            )
+            return statuses
+
+        with patch.object(rp, "_fetch_rule_statuses", side_effect=fetch_and_create):
+            status = rp.get_rule_status(self.rule)
+
+        assert status == GroupRuleStatus.objects.get(rule=self.rule, group=self.event.group)
+
+    def test_shared_rule_statuses(self):
+        rule_statuses = {}
+        rp = RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+            rule_statuses=rule_statuses,
+        )
+        assert len(list(rp.apply())) == 1
+        status = rule_statuses[self.rule.id]
+        assert status.last_active is not None
+
+        rp = RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+            rule_statuses=rule_statuses,
+        )
+        with patch.object(rp, "_get_rule_statuses") as get_rule_statuses:
+            assert len(list(rp.apply())) == 0
+        assert not get_rule_statuses.called
+
+    def test_frequency_queries_batched(self):
+        frequency_condition = {
+            "id": "sentry.rules.conditions.event_frequency.EventFrequencyCondition",
+            "interval": "1h",
+            "value": 10,
+        }
+        self.rule.update(data={"conditions": [frequency_condition], "actions": [EMAIL_ACTION_DATA]})
+        other_rule = Rule.objects.create(
+            project=self.event.project,
+            data={
+                "conditions": [
+                    frequency_condition,
+                    {
+                        "id": "sentry.rules.conditions.event_frequency.EventUniqueUserFrequencyCondition",
+                        "interval": "1h",
+                        "value": 10,
+                    },
+                ],
+                "action_match": "any",
+                "actions": [EMAIL_ACTION_DATA],
+            },
+        )
+        rp = RuleProcessor(
+            self.event,
+            is_new=True,
+            is_regression=True,
+            is_new_group_environment=True,
+            has_reappeared=True,
+        )
+
+        with patch(
+            "sentry.tsdb.get_totals_multi", side_effect=lambda queries, **kwargs: [20, 5]
+        ) as get_totals_multi, patch("sentry.tsdb.get_sums") as get_sums, patch(
+            "sentry.tsdb.get_distinct_counts_totals"
+        ) as get_distinct_counts_totals:
+            results = list(rp.apply())
+
+        # The identical queries of both rules are made once, in one request
+        assert get_totals_multi.call_count == 1
+        queries = get_totals_multi.call_args[0][0]
+        assert [query[0] for query in queries] == ["get_sums", "get_distinct_counts_totals"]
+        assert not get_sums.called
+        assert not get_distinct_counts_totals.called
+
+        assert {future.rule for _, futures in results for future in futures} == {
+            self.rule,
+            other_rule,
+        }
+
 
 # mock filter which always passes
 class MockFilterTrue(EventFilter):
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+
+import msgpack
+from exam import fixture
+
+from sentry.similarity.backends.memory import InMemoryMinHashIndexBackend
+from sentry.similarity.signatures import MinHashSignatureBuilder
+from sentry.testutils import TestCase
+
+from .base import MinHashIndexBackendTestMixin
+
+
+signature_builder = MinHashSignatureBuilder(32, 0xFFFF)
+
+
+class InMemoryMinHashIndexBackendTestCase(MinHashIndexBackendTestMixin, TestCase):
+    @fixture
+    def index(self):
+        return InMemoryMinHashIndexBackend(signature_builder, 16, 60 * 60, 12, 10)
+
+    def test_export_import(self):
+        self.index.record("example", "1", [("index", "hello world")])
+
+        timestamp = int(time.time())
+        result = self.index.export("example", [("index", 1)], timestamp=timestamp)
+        assert len(result) == 1
+
+        # Copy the data from key 1 to key 2.
+        self.index.import_("example", [("index", 2, result[0])], timestamp=timestamp)
+
+        r1 = msgpack.unpackb(self.index.export("example", [("index", 1)], timestamp=timestamp)[0])
+        r2 = msgpack.unpackb(self.index.export("example", [("index", 2)], timestamp=timestamp)[0])
+        assert r1 == r2
+
+        assert self.index.compare("example", "1", [("index", 0)], timestamp=timestamp) == [
+            ("1", [1.0]),
+            ("2", [1.0]),
+        ]
+
+        # Nothing is exported for keys without data.
+        assert self.index.export("example", [("index", 3)], timestamp=timestamp) == [
+            msgpack.packb([])
+        ]
+
+    def test_expiration(self):
+        timestamp = int(time.time())
+        self.index.record("example", "1", [("index", "hello world")], timestamp=timestamp)
+
+        assert self.index.classify(
+            "example", [("index", 0, "hello world")], timestamp=timestamp
+        ) == [("1", [1.0])]
+
+        # The data expires after the retention period.
+        assert (
+            self.index.classify(
+                "example", [("index", 0, "hello world")], timestamp=timestamp + 60 * 60 * 13
+            )
+            == []
+        )
+
+    def test_evicts_expired_entries(self):
+        timestamp = int(time.time())
+        self.index.record("example", "1", [("index", "hello world")], timestamp=timestamp)
+
+        index = self.index._indexes[("example", "index")]
+        assert "1" in index.frequencies
+        assert index.members
+
+        # Recording another key after the retention period evicts the first one.
+        timestamp += 60 * 60 * 13
+        self.index.record("example", "2", [("index", "jello world")], timestamp=timestamp)
+        assert list(index.frequencies) == ["2"]
+        assert all(
+            keys == {"2"} for time_series in index.members.values() for keys in time_series.values()
+        )
+
+        # Saving evicts indexes that only contain expired entries.
+        with tempfile.TemporaryDirectory() as directory:
+            self.index.path = os.path.join(directory, "index")
+            self.index.save(timestamp=timestamp + 60 * 60 * 13)
+        assert self.index._indexes == {}
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index")
+
+            index = InMemoryMinHashIndexBackend(signature_builder, 16, 60 * 60, 12, 10, path=path)
+            index.record("example", "1", [("index", "hello world")])
+            index.record("example", "2", [("index", "jello world")])
+            index.save()
+
+            loaded = InMemoryMinHashIndexBackend(signature_builder, 16, 60 * 60, 12, 10, path=path)
+            assert loaded.compare("example", "1", [("index", 0)]) == index.compare(
+                "example", "1", [("index", 0)]
+            )
+            assert loaded.export("example", [("index", "2")]) == index.export(
+                "example", [("index", "2")]
+            )
@@ -1,6 +1,9 @@
 from collections import Counter
 from unittest import TestCase
 
+import mmh3
+import pytest
+
 from sentry.similarity.signatures import MinHashSignatureBuilder
 from sentry.utils.compat import map
 from sentry.utils.compat import zip
@@ -30,3 +33,24 @@ class MinHashSignatureBuilderTestCase(TestCase):
         self.assertAlmostEqual(
             similarity, estimation, delta=0.1  # totally made up constant, seems reasonable
         )
+
+    def test_build_many(self):
+        get_signature = MinHashSignatureBuilder(16, 0xFFFF)
+        feature_sets = [
+            {b"foo", b"bar", b"baz"},
+            [b"bar", b"qux", b"bar"],
+            [b"hello world"],
+        ]
+
+        expected = [
+            [
+                min(mmh3.hash(feature, column) % 0xFFFF for feature in features)
+                for column in range(16)
+            ]
+            for features in feature_sets
+        ]
+        assert get_signature.build_many(feature_sets) == expected
+        assert [get_signature(features) for features in feature_sets] == expected
+
+        with pytest.raises(ValueError):
+            get_signature.build_many([[b"foo"], []])
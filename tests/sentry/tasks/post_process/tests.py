@@ -19,8 +19,13 @@ from sentry.testutils.helpers import with_feature
 from sentry.testutils.helpers.datetime import iso_format, before_now
 from sentry.testutils.helpers.eventprocessing import write_event_to_cache
 from sentry.tasks.merge import merge_groups
-from sentry.tasks.post_process import post_process_group
-from sentry.utils.compat.mock import Mock, patch, ANY
+from sentry.tasks.post_process import (
+    _get_coalesced_events,
+    coalesce_post_process_group,
+    post_process_group,
+    post_process_group_batch,
+)
+from sentry.utils.compat.mock import Mock, patch, ANY, call
 
 
 class EventMatcher:
@@ -740,3 +745,165 @@ class PostProcessGroupAssignmentTest(TestCase):
         )
         assignee = event.group.assignee_set.first()
         assert assignee is None
+
+
+class PostProcessGroupBatchTest(TestCase):
+    def store_events(self, count):
+        events = [
+            self.store_event(
+                data={"message": "testing", "fingerprint": ["group-1"]},
+                project_id=self.project.id,
+            )
+            for _ in range(count)
+        ]
+        assert len({event.group_id for event in events}) == 1
+        return events, [write_event_to_cache(event) for event in events]
+
+    def coalesce(self, group_id, cache_keys):
+        for cache_key in cache_keys:
+            coalesce_post_process_group(
+                window=10,
+                is_new=False,
+                is_regression=False,
+                is_new_group_environment=False,
+                primary_hash=None,
+                cache_key=cache_key,
+                group_id=group_id,
+            )
+
+    @patch("sentry.tasks.post_process.post_process_group_batch.apply_async")
+    def test_coalesce(self, mock_apply_async):
+        events, cache_keys = self.store_events(3)
+        group_id = events[0].group_id
+
+        self.coalesce(group_id, cache_keys)
+
+        # Only the first event schedules the task
+        mock_apply_async.assert_called_once_with(kwargs={"group_id": group_id}, countdown=10)
+
+        entries = _get_coalesced_events(group_id)
+        assert [entry["cache_key"] for entry in entries] == cache_keys
+        assert entries[0]["group_id"] == group_id
+
+    @patch("sentry.tasks.post_process.post_process_group_batch.apply_async")
+    def test_coalesce_schedule_failure(self, mock_apply_async):
+        events, cache_keys = self.store_events(2)
+        group_id = events[0].group_id
+
+        # The next event schedules the task if scheduling it failed
+        mock_apply_async.side_effect = Exception("broker is down")
+        with self.assertRaises(Exception):
+            self.coalesce(group_id, cache_keys[:1])
+
+        mock_apply_async.side_effect = None
+        self.coalesce(group_id, cache_keys[1:])
+        assert mock_apply_async.call_count == 2
+        assert [entry["cache_key"] for entry in _get_coalesced_events(group_id)] == cache_keys
+
+    @patch("sentry.tasks.post_process.COALESCE_BATCH_SIZE", 1)
+    @patch("sentry.tasks.post_process.handle_owner_assignment")
+    @patch("sentry.rules.processor.RuleProcessor")
+    def test_batch_size(self, mock_processor, mock_handle_owner_assignment):
+        events, cache_keys = self.store_events(2)
+        group_id = events[0].group_id
+        mock_processor.return_value.apply.return_value = []
+
+        with patch("sentry.tasks.post_process.post_process_group_batch.apply_async"):
+            self.coalesce(group_id, cache_keys)
+
+        # The rest of the events is left to a follow-up task
+        with patch(
+            "sentry.tasks.post_process.post_process_group_batch.apply_async"
+        ) as mock_apply_async, patch("sentry.similarity.record"):
+            post_process_group_batch(group_id=group_id)
+        mock_apply_async.assert_called_once_with(kwargs={"group_id": group_id}, countdown=0)
+        assert mock_processor.call_count == 1
+        assert [entry["cache_key"] for entry in _get_coalesced_events(group_id)] == cache_keys[1:]
+
+        # Once all events are done, the next event schedules a new task
+        with patch(
+            "sentry.tasks.post_process.post_process_group_batch.apply_async"
+        ) as mock_apply_async, patch("sentry.similarity.record"):
+            post_process_group_batch(group_id=group_id)
+            assert mock_apply_async.call_count == 0
+            self.coalesce(group_id, cache_keys[:1])
+            assert mock_apply_async.call_count == 1
+        assert mock_processor.call_count == 2
+
+    @patch("sentry.tasks.post_process.handle_owner_assignment")
+    @patch("sentry.tasks.post_process.process_snoozes", return_value=False)
+    @patch("sentry.rules.processor.RuleProcessor")
+    def test_batch(self, mock_processor, mock_process_snoozes, mock_handle_owner_assignment):
+        events, cache_keys = self.store_events(2)
+        group_id = events[0].group_id
+
+        mock_callback = Mock()
+        mock_futures = [Mock()]
+        mock_processor.return_value.apply.return_value = [(mock_callback, mock_futures)]
+
+        with patch("sentry.tasks.post_process.post_process_group_batch.apply_async"):
+            self.coalesce(group_id, cache_keys)
+
+        with patch("sentry.similarity.record") as mock_record:
+            post_process_group_batch(group_id=group_id)
+
+        # Work shared by the events is done once
+        assert mock_process_snoozes.call_count == 1
+        assert mock_handle_owner_assignment.call_count == 1
+        mock_record.assert_called_once_with(self.project, [EventMatcher(event) for event in events])
+
+        # Rules are applied for every event, with shared rule statuses
+        assert mock_processor.call_args_list == [
+            call(EventMatcher(event), False, False, False, False, rule_statuses={})
+            for event in events
+        ]
+        rule_statuses = [c[1]["rule_statuses"] for c in mock_processor.call_args_list]
+        assert rule_statuses[0] is rule_statuses[1]
+        assert mock_callback.call_args_list == [
+            call(EventMatcher(event), mock_futures) for event in events
+        ]
+
+        for cache_key in cache_keys:
+            assert event_processing_store.get(cache_key) is None
+        assert _get_coalesced_events(group_id) == []
+
+    @patch("sentry.tasks.post_process.handle_owner_assignment")
+    @patch("sentry.rules.processor.RuleProcessor")
+    def test_batch_overlapping(self, mock_processor, mock_handle_owner_assignment):
+        events, cache_keys = self.store_events(3)
+        group_id = events[0].group_id
+        mock_processor.return_value.apply.return_value = []
+
+        with patch("sentry.tasks.post_process.post_process_group_batch.apply_async"):
+            self.coalesce(group_id, cache_keys[:2])
+
+        def overlap(*args, **kwargs):
+            # Another event arrives and a second task runs while the first
+            # task post-processes its events.
+            if mock_processor.call_count == 1:
+                self.coalesce(group_id, cache_keys[2:])
+                post_process_group_batch(group_id=group_id)
+            return mock_processor.return_value
+
+        mock_processor.side_effect = overlap
+
+        with patch(
+            "sentry.tasks.post_process.post_process_group_batch.apply_async"
+        ) as mock_apply_async, patch("sentry.similarity.record"):
+            post_process_group_batch(group_id=group_id)
+
+        # The second task leaves the events to the first one, which leaves the
+        # event that arrived in the meantime to a follow-up task.
+        assert mock_processor.call_count == 2
+        mock_apply_async.assert_called_once_with(kwargs={"group_id": group_id}, countdown=0)
+        assert [entry["cache_key"] for entry in _get_coalesced_events(group_id)] == cache_keys[2:]
+
+        with patch("sentry.similarity.record"):
+            post_process_group_batch(group_id=group_id)
+        assert mock_processor.call_count == 3
+        assert _get_coalesced_events(group_id) == []
+
+    @patch("sentry.rules.processor.RuleProcessor")
+    def test_batch_empty(self, mock_processor):
+        post_process_group_batch(group_id=self.group.id)
+        assert mock_processor.call_count == 0
@@ -6,12 +6,15 @@ from sentry.utils.compat import mock
 from time import time
 
 from sentry import quotas
-from sentry.event_manager import EventManager, HashDiscarded
+from sentry.event_manager import EventManager, HashDiscarded, SaveManyError
+from sentry.models import Group
 from sentry.plugins.base.v2 import Plugin2
 from sentry.tasks.store import (
+    batch_save_events,
     preprocess_event,
     process_event,
     save_event,
+    save_event_many,
     symbolicate_event,
     time_synthetic_monitoring_event,
 )
@@ -50,6 +53,12 @@ def mock_save_event():
         yield m
 
 
+@pytest.fixture
+def mock_save_event_many():
+    with mock.patch("sentry.tasks.store.save_event_many") as m:
+        yield m
+
+
 @pytest.fixture
 def mock_process_event():
     with mock.patch("sentry.tasks.store.process_event") as m:
@@ -190,6 +199,96 @@ def test_move_to_save_event(
     assert mock_save_event.delay.call_count == 1
 
 
+@pytest.mark.django_db
+def test_move_to_save_event_batched(
+    default_project, mock_save_event, mock_save_event_many, register_plugin
+):
+    register_plugin(globals(), BasicPreprocessorPlugin)
+
+    with batch_save_events():
+        for event_id in ("a" * 32, "b" * 32):
+            preprocess_event(
+                data={
+                    "project": default_project.id,
+                    "platform": "NOTMATTLANG",
+                    "logentry": {"formatted": "test"},
+                    "event_id": event_id,
+                }
+            )
+
+        assert mock_save_event_many.delay.call_count == 0
+
+    assert mock_save_event.delay.call_count == 0
+    ((_, _, kwargs),) = mock_save_event_many.delay.mock_calls
+    assert [event["event_id"] for event in kwargs["events"]] == ["a" * 32, "b" * 32]
+
+
+def _make_save_event_many_events(project):
+    return [
+        {
+            "data": {
+                "project": project.id,
+                "platform": "python",
+                "message": message,
+                "event_id": event_id,
+            },
+            "start_time": time(),
+            "project_id": project.id,
+        }
+        for event_id, message in (("a" * 32, "foo"), ("b" * 32, "bar"))
+    ]
+
+
+@pytest.mark.django_db
+def test_save_event_many(default_project):
+    save_event_many(events=_make_save_event_many_events(default_project))
+
+    from sentry import eventstore
+
+    event_a = eventstore.get_event_by_id(default_project.id, "a" * 32)
+    event_b = eventstore.get_event_by_id(default_project.id, "b" * 32)
+    assert event_a.group_id != event_b.group_id
+
+
+@pytest.mark.django_db
+def test_save_event_many_failure(default_project):
+    save = EventManager.save
+
+    def save_or_fail(self, *args, **kwargs):
+        if self._data["event_id"] == "b" * 32:
+            raise ValueError("bad event")
+        return save(self, *args, **kwargs)
+
+    # When the batch fails, the unsaved events are saved one by one and only
+    # the bad event is lost.
+    with mock.patch.object(
+        EventManager, "save_many", side_effect=SaveManyError([0, 1])
+    ), mock.patch.object(EventManager, "save", save_or_fail):
+        with pytest.raises(ValueError, match="bad event"):
+            save_event_many(events=_make_save_event_many_events(default_project))
+
+    from sentry import eventstore
+
+    assert eventstore.get_event_by_id(default_project.id, "a" * 32) is not None
+    assert eventstore.get_event_by_id(default_project.id, "b" * 32) is None
+
+
+@pytest.mark.django_db
+def test_save_event_many_failure_after_side_effects(default_project):
+    # Events that fail after they have been counted and inserted into the
+    # eventstream are not saved again.
+    with mock.patch(
+        "sentry.event_manager._track_outcome_accepted_many", side_effect=ValueError("bad batch")
+    ), mock.patch("sentry.event_manager.eventstream.insert") as eventstream_insert:
+        with pytest.raises(SaveManyError):
+            save_event_many(events=_make_save_event_many_events(default_project))
+
+    assert eventstream_insert.call_count == 2
+    groups = Group.objects.filter(project=default_project)
+    assert len(groups) == 2
+    assert all(group.times_seen == 1 for group in groups)
+
+
 @pytest.mark.django_db
 def test_process_event_mutate_and_save(
     default_project, mock_event_processing_store, mock_save_event, register_plugin
@@ -814,3 +814,35 @@ class RedisTSDBTest(TestCase):
             [b"eta", b"7"],
             [b"bar", b"7"],
         ]
+
+
+class RedisTSDBWriteScriptTest(RedisTSDBTest):
+    def setUp(self):
+        self.db = RedisTSDB(
+            rollups=(
+                # time in seconds, samples to keep
+                (10, 30),  # 5 minutes at 10 seconds
+                (ONE_MINUTE, 120),  # 2 hours at 1 minute
+                (ONE_HOUR, 24),  # 1 days at 1 hour
+                (ONE_DAY, 30),  # 30 days at 1 day
+            ),
+            vnodes=64,
+            enable_frequency_sketches=True,
+            enable_write_scripts=True,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+        )
+
+    def test_write_script_sets_expiry(self):
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        self.db.incr(TSDBModel.project, 1, now)
+        self.db.record(TSDBModel.users_affected_by_group, 1, ("foo",), now)
+
+        hash_key, _ = self.db.make_counter_key(TSDBModel.project, ONE_HOUR, now, 1, None)
+        key = self.db.make_key(
+            TSDBModel.users_affected_by_group, ONE_HOUR, int(to_timestamp(now)), 1, None
+        )
+        with self.db.cluster.map() as client:
+            counter_ttl = client.ttl(hash_key)
+            hll_ttl = client.ttl(key)
+        assert 0 < counter_ttl.value <= ONE_HOUR * 25
+        assert 0 < hll_ttl.value <= ONE_HOUR * 25
@@ -12,6 +12,7 @@ def get_callargs(model):
         "models": [model],
         "items": [(model, "key", ["values"])],
         "requests": [(model, "data")],
+        "queries": [("get_sums", model, "key", None, None, None)],
     }
 
 
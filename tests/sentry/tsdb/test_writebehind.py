@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+import pytz
+from celery.signals import worker_process_shutdown
+
+from sentry.tsdb.base import TSDBModel
+from sentry.tsdb.writebehind import WriteBehindTSDB
+from sentry.utils.compat import mock
+
+
+def make_backend():
+    backend = mock.Mock()
+    backend.get_rollups.return_value = {10: 360, 3600: 24 * 7}
+    return backend
+
+
+def test_merges_writes():
+    backend = make_backend()
+    writer = WriteBehindTSDB(backend)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    writer._write(
+        [
+            ("incr_multi", ([(TSDBModel.group, 1), (TSDBModel.project, 2)], now, 1, 3)),
+            ("incr_multi", ([(TSDBModel.group, 1)], now, 1, 3)),
+            ("record_multi", ([(TSDBModel.users_affected_by_group, 1, ("foo",))], now, 3)),
+            ("record_multi", ([(TSDBModel.users_affected_by_group, 1, ("bar",))], now, 3)),
+            (
+                "record_frequency_multi",
+                ([(TSDBModel.frequent_environments_by_group, {1: {3: 1}})], now, None),
+            ),
+            (
+                "record_frequency_multi",
+                ([(TSDBModel.frequent_environments_by_group, {1: {3: 1}})], now, None),
+            ),
+        ]
+    )
+
+    backend.incr_multi.assert_called_once_with(
+        [
+            (TSDBModel.group, 1, {"timestamp": now, "count": 2}),
+            (TSDBModel.project, 2, {"timestamp": now, "count": 1}),
+        ],
+        environment_id=3,
+    )
+    backend.record_multi.assert_called_once_with(
+        [(TSDBModel.users_affected_by_group, 1, {"foo", "bar"})], timestamp=now, environment_id=3
+    )
+    backend.record_frequency_multi.assert_called_once_with(
+        [(TSDBModel.frequent_environments_by_group, {1: {3: 2}})],
+        timestamp=now,
+        environment_id=None,
+    )
+
+
+def test_flush_applies_pending_writes():
+    backend = make_backend()
+    writer = WriteBehindTSDB(backend)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    for _ in range(5):
+        writer.incr_multi([(TSDBModel.project, 1)], timestamp=now)
+    writer.flush()
+
+    counts = sum(items[0][2]["count"] for (items,), kwargs in backend.incr_multi.call_args_list)
+    assert counts == 5
+
+
+def test_full_queue_writes_synchronously():
+    backend = make_backend()
+    writer = WriteBehindTSDB(backend, max_queue_size=1)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    with mock.patch.object(writer, "_run"):
+        writer.incr_multi([(TSDBModel.project, 1)], timestamp=now)
+        writer.incr_multi([(TSDBModel.project, 1)], timestamp=now)
+
+    backend.incr_multi.assert_called_once_with(
+        [(TSDBModel.project, 1, {"timestamp": now, "count": 1})], environment_id=None
+    )
+
+
+def test_merges_writes_of_the_same_bucket():
+    backend = make_backend()
+    writer = WriteBehindTSDB(backend)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    writer._write(
+        [
+            ("incr_multi", ([(TSDBModel.project, 1)], now + timedelta(seconds=1), 1, None)),
+            ("incr_multi", ([(TSDBModel.project, 1)], now + timedelta(seconds=9.5), 1, None)),
+            ("incr_multi", ([(TSDBModel.project, 1)], now + timedelta(seconds=10), 1, None)),
+            ("record_multi", ([(TSDBModel.users_affected_by_project, 1, ("foo",))], now, None)),
+            (
+                "record_multi",
+                (
+                    [(TSDBModel.users_affected_by_project, 1, ("bar",))],
+                    now + timedelta(seconds=5),
+                    None,
+                ),
+            ),
+        ]
+    )
+
+    backend.incr_multi.assert_called_once_with(
+        [
+            (TSDBModel.project, 1, {"timestamp": now, "count": 2}),
+            (TSDBModel.project, 1, {"timestamp": now + timedelta(seconds=10), "count": 1}),
+        ],
+        environment_id=None,
+    )
+    backend.record_multi.assert_called_once_with(
+        [(TSDBModel.users_affected_by_project, 1, {"foo", "bar"})],
+        timestamp=now,
+        environment_id=None,
+    )
+
+
+def test_retries_failed_writes():
+    backend = make_backend()
+    backend.incr_multi.side_effect = Exception("boom")
+    backend.record_multi.side_effect = [Exception("boom"), None]
+    writer = WriteBehindTSDB(backend)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    writer._write(
+        [
+            ("incr_multi", ([(TSDBModel.project, 1)], now, 1, None)),
+            ("record_multi", ([(TSDBModel.users_affected_by_project, 1, ("foo",))], now, None)),
+        ]
+    )
+
+    # Counters may have been written in part, so only records are retried.
+    assert backend.incr_multi.call_count == 1
+    assert backend.record_multi.call_count == 2
+
+
+def test_flush_on_worker_shutdown():
+    backend = make_backend()
+    writer = WriteBehindTSDB(backend)
+    now = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    writer.incr_multi([(TSDBModel.project, 1)], timestamp=now)
+    worker_process_shutdown.send(sender=None, pid=None, exitcode=0)
+
+    backend.incr_multi.assert_called_once_with(
+        [(TSDBModel.project, 1, {"timestamp": now, "count": 1})], environment_id=None
+    )
@@ -8,6 +8,7 @@ from sentry.tsdb.base import TSDBModel
 from sentry.tsdb.snuba import SnubaTSDB
 from sentry.testutils import TestCase, SnubaTestCase
 from sentry.testutils.helpers.datetime import iso_format
+from sentry.utils import snuba
 from sentry.utils.dates import to_timestamp
 
 
@@ -166,6 +167,53 @@ class SnubaTSDBTest(TestCase, SnubaTestCase):
 
         assert self.db.get_range(TSDBModel.group, [], dts[0], dts[-1], rollup=3600) == {}
 
+    def test_sums(self):
+        dts = [self.now + timedelta(hours=i) for i in range(4)]
+        assert (
+            self.db.get_sums(
+                TSDBModel.group,
+                [self.proj1group1.id, self.proj1group2.id],
+                dts[0],
+                dts[-1],
+                rollup=3600,
+            )
+            == {self.proj1group1.id: 12, self.proj1group2.id: 12}
+        )
+
+        assert self.db.get_sums(
+            TSDBModel.project, [self.proj1.id], dts[0], dts[-1], rollup=3600
+        ) == {self.proj1.id: 24}
+
+        assert self.db.get_sums(TSDBModel.group, [], dts[0], dts[-1], rollup=3600) == {}
+
+    def test_totals_multi(self):
+        start = self.now
+        end = self.now + timedelta(hours=4)
+        queries = [
+            ("get_sums", TSDBModel.group, self.proj1group1.id, start, end, None),
+            ("get_sums", TSDBModel.project, self.proj1.id, start, end, None),
+            (
+                "get_distinct_counts_totals",
+                TSDBModel.users_affected_by_group,
+                self.proj1group1.id,
+                start,
+                end,
+                None,
+            ),
+            ("get_sums", TSDBModel.group, self.proj1group2.id, start, end, self.env1.id),
+        ]
+
+        with patch("sentry.utils.snuba.bulk_raw_query", wraps=snuba.bulk_raw_query) as query:
+            results = self.db.get_totals_multi(queries)
+        assert query.call_count == 1
+        assert len(query.call_args[0][0]) == 4
+
+        assert results == [
+            getattr(self.db, method)(model, [key], start, end, environment_id=environment_id)[key]
+            for method, model, key, start, end, environment_id in queries
+        ]
+        assert self.db.get_totals_multi([]) == []
+
     def test_range_releases(self):
         dts = [self.now + timedelta(hours=i) for i in range(4)]
         assert self.db.get_range(